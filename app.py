@@ -1,38 +1,88 @@
 from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Form
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import pandas as pd
 import json
 import os
 import asyncio
+import threading
+import time
+from collections import namedtuple
+from contextlib import asynccontextmanager
 from typing import Optional, List, Dict, Any
-from utilities.agents import get_pandas_code
+from utilities.agents import get_pandas_code, model_tier, escalation_reason, record_tier_outcome, tier_stats
 from utilities.code_execution import capture_exec_output
 from utilities.code_processing import clean_pandas_code, modify_dataset_paths
-from utilities.data_loading import read_dataset
-from utilities.data_preprocessing import preprocess_dataset, save_preprocessed_dataset
-from utilities.mysql_handler import MySQLHandler
+from utilities.data_loading import read_dataset, remove_shared_dataset
+from utilities.data_preprocessing import preprocess_dataset, save_preprocessed_dataset, ensure_dataset_sample
+from utilities.question_processing import execute_with_repair
+from utilities.question_templates import template_code, learn_template, fast_path_stats
+from utilities.mysql_handler import MySQLHandler, AsyncMySQLHandler, shutdown_mysql_executor
+from utilities.caching import SQLResultCache, SingleFlight
+from utilities.duckdb_handler import DuckDBHandler, supports_file as duckdb_supports_file
 from utilities.sql_agents import generate_sql_query, generate_multi_table_sql_query
+from utilities.dataset_catalog import get_catalog, SAMPLE_FOLDER
+from utilities.metrics import register_stats, increment, snapshot as metrics_snapshot, prometheus_text
+from utilities.metrics import observe, record_retries, timed, track_timings, DEBUG_TIMINGS
+from utilities.llm import track_usage
 from dotenv import load_dotenv, set_key
 from pathlib import Path
-from sqlalchemy import text
 import datetime
 import numpy as np
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="Easy-QA Dataset Question Answering", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Stop the MySQL thread pool when the application shuts down."""
+    yield
+    # Let MySQL calls still running finish before the process exits
+    shutdown_mysql_executor()
+
+app = FastAPI(title="Easy-QA Dataset Question Answering", version="1.0.0", lifespan=lifespan)
 
 # Mount static files and templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
+# Cache for generated SQL results, invalidated when the tables they read change
+sql_result_cache = SQLResultCache(
+    max_entries=int(os.getenv("SQL_CACHE_MAX_ENTRIES", "256")),
+    max_age=float(os.getenv("SQL_CACHE_MAX_AGE", "5")),
+    stale_while_revalidate=os.getenv("SQL_CACHE_STALE_WHILE_REVALIDATE", "false").lower() == "true",
+    handler_factory=MySQLHandler
+)
+register_stats('sql_result_cache', sql_result_cache.stats)
+register_stats('dataset_cache', get_catalog("datasets/").stats)
+register_stats('llm_tiers', tier_stats)
+register_stats('template_fast_path', fast_path_stats)
+
+# Concurrent identical questions share one generation and execution
+REQUEST_COALESCING = os.getenv("REQUEST_COALESCING", "true").lower() == "true"
+question_flights = SingleFlight()
+register_stats('request_coalescing', question_flights.stats)
+
+# Dataset files larger than this are answered with SQL run in DuckDB instead of pandas code
+DUCKDB_AUTO_THRESHOLD_MB = float(os.getenv("DUCKDB_AUTO_THRESHOLD_MB", "100"))
+EXECUTION_ENGINES = ["pandas", "duckdb"]
+
+# How pandas code is generated: one candidate per attempt (sequential), several raced in
+# parallel with the first that runs winning (speculative), or a majority vote over the
+# candidates that run (vote)
+GENERATION_MODES = ["sequential", "speculative", "vote"]
+GENERATION_MODE = os.getenv("GENERATION_MODE", "sequential").lower()
+SPECULATIVE_CANDIDATES = int(os.getenv("SPECULATIVE_CANDIDATES", "3"))
+SPECULATIVE_TEMPERATURES = [float(t) for t in os.getenv("SPECULATIVE_TEMPERATURES", "0,0.4,0.8").split(",") if t.strip()]
+
 class QuestionRequest(BaseModel):
     question: str
     dataset: str
+    engine: Optional[str] = None  # "pandas" or "duckdb"; chosen by file size when not given
+    debug: bool = False  # include the per-stage timing breakdown (always included with DEBUG_TIMINGS)
 
 class MySQLQuestionRequest(BaseModel):
     question: str
@@ -50,6 +100,7 @@ class QuestionResponse(BaseModel):
     dataset_used: str
     success: bool
     error_message: Optional[str] = None
+    timings: Optional[Dict[str, Any]] = None
 
 class Settings(BaseModel):
     api_key: str
@@ -76,6 +127,29 @@ def get_available_datasets():
                 datasets.append(dataset_name)
     return sorted(set(datasets))
 
+def find_dataset_file(dataset_name: str) -> Optional[str]:
+    """Return the path of the dataset file with any supported extension, or None."""
+    datasets_path = "datasets"
+    supported_extensions = ['.parquet', '.csv', '.json', '.xlsx']
+    
+    for ext in supported_extensions:
+        potential_file = f"{datasets_path}/{dataset_name}{ext}"
+        if os.path.exists(potential_file):
+            return potential_file
+    return None
+
+def choose_engine(dataset_name: str, requested_engine: Optional[str] = None) -> str:
+    """Pick the engine for a dataset question: the requested one, or DuckDB for large files."""
+    if requested_engine:
+        return requested_engine
+    
+    dataset_file = find_dataset_file(dataset_name)
+    if (dataset_file and duckdb_supports_file(dataset_file)
+            and os.path.getsize(dataset_file) > DUCKDB_AUTO_THRESHOLD_MB * 1024 * 1024):
+        return "duckdb"
+    return "pandas"
+
+@timed('schema_generation')
 def generate_schema_for_dataset(dataset_name: str) -> str:
     """Generate schema summary for a dataset."""
     try:
@@ -135,42 +209,99 @@ def generate_schema_for_dataset(dataset_name: str) -> str:
     except Exception as e:
         return f"Error generating schema for {dataset_name}: {str(e)}"
 
-async def process_question_async(question: str, dataset: str, max_retries: int = 2) -> QuestionResponse:
+async def process_question_async(question: str, dataset: str, max_retries: int = 2, mode: Optional[str] = None) -> QuestionResponse:
+    """Process a question with the configured generation mode, recording its latency and token cost."""
+    mode = mode or GENERATION_MODE
+    if mode not in GENERATION_MODES:
+        mode = "sequential"
+    
+    start = time.perf_counter()
+    # Token counters are updated per call, including calls of losing speculative
+    # candidates that only finish after the question is answered
+    with track_usage(metrics_prefix=f"generation.{mode}"):
+        response = await answer_from_template(question, dataset)
+        if response is not None:
+            mode = "template"
+        elif mode == "sequential":
+            response = await process_question_sequential(question, dataset, max_retries)
+        else:
+            response = await process_question_speculative(question, dataset, max_retries, vote=(mode == "vote"))
+    
+    increment(f"generation.{mode}.questions")
+    increment(f"generation.{mode}.successes", int(response.success))
+    increment(f"generation.{mode}.latency_seconds", time.perf_counter() - start)
+    observe("question_seconds", time.perf_counter() - start, {"mode": mode})
+    return response
+
+async def answer_from_template(question: str, dataset: str) -> Optional[QuestionResponse]:
+    """Answer a simple question with code from a question template, without the LLM (None if it does not match or fails)."""
+    code = await run_in_threadpool(template_code, question, dataset, "datasets/")
+    if code is None:
+        return None
+    code, modified_code, result = await run_in_threadpool(execute_with_repair, code, dataset, "datasets/")
+    if isinstance(result, str) and result.startswith("Error :"):
+        increment("fast_path.failures")
+        return None
+    increment("fast_path.hits")
+    return QuestionResponse(
+        answer=str(result),
+        generated_code=modified_code,
+        dataset_used=dataset,
+        success=True
+    )
+
+def error_code_argument(error_history: List[tuple]):
+    """Return the error_code argument for get_pandas_code from the failed attempts so far."""
+    if not error_history:
+        return None
+    if len(error_history) == 1:
+        return error_history[0]  # Single tuple
+    return error_history  # List of tuples
+
+async def process_question_sequential(question: str, dataset: str, max_retries: int = 2) -> QuestionResponse:
     """Process a question asynchronously with retry logic."""
+    retries, retry_start = 0, None
     try:
-        # Generate schema for the dataset
-        schema = generate_schema_for_dataset(dataset)
+        # Generate schema for the dataset (blocking work runs in the thread pool so the
+        # event loop keeps serving other requests while this one waits on the LLM)
+        schema = await run_in_threadpool(generate_schema_for_dataset, dataset)
         
         error_history = []
         
         for attempt in range(max_retries + 1):
+            if attempt:
+                retries += 1
+                retry_start = retry_start or time.perf_counter()
             try:
-                # Determine if this is an error retry
-                error_code = None
-                if error_history:
-                    if len(error_history) == 1:
-                        error_code = error_history[0]  # Single tuple
-                    else:
-                        error_code = error_history  # List of tuples
+                # Determine if this is an error retry, and which model tier answers it
+                error_code = error_code_argument(error_history)
+                tier = model_tier(error_code)
                 
                 # Generate pandas code using LLM
-                generated_code = get_pandas_code(
+                generated_code = await run_in_threadpool(
+                    get_pandas_code,
                     dataset_name=dataset,
                     question=question,
                     schema=schema,
                     temperature=0,
-                    error_code=error_code
+                    error_code=error_code,
+                    tier=tier
                 )
                 
-                # Clean and modify the code
+                # Clean the code, validate it on the dataset sample, then execute it on the
+                # full dataset (trivial failures are repaired locally)
                 cleaned_code = clean_pandas_code(generated_code)
-                modified_code = modify_dataset_paths(cleaned_code, dataset_folder_path="datasets/")
-                
-                # Execute the code
-                result = capture_exec_output(modified_code)
+                cleaned_code, modified_code, result = await run_in_threadpool(execute_with_repair, cleaned_code, dataset, "datasets/")
+                if not (isinstance(result, str) and result.startswith("Error :")):
+                    # Empty answers from the fast model are retried on the reasoning model
+                    reason = escalation_reason(tier, result) if attempt < max_retries else None
+                    if reason is not None:
+                        result = "Error :" + reason
                 
                 # Check if execution was successful
-                if isinstance(result, str) and result.startswith("Error :"):
+                failed = isinstance(result, str) and result.startswith("Error :")
+                record_tier_outcome(tier, not failed)
+                if failed:
                     error_msg = result[7:]  # Remove "Error :" prefix
                     error_history.append((cleaned_code, error_msg))
                     if attempt == max_retries:
@@ -183,7 +314,8 @@ async def process_question_async(question: str, dataset: str, max_retries: int =
                         )
                     continue
                 
-                # Success!
+                # Success! Questions like this one can now be answered from a template
+                learn_template(question, dataset, cleaned_code)
                 return QuestionResponse(
                     answer=str(result),
                     generated_code=modified_code,
@@ -193,6 +325,7 @@ async def process_question_async(question: str, dataset: str, max_retries: int =
                 
             except Exception as e:
                 error_msg = str(e)
+                record_tier_outcome(tier, False)
                 if attempt < max_retries:
                     error_history.append((generated_code if 'generated_code' in locals() else "", error_msg))
                     continue
@@ -213,6 +346,185 @@ async def process_question_async(question: str, dataset: str, max_retries: int =
             success=False,
             error_message=f"Unexpected error: {str(e)}"
         )
+    finally:
+        record_retries(retries, retry_start)
+
+Candidate = namedtuple("Candidate", ["cleaned_code", "modified_code", "result"])
+
+def run_candidate(question: str, dataset: str, schema: str, temperature: float, error_code, cancelled: threading.Event,
+                  final: bool = False) -> Candidate:
+    """
+    Generate one pandas code candidate and run it (on the sample, then the full dataset).
+
+    Candidates that lose the race cannot be interrupted mid-call, so cancelled is
+    checked once the code arrives and a cancelled candidate skips execution (result None).
+    Unless final, empty answers from the fast model tier count as failures.
+    """
+    tier = model_tier(error_code)
+    generated_code = get_pandas_code(
+        dataset_name=dataset,
+        question=question,
+        schema=schema,
+        temperature=temperature,
+        error_code=error_code,
+        tier=tier
+    )
+    cleaned_code = clean_pandas_code(generated_code)
+    if cancelled.is_set():
+        return Candidate(cleaned_code, "", None)
+    
+    cleaned_code, modified_code, result = execute_with_repair(cleaned_code, dataset, "datasets/")
+    failed = isinstance(result, str) and result.startswith("Error :")
+    reason = None if final or failed else escalation_reason(tier, result)
+    if reason is not None:
+        result, failed = "Error :" + reason, True
+    record_tier_outcome(tier, not failed)
+    return Candidate(cleaned_code, modified_code, result)
+
+def majority_candidate(candidates: List[Candidate]) -> Candidate:
+    """Return the candidate whose answer most candidates agree on (ties go to the earliest)."""
+    votes = {}
+    for candidate in candidates:
+        votes.setdefault(str(candidate.result), []).append(candidate)
+    return max(votes.values(), key=len)[0]
+
+async def process_question_speculative(question: str, dataset: str, max_retries: int = 2, vote: bool = False) -> QuestionResponse:
+    """
+    Process a question by racing several code candidates per attempt.
+
+    Each attempt generates SPECULATIVE_CANDIDATES candidates in parallel at varied
+    temperatures and runs each as soon as it arrives. The first candidate that runs
+    successfully answers the question and the others are cancelled; with vote, every
+    candidate is awaited and the answer most of them agree on wins. When every
+    candidate fails, their errors are fed back into the next attempt.
+    """
+    retries, retry_start = 0, None
+    try:
+        schema = await run_in_threadpool(generate_schema_for_dataset, dataset)
+        temperatures = SPECULATIVE_TEMPERATURES or [0.0]
+        error_history = []
+        last_code = ""
+        last_error = ""
+        
+        for attempt in range(max_retries + 1):
+            if attempt:
+                retries += 1
+                retry_start = retry_start or time.perf_counter()
+            error_code = error_code_argument(error_history)
+            cancelled = threading.Event()
+            tasks = [
+                asyncio.ensure_future(run_in_threadpool(
+                    run_candidate, question, dataset, schema,
+                    temperatures[i % len(temperatures)], error_code, cancelled, attempt == max_retries
+                ))
+                for i in range(max(1, SPECULATIVE_CANDIDATES))
+            ]
+            increment("generation.candidates", len(tasks))
+            
+            successes = []
+            failures = []
+            pending = set(tasks)
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in sorted(done, key=tasks.index):
+                        try:
+                            candidate = task.result()
+                        except Exception as e:
+                            failures.append(("", str(e)))
+                            continue
+                        if isinstance(candidate.result, str) and candidate.result.startswith("Error :"):
+                            failures.append((candidate.cleaned_code, candidate.result[7:]))
+                            last_code = candidate.modified_code
+                        elif candidate.result is not None:
+                            successes.append(candidate)
+                    if successes and not vote:
+                        break
+            finally:
+                # Losing candidates stop before execution; their LLM calls still finish
+                cancelled.set()
+                for task in pending:
+                    task.cancel()
+                increment("generation.candidates_cancelled", len(pending))
+            
+            if successes:
+                winner = majority_candidate(successes) if vote else successes[0]
+                return QuestionResponse(
+                    answer=str(winner.result),
+                    generated_code=winner.modified_code,
+                    dataset_used=dataset,
+                    success=True
+                )
+            
+            # Feed each distinct failure back once
+            for failure in failures:
+                if failure not in error_history:
+                    error_history.append(failure)
+            if failures:
+                last_error = failures[-1][1]
+        
+        return QuestionResponse(
+            answer="",
+            generated_code=last_code,
+            dataset_used=dataset,
+            success=False,
+            error_message=f"Failed after {max_retries + 1} attempts. Last error: {last_error}"
+        )
+    
+    except Exception as e:
+        return QuestionResponse(
+            answer="",
+            generated_code="",
+            dataset_used=dataset,
+            success=False,
+            error_message=f"Unexpected error: {str(e)}"
+        )
+    finally:
+        record_retries(retries, retry_start)
+
+async def process_question_duckdb(question: str, dataset: str) -> QuestionResponse:
+    """Answer a question about a dataset file with SQL from the SQL agent, run in DuckDB over the file."""
+    sql_code = ""
+    duckdb_handler = None
+    try:
+        duckdb_handler = DuckDBHandler(dataset, find_dataset_file(dataset))
+        
+        # Get table schema for context
+        schema = await run_in_threadpool(duckdb_handler.get_table_schema)
+        
+        # Generate SQL query using the dedicated SQL agent
+        sql_code = await run_in_threadpool(
+            generate_sql_query,
+            question=question,
+            database_name="datasets",
+            table_name=dataset,
+            table_schema=schema,
+            dialect="DuckDB"
+        )
+        
+        # Execute the SQL query directly over the dataset file
+        df = await run_in_threadpool(duckdb_handler.execute_query, sql_code)
+        
+        # Format the result like pandas structured output
+        structured_answer = format_mysql_result_structured(df, question)
+        
+        return QuestionResponse(
+            answer=str(structured_answer),
+            generated_code=sql_code,
+            dataset_used=dataset,
+            success=True
+        )
+    except Exception as e:
+        return QuestionResponse(
+            answer="",
+            generated_code=sql_code,
+            dataset_used=dataset,
+            success=False,
+            error_message=f"DuckDB engine failed: {str(e)}"
+        )
+    finally:
+        if duckdb_handler:
+            duckdb_handler.close_connection()
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
@@ -233,6 +545,16 @@ async def get_datasets():
     """API endpoint to get available datasets."""
     return {"datasets": get_available_datasets()}
 
+def normalize_question(question: str) -> str:
+    """Normalize a question for request coalescing (whitespace does not matter; case may, in values)."""
+    return " ".join(question.split())
+
+async def coalesced(key: tuple, factory):
+    """Run factory() once for concurrent requests with the same key (see REQUEST_COALESCING)."""
+    if not REQUEST_COALESCING:
+        return await factory()
+    return await question_flights.run(key, factory)
+
 @app.post("/api/ask", response_model=QuestionResponse)
 async def ask_question(question_request: QuestionRequest):
     """API endpoint to process a question."""
@@ -247,6 +569,35 @@ async def ask_question(question_request: QuestionRequest):
     if question_request.dataset not in available_datasets:
         raise HTTPException(status_code=400, detail=f"Dataset '{question_request.dataset}' not found")
     
+    if question_request.engine and question_request.engine not in EXECUTION_ENGINES:
+        raise HTTPException(status_code=400, detail=f"Engine must be one of: {', '.join(EXECUTION_ENGINES)}")
+    
+    engine = choose_engine(question_request.dataset, question_request.engine)
+    if engine == "duckdb" and not duckdb_supports_file(find_dataset_file(question_request.dataset)):
+        raise HTTPException(status_code=400, detail="The DuckDB engine does not support Excel datasets")
+    
+    key = ("ask", question_request.dataset, engine, question_request.engine, normalize_question(question_request.question))
+    response = await coalesced(key, lambda: timed_answer(question_request, engine))
+    if not (DEBUG_TIMINGS or question_request.debug):
+        response = response.model_copy(update={"timings": None})
+    return response
+
+async def timed_answer(question_request: QuestionRequest, engine: str) -> QuestionResponse:
+    """Answer a validated /api/ask request, attaching its per-stage timings and token usage."""
+    start = time.perf_counter()
+    with track_usage() as usage, track_timings() as timings:
+        response = await answer_question(question_request, engine)
+    response.timings = dict(timings.as_dict(), total_seconds=round(time.perf_counter() - start, 6), tokens=usage.as_dict())
+    return response
+
+async def answer_question(question_request: QuestionRequest, engine: str) -> QuestionResponse:
+    """Answer a validated /api/ask request with the chosen engine."""
+    if engine == "duckdb":
+        response = await process_question_duckdb(question_request.question, question_request.dataset)
+        # Questions routed to DuckDB automatically fall back to pandas code on failure
+        if response.success or question_request.engine:
+            return response
+    
     # Process the question
     response = await process_question_async(
         question_request.question, 
@@ -300,14 +651,24 @@ async def execute_code(code_data: dict):
         raw_code = code_data.get('code', '')
         cleaned_code = clean_pandas_code(raw_code)
         
-        # Modify the dataset paths and execute the code
-        modified_code = modify_dataset_paths(cleaned_code, dataset_folder_path="datasets/")
-        result = capture_exec_output(modified_code)
+        # Modify the dataset paths and execute the code (off the event loop: both read datasets)
+        modified_code = await run_in_threadpool(modify_dataset_paths, cleaned_code, dataset_folder_path="datasets/")
+        result = await run_in_threadpool(capture_exec_output, modified_code)
         
         return {"result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """Return counters and cache statistics."""
+    return metrics_snapshot()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    """Return every metric in the Prometheus text format."""
+    return PlainTextResponse(prometheus_text(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/settings")
 async def get_settings():
     """Get current settings from .env file."""
@@ -408,13 +769,19 @@ async def upload_dataset(file: UploadFile = File(...), dataset_name: str = Form(
         
         try:
             # Read the dataset
-            df = read_dataset(temp_file_path)
+            df = read_dataset(temp_file_path, shared=False)
             
             # Preprocess the dataset
             preprocessed_df = preprocess_dataset(df)
             
             # Save the preprocessed dataset
             output_path = save_preprocessed_dataset(preprocessed_df, final_name)
+
+            # Build the sample used to validate generated code (created lazily if this fails)
+            try:
+                ensure_dataset_sample(final_name, "datasets")
+            except Exception:
+                pass
             
             # Get basic dataset info
             row_count = len(preprocessed_df)
@@ -457,8 +824,12 @@ async def delete_dataset(dataset_name: str):
         if not dataset_file:
             raise HTTPException(status_code=404, detail=f"Dataset '{dataset_name}' not found")
         
-        # Delete the file
+        # Delete the file, its sample and its shared-memory copy
         os.remove(dataset_file)
+        sample_file = os.path.join(datasets_path, SAMPLE_FOLDER, f"{dataset_name}.parquet")
+        if os.path.exists(sample_file):
+            os.remove(sample_file)
+        remove_shared_dataset(dataset_file)
         
         return {"success": True, "message": f"Dataset '{dataset_name}' deleted successfully"}
     
@@ -561,8 +932,8 @@ async def view_dataset(request: Request, dataset_name: str, page: int = 1, per_p
 async def test_mysql_connection():
     """Test MySQL connection."""
     try:
-        mysql_handler = MySQLHandler()
-        success, message = mysql_handler.test_connection()
+        mysql_handler = AsyncMySQLHandler()
+        success, message = await mysql_handler.test_connection()
         return {"success": success, "message": message}
     except Exception as e:
         return {"success": False, "message": f"Connection test failed: {str(e)}"}
@@ -571,8 +942,8 @@ async def test_mysql_connection():
 async def get_mysql_databases():
     """Get list of available MySQL databases."""
     try:
-        mysql_handler = MySQLHandler()
-        databases = mysql_handler.get_databases()
+        mysql_handler = AsyncMySQLHandler()
+        databases = await mysql_handler.get_databases()
         return {"success": True, "databases": databases}
     except Exception as e:
         return {"success": False, "message": str(e), "databases": []}
@@ -581,8 +952,8 @@ async def get_mysql_databases():
 async def get_mysql_tables(database_name: str):
     """Get list of tables in a specific database."""
     try:
-        mysql_handler = MySQLHandler()
-        tables = mysql_handler.get_tables(database_name)
+        mysql_handler = AsyncMySQLHandler()
+        tables = await mysql_handler.get_tables(database_name)
         return {"success": True, "tables": tables}
     except Exception as e:
         return {"success": False, "message": str(e), "tables": []}
@@ -591,8 +962,8 @@ async def get_mysql_tables(database_name: str):
 async def get_mysql_table_schema(database_name: str, table_name: str):
     """Get detailed schema for a specific table."""
     try:
-        mysql_handler = MySQLHandler()
-        schema = mysql_handler.get_table_schema(table_name, database_name)
+        mysql_handler = AsyncMySQLHandler()
+        schema = await mysql_handler.get_table_schema(table_name, database_name)
         return {"success": True, "schema": schema}
     except Exception as e:
         return {"success": False, "message": str(e), "schema": {}}
@@ -601,8 +972,8 @@ async def get_mysql_table_schema(database_name: str, table_name: str):
 async def get_mysql_table_data(database_name: str, table_name: str, page: int = 1, per_page: int = 10):
     """Get paginated table data for MySQL tables."""
     try:
-        mysql_handler = MySQLHandler()
-        mysql_handler.connect_to_database(database_name)
+        mysql_handler = AsyncMySQLHandler()
+        await mysql_handler.connect_to_database(database_name)
         
         # Validate per_page parameter
         valid_per_page_options = [10, 25, 100, 1000]
@@ -610,9 +981,7 @@ async def get_mysql_table_data(database_name: str, table_name: str, page: int =
             per_page = 10
         
         # Get total row count
-        with mysql_handler.engine.connect() as conn:
-            count_result = conn.execute(text(f"SELECT COUNT(*) FROM `{table_name}`"))
-            total_rows = count_result.fetchone()[0]
+        total_rows = await mysql_handler.get_row_count(table_name)
         
         # Calculate pagination
         total_pages = max(1, (total_rows + per_page - 1) // per_page)
@@ -625,33 +994,12 @@ async def get_mysql_table_data(database_name: str, table_name: str, page: int =
         
         # Get data for current page
         offset = (page - 1) * per_page
-        query = f"SELECT * FROM `{table_name}` LIMIT {per_page} OFFSET {offset}"
-        
-        df = pd.read_sql(query, mysql_handler.engine)
-        mysql_handler.close_connection()
+        df = await mysql_handler.get_table_page(table_name, per_page, offset)
+        await mysql_handler.close_connection()
         
-        # Convert DataFrame to list of dictionaries for JSON response
+        # Convert DataFrame to rows of display strings for JSON response
         columns = df.columns.tolist()
-        data_rows = []
-        
-        for _, row in df.iterrows():
-            row_data = []
-            for col in columns:
-                val = row[col]
-                # Handle different data types
-                if pd.isna(val):
-                    str_val = ""
-                elif isinstance(val, (pd.Timestamp, datetime.datetime)):
-                    str_val = str(val)
-                elif isinstance(val, (int, float)):
-                    str_val = str(val)
-                else:
-                    str_val = str(val)
-                    # Truncate if too long
-                    if len(str_val) > 50:
-                        str_val = str_val[:47] + "..."
-                row_data.append(str_val)
-            data_rows.append(row_data)
+        data_rows = format_table_rows(df)
         
         return {
             "success": True,
@@ -681,8 +1029,8 @@ async def get_mysql_multi_table_schema(database_name: str, tables: str):
         if not table_names:
             return {"success": False, "message": "No tables specified", "schema": {}}
         
-        mysql_handler = MySQLHandler()
-        schema = mysql_handler.get_multi_table_schema(table_names, database_name)
+        mysql_handler = AsyncMySQLHandler()
+        schema = await mysql_handler.get_multi_table_schema(table_names, database_name)
         return {"success": True, "schema": schema}
     except Exception as e:
         return {"success": False, "message": str(e), "schema": {}}
@@ -690,32 +1038,38 @@ async def get_mysql_multi_table_schema(database_name: str, tables: str):
 @app.post("/api/mysql/ask")
 async def ask_mysql_question(mysql_request: MySQLQuestionRequest):
     """Process a question about MySQL data."""
+    key = ("mysql", mysql_request.database, mysql_request.table, normalize_question(mysql_request.question))
+    return await coalesced(key, lambda: answer_mysql_question(mysql_request))
+
+async def answer_mysql_question(mysql_request: MySQLQuestionRequest):
+    """Answer a /api/mysql/ask request."""
     try:
         if not mysql_request.question.strip():
             raise HTTPException(status_code=400, detail="Question cannot be empty")
         
         # Initialize MySQL handler and connect to database
-        mysql_handler = MySQLHandler()
-        mysql_handler.connect_to_database(mysql_request.database)
+        mysql_handler = AsyncMySQLHandler()
+        await mysql_handler.connect_to_database(mysql_request.database)
         
         # Get table schema for context
-        schema = mysql_handler.get_table_schema(mysql_request.table, mysql_request.database)
+        schema = await mysql_handler.get_table_schema(mysql_request.table, mysql_request.database)
         
-        # Generate SQL query using the dedicated SQL agent
-        sql_code = generate_sql_query(
+        # Generate SQL query using the dedicated SQL agent (off the event loop)
+        sql_code = await run_in_threadpool(
+            generate_sql_query,
             question=mysql_request.question,
             database_name=mysql_request.database,
             table_name=mysql_request.table,
             table_schema=schema
         )
         
-        # Execute the SQL query
-        df = mysql_handler.execute_query(sql_code)
+        # Execute the SQL query (served from cache while the table is unchanged)
+        df = await mysql_handler.run(sql_result_cache.execute, mysql_handler.handler, sql_code, [mysql_request.table])
         
         # Format the result to match pandas structured output
         structured_answer = format_mysql_result_structured(df, mysql_request.question)
         
-        mysql_handler.close_connection()
+        await mysql_handler.close_connection()
         
         return {
             "success": True,
@@ -736,6 +1090,11 @@ async def ask_mysql_question(mysql_request: MySQLQuestionRequest):
 @app.post("/api/mysql/ask-multi")
 async def ask_mysql_multi_table_question(mysql_request: MySQLMultiTableQuestionRequest):
     """Process a question about multiple MySQL tables."""
+    key = ("mysql-multi", mysql_request.database, tuple(sorted(mysql_request.tables)), normalize_question(mysql_request.question))
+    return await coalesced(key, lambda: answer_mysql_multi_table_question(mysql_request))
+
+async def answer_mysql_multi_table_question(mysql_request: MySQLMultiTableQuestionRequest):
+    """Answer a /api/mysql/ask-multi request."""
     try:
         if not mysql_request.question.strip():
             raise HTTPException(status_code=400, detail="Question cannot be empty")
@@ -744,27 +1103,28 @@ async def ask_mysql_multi_table_question(mysql_request: MySQLMultiTableQuestionR
             raise HTTPException(status_code=400, detail="At least one table must be specified")
         
         # Initialize MySQL handler and connect to database
-        mysql_handler = MySQLHandler()
-        mysql_handler.connect_to_database(mysql_request.database)
+        mysql_handler = AsyncMySQLHandler()
+        await mysql_handler.connect_to_database(mysql_request.database)
         
         # Get multi-table schema for context
-        schema = mysql_handler.get_multi_table_schema(mysql_request.tables, mysql_request.database)
+        schema = await mysql_handler.get_multi_table_schema(mysql_request.tables, mysql_request.database)
         
-        # Generate SQL query using the dedicated SQL agent with multi-table context
-        sql_code = generate_multi_table_sql_query(
+        # Generate SQL query using the dedicated SQL agent with multi-table context (off the event loop)
+        sql_code = await run_in_threadpool(
+            generate_multi_table_sql_query,
             question=mysql_request.question,
             database_name=mysql_request.database,
             table_names=mysql_request.tables,
             multi_table_schema=schema
         )
         
-        # Execute the SQL query
-        df = mysql_handler.execute_query(sql_code)
+        # Execute the SQL query (served from cache while the tables are unchanged)
+        df = await mysql_handler.run(sql_result_cache.execute, mysql_handler.handler, sql_code, mysql_request.tables)
         
         # Format the result to match pandas structured output
         structured_answer = format_mysql_result_structured(df, mysql_request.question)
         
-        mysql_handler.close_connection()
+        await mysql_handler.close_connection()
         
         return {
             "success": True,
@@ -784,6 +1144,76 @@ async def ask_mysql_multi_table_question(mysql_request: MySQLMultiTableQuestionR
             "tables_used": mysql_request.tables if hasattr(mysql_request, 'tables') else []
         }
 
+def _native_value(value: Any) -> Any:
+    """Convert a single result cell to a native Python type (None for nulls)."""
+    if pd.isna(value):
+        return None
+    if isinstance(value, (np.integer, int)):
+        return int(value)
+    elif isinstance(value, (np.floating, float)):
+        return float(value)
+    elif isinstance(value, (np.bool_, bool)):
+        return bool(value)
+    else:
+        return str(value)
+
+def _native_column(column: pd.Series, bools_as_int: bool = False) -> List[Any]:
+    """
+    Convert a whole result column to native Python types.
+
+    Numeric NumPy columns are converted in one pass; everything else falls back
+    to _native_value() per cell. bools_as_int mirrors the cell-wise path, where
+    Python bools pass the int check and come out as 0/1.
+    """
+    dtype = column.dtype
+    if isinstance(dtype, np.dtype):
+        if dtype.kind in 'iu':
+            return column.tolist()
+        if dtype.kind == 'b':
+            return column.astype(np.int64).tolist() if bools_as_int else column.tolist()
+        if dtype.kind == 'f':
+            values = column.to_numpy(dtype=object)
+            values[column.isna().to_numpy()] = None
+            return values.tolist()
+    return [_native_value(value) for value in column.tolist()]
+
+def _native_columns(df: pd.DataFrame) -> List[List[Any]]:
+    """
+    Convert every column of a DataFrame to native Python values.
+
+    Values are taken the same way iterrows() sees them: frames with a single
+    common NumPy dtype are converted through that dtype (so ints next to floats
+    become floats), mixed frames column by column from their own dtype.
+    """
+    values = df.to_numpy()
+    if values.dtype == object:
+        return [_native_column(df.iloc[:, i], bools_as_int=True) for i in range(df.shape[1])]
+    return [_native_column(pd.Series(values[:, i])) for i in range(df.shape[1])]
+
+def _display_value(value: Any) -> str:
+    """Convert a single table cell to its display string."""
+    if pd.isna(value):
+        return ""
+    str_val = str(value)
+    # Truncate long text values; dates and numbers are always shown in full
+    if not isinstance(value, (pd.Timestamp, datetime.datetime, int, float)) and len(str_val) > 50:
+        str_val = str_val[:47] + "..."
+    return str_val
+
+def format_table_rows(df: pd.DataFrame) -> List[List[str]]:
+    """Convert a DataFrame page to rows of display strings for the table viewer."""
+    values = df.to_numpy()
+    columns = []
+    for i in range(df.shape[1]):
+        column = df.iloc[:, i] if values.dtype == object else pd.Series(values[:, i])
+        if isinstance(column.dtype, np.dtype) and column.dtype.kind in 'iufb':
+            strings = column.astype(str).to_numpy(copy=True)
+            strings[column.isna().to_numpy()] = ""
+            columns.append(strings.tolist())
+        else:
+            columns.append([_display_value(value) for value in column.tolist()])
+    return [list(row) for row in zip(*columns)]
+
 def format_mysql_result_structured(df: pd.DataFrame, question: str) -> Any:
     """
     Format MySQL DataFrame results to match pandas structured output format.
@@ -794,36 +1224,11 @@ def format_mysql_result_structured(df: pd.DataFrame, question: str) -> Any:
     
     # Single value result (like COUNT, SUM, AVG, single answer)
     if len(df) == 1 and len(df.columns) == 1:
-        value = df.iloc[0, 0]
-        if pd.isna(value):
-            return None
-        
-        # Return native Python types
-        if isinstance(value, (np.integer, int)):
-            return int(value)
-        elif isinstance(value, (np.floating, float)):
-            return float(value)
-        elif isinstance(value, (np.bool_, bool)):
-            return bool(value)
-        else:
-            return str(value)
+        return _native_value(df.iloc[0, 0])
     
     # Single column, multiple rows -> List
     elif len(df.columns) == 1:
-        values = df.iloc[:, 0].tolist()
-        processed_values = []
-        for v in values:
-            if pd.isna(v):
-                processed_values.append(None)
-            elif isinstance(v, (np.integer, int)):
-                processed_values.append(int(v))
-            elif isinstance(v, (np.floating, float)):
-                processed_values.append(float(v))
-            elif isinstance(v, (np.bool_, bool)):
-                processed_values.append(bool(v))
-            else:
-                processed_values.append(str(v))
-        return processed_values
+        return _native_column(df.iloc[:, 0], bools_as_int=True)
     
     # Multiple columns -> return as structured data
     else:
@@ -836,30 +1241,17 @@ def format_mysql_result_structured(df: pd.DataFrame, question: str) -> Any:
             # If no results, return False
             return len(df) > 0
         
-        # For other multi-column results, return as list of dictionaries
-        result = []
-        for _, row in df.iterrows():
-            row_dict = {}
-            for col in df.columns:
-                val = row[col]
-                if pd.isna(val):
-                    row_dict[col] = None
-                elif isinstance(val, (np.integer, int)):
-                    row_dict[col] = int(val)
-                elif isinstance(val, (np.floating, float)):
-                    row_dict[col] = float(val)
-                elif isinstance(val, (np.bool_, bool)):
-                    row_dict[col] = bool(val)
-                else:
-                    row_dict[col] = str(val)
-            result.append(row_dict)
+        # For other multi-column results, return as list of dictionaries.
+        # Larger results are only summarised, so just the first 10 rows are converted.
+        columns = df.columns.tolist()
+        result = [dict(zip(columns, row)) for row in zip(*_native_columns(df.head(10)))]
         
         # If small result set, return the structured data
-        if len(result) <= 10:
+        if len(df) <= 10:
             return result
         else:
             # For larger results, return a summary
-            return f"Found {len(result)} results. First 10: {result[:10]}"
+            return f"Found {len(df)} results. First 10: {result}"
 
 if __name__ == "__main__":
     import uvicorn
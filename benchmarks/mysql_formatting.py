@@ -0,0 +1,133 @@
+"""
+MySQL Result Formatting Benchmark
+Times the column-wise MySQL result formatting in app.py (format_table_rows,
+format_mysql_result_structured) against the row-by-row iterrows() formatter it
+replaced, kept here as the reference, and checks that both give the same output.
+
+Run from the repository root:
+    python benchmarks/mysql_formatting.py [--rows 1000] [--runs 20]
+"""
+
+import argparse
+import datetime
+import decimal
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_KEY", "benchmark")
+
+
+def legacy_table_rows(df: pd.DataFrame):
+    """The table-data endpoint's previous row formatting."""
+    columns = df.columns.tolist()
+    data_rows = []
+    for _, row in df.iterrows():
+        row_data = []
+        for col in columns:
+            val = row[col]
+            if pd.isna(val):
+                str_val = ""
+            elif isinstance(val, (pd.Timestamp, datetime.datetime)):
+                str_val = str(val)
+            elif isinstance(val, (int, float)):
+                str_val = str(val)
+            else:
+                str_val = str(val)
+                if len(str_val) > 50:
+                    str_val = str_val[:47] + "..."
+            row_data.append(str_val)
+        data_rows.append(row_data)
+    return data_rows
+
+
+def _legacy_value(val):
+    if pd.isna(val):
+        return None
+    elif isinstance(val, (np.integer, int)):
+        return int(val)
+    elif isinstance(val, (np.floating, float)):
+        return float(val)
+    elif isinstance(val, (np.bool_, bool)):
+        return bool(val)
+    return str(val)
+
+
+def legacy_structured(df: pd.DataFrame, question: str):
+    """The previous format_mysql_result_structured."""
+    if df.empty:
+        return "No results found"
+    if len(df) == 1 and len(df.columns) == 1:
+        return _legacy_value(df.iloc[0, 0])
+    elif len(df.columns) == 1:
+        return [_legacy_value(v) for v in df.iloc[:, 0].tolist()]
+    question_lower = question.lower()
+    yes_no_indicators = ['is there', 'does', 'do', 'are there', 'can', 'will', 'would']
+    if any(indicator in question_lower for indicator in yes_no_indicators):
+        return len(df) > 0
+    result = []
+    for _, row in df.iterrows():
+        result.append({col: _legacy_value(row[col]) for col in df.columns})
+    if len(result) <= 10:
+        return result
+    return f"Found {len(result)} results. First 10: {result[:10]}"
+
+
+def random_frame(rng: np.random.Generator, rows: int, kinds=None) -> pd.DataFrame:
+    """A result-like frame with int, float (with NaN), bool, text, datetime, Decimal and date columns."""
+    kinds = kinds or ['int', 'float', 'bool', 'text', 'datetime', 'decimal', 'date']
+    columns = {}
+    for i, kind in enumerate(kinds):
+        name = f"{kind}_{i}"
+        if kind == 'int':
+            columns[name] = rng.integers(-1000, 1000, rows)
+        elif kind == 'float':
+            values = rng.normal(size=rows)
+            values[rng.random(rows) < 0.1] = np.nan
+            columns[name] = values
+        elif kind == 'bool':
+            columns[name] = rng.random(rows) < 0.5
+        elif kind == 'text':
+            columns[name] = ["x" * int(n) for n in rng.integers(0, 80, rows)]
+        elif kind == 'datetime':
+            columns[name] = pd.to_datetime(rng.integers(0, 10 ** 9, rows), unit='s')
+        elif kind == 'decimal':
+            columns[name] = [decimal.Decimal(int(n)) / 100 for n in rng.integers(0, 10 ** 6, rows)]
+        elif kind == 'date':
+            columns[name] = [datetime.date(2020, 1, 1) + datetime.timedelta(days=int(n)) for n in rng.integers(0, 1000, rows)]
+    return pd.DataFrame(columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    from app import format_table_rows, format_mysql_result_structured
+
+    rng = np.random.default_rng(0)
+    page = random_frame(rng, args.rows, ['int', 'float', 'bool', 'text', 'datetime', 'decimal'])
+    single = page[['int_0']]
+    cases = [
+        ("table-data rows", lambda: legacy_table_rows(page), lambda: format_table_rows(page)),
+        ("multi-column answer", lambda: legacy_structured(page, "list them"),
+         lambda: format_mysql_result_structured(page, "list them")),
+        ("single-column list answer", lambda: legacy_structured(single, "list them"),
+         lambda: format_mysql_result_structured(single, "list them")),
+    ]
+
+    print(f"{args.rows} rows x {page.shape[1]} columns, best of {args.runs} runs")
+    for name, legacy, current in cases:
+        assert legacy() == current(), f"{name}: outputs differ"
+        before = min(timeit.repeat(legacy, number=1, repeat=args.runs)) * 1000
+        after = min(timeit.repeat(current, number=1, repeat=args.runs)) * 1000
+        print(f"  {name:<27} {before:8.2f} ms -> {after:7.2f} ms  ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
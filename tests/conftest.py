@@ -0,0 +1,66 @@
+"""
+Shared test setup: tests run from the repository root (datasets/ is resolved relative
+to it) with a dummy API key, and LLM calls go to a scripted fake client.
+"""
+
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("API_KEY", "test")
+
+
+class FakeCompletions:
+    """
+    Stands in for client.chat.completions: answers every call with code, after delay
+    seconds (or, with delays, the n-th call after delays[n] seconds), and keeps the
+    arguments of every call in requests.
+    """
+
+    def __init__(self, code: str, delay: float = 0.0, delays=None):
+        self.code = code
+        self.delay = delay
+        self.delays = list(delays or [])
+        self.calls = 0
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        with self._lock:
+            call = self.calls
+            self.calls += 1
+            self.requests.append(kwargs)
+        time.sleep(self.delays[call] if call < len(self.delays) else self.delay)
+        message = SimpleNamespace(role="assistant", content=f"```python\n{self.code}\n```")
+        usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, prompt_tokens_details=None)
+        return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message)], usage=usage)
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    monkeypatch.chdir(ROOT)
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """Return a factory installing a FakeCompletions as every LLM provider."""
+    from utilities import agents, question_processing
+
+    # Keep tests from writing dataset samples into datasets/samples/
+    monkeypatch.setattr(question_processing, "SAMPLE_VALIDATION", False)
+
+    def install(code: str, delay: float = 0.0, delays=None) -> FakeCompletions:
+        completions = FakeCompletions(code, delay, delays)
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        for name in dir(agents):
+            if name.endswith("_PROVIDER"):
+                monkeypatch.setattr(agents, name, client)
+        return completions
+
+    return install
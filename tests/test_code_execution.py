@@ -0,0 +1,66 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from utilities import code_execution
+from utilities.code_execution import capture_exec_output, capture_stdout
+
+CONCURRENT_EXECUTIONS = 64
+
+
+def test_concurrent_captures_keep_their_own_output():
+    barrier = threading.Barrier(CONCURRENT_EXECUTIONS)
+
+    def capture(n):
+        buffer = io.StringIO()
+        with capture_stdout(buffer):
+            barrier.wait()
+            for i in range(200):
+                print(n, i)
+        return buffer.getvalue()
+
+    with ThreadPoolExecutor(CONCURRENT_EXECUTIONS) as executor:
+        outputs = list(executor.map(capture, range(CONCURRENT_EXECUTIONS)))
+
+    for n, output in enumerate(outputs):
+        assert output == "".join(f"{n} {i}\n" for i in range(200))
+
+
+def test_concurrent_executions_return_their_own_answers():
+    # Several prints per run, so the answers come from captured stdout rather than answer()
+    code = "x = {n}\nfor i in range(50):\n    total = x * 1000 + i\nprint('run', x)\nprint(total)"
+    barrier = threading.Barrier(CONCURRENT_EXECUTIONS)
+
+    def execute(n):
+        barrier.wait()
+        return capture_exec_output(code.format(n=n))
+
+    with ThreadPoolExecutor(CONCURRENT_EXECUTIONS) as executor:
+        results = list(executor.map(execute, range(CONCURRENT_EXECUTIONS)))
+
+    assert results == [f"run {n}\n{n * 1000 + 49}" for n in range(CONCURRENT_EXECUTIONS)]
+
+
+def test_datetime_arrays_keep_their_values():
+    code = "import pandas as pd\ndates = pd.to_datetime(['2020-01-01', '2021-02-03']).values\nprint(dates)"
+    assert capture_exec_output(code) == [pd.Timestamp('2020-01-01'), pd.Timestamp('2021-02-03')]
+
+
+@pytest.mark.parametrize("answer, expected", [
+    ("np.float32(0.1)", 0.1),
+    ("np.array(np.float32(0.1))", 0.1),
+    ("np.array([0.1, 0.2], dtype=np.float32)", [0.1, 0.2]),
+    ("np.float64(0.1)", 0.1),
+])
+def test_float32_answers_keep_their_printed_precision(answer, expected):
+    assert capture_exec_output(f"import numpy as np\nprint({answer})") == expected
+
+
+def test_truncated_answers_are_flagged(monkeypatch):
+    monkeypatch.setattr(code_execution, 'EXEC_RESULT_MAX_ITEMS', 3)
+    assert capture_exec_output("print(list(range(10)))") == [0, 1, 2, "... (7 more items truncated)"]
+    assert capture_exec_output("print({i: i for i in range(5)})") == {0: 0, 1: 1, 2: 2, "...": "... (2 more items truncated)"}
+    assert capture_exec_output("print(list(range(3)))") == [0, 1, 2]
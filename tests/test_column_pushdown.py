@@ -0,0 +1,68 @@
+import ast
+
+import pandas as pd
+import pytest
+
+from utilities.code_execution import capture_exec_output
+from utilities.code_processing import push_down_columns
+
+
+@pytest.fixture
+def parquet_path(tmp_path):
+    path = tmp_path / "sales.parquet"
+    pd.DataFrame({
+        'region': ['north', 'south', 'north', 'east'],
+        'product': ['a', 'b', 'a', 'c'],
+        'units': [3, 5, 2, 7],
+        'price': [9.5, 3.0, 9.5, 1.25],
+        'notes': ['x', 'y', 'z', 'w'],
+    }).to_parquet(path)
+    return str(path)
+
+
+def read_columns(code):
+    """Return the columns= list of the read_parquet call in code, or None for a full read."""
+    for node in ast.walk(ast.parse(code)):
+        if isinstance(node, ast.Call) and getattr(node.func, 'attr', None) == 'read_parquet':
+            for keyword in node.keywords:
+                if keyword.arg == 'columns':
+                    return ast.literal_eval(keyword.value)
+            return None
+
+
+def program(path, body):
+    return f"import pandas as pd\ndf = pd.read_parquet({path!r})\n{body}"
+
+
+@pytest.mark.parametrize("body, columns", [
+    ("print(df.units.sum())", ['units']),
+    ("print(df['units'].sum())", ['units']),
+    ("print(df[['region', 'units']].head(2).values.tolist())", ['region', 'units']),
+    ("print(df.groupby('region')['units'].agg('sum').to_dict())", ['region', 'units']),
+    ("print(df.groupby('region').agg({'price': 'mean'}).to_dict())", ['region', 'price']),
+    ("top = df[df['price'] > 2]\nprint(top['product'].tolist())", ['product', 'price']),
+    ("print(df.sort_values('units').loc[:, 'region'].tolist())", ['region', 'units']),
+    ("print(len(df), df.shape[0])", None),
+])
+def test_reads_only_the_columns_the_code_uses(parquet_path, body, columns):
+    code = program(parquet_path, body)
+    rewritten = push_down_columns(code)
+    assert read_columns(rewritten) == columns
+    assert capture_exec_output(rewritten) == capture_exec_output(code)
+
+
+@pytest.mark.parametrize("body", [
+    # Dynamic column access
+    "column = 'units'\nprint(df[column].sum())",
+    "print(getattr(df, 'units').sum())",
+    "print(eval(\"df['units'].sum()\"))",
+    # Uses that depend on every column
+    "print(df.columns.tolist())",
+    "print(list(df))",
+    "print(df.groupby('region').agg('sum').to_dict())",
+    "print(df.dropna().shape)",
+    "print(df.describe())",
+])
+def test_uses_it_cannot_account_for_keep_the_full_read(parquet_path, body):
+    code = program(parquet_path, body)
+    assert push_down_columns(code) == code
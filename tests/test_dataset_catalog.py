@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utilities.code_execution import capture_exec_output
+from utilities.code_processing import modify_dataset_paths
+from utilities.dataset_catalog import DatasetCatalog
+
+
+@pytest.fixture
+def dataset_folder(tmp_path):
+    pd.DataFrame({'a': [1, 2, 3], 'b': [4.0, 5.0, 6.0], 'c': ['x', 'y', 'z']}).to_parquet(tmp_path / "small.parquet")
+    return str(tmp_path) + "/"
+
+
+def test_importing_the_catalog_leaves_pandas_options_alone():
+    assert not pd.get_option("mode.copy_on_write")
+
+
+def test_copies_are_private_and_shallow_loads_share_data(dataset_folder):
+    catalog = DatasetCatalog(dataset_folder)
+    path = dataset_folder + "small.parquet"
+    cached = catalog.load(path, copy=False)
+
+    private = catalog.load(path)
+    private.loc[0, 'a'] = 100
+    assert catalog.load(path)['a'].tolist() == [1, 2, 3]
+    assert not np.shares_memory(private['a'].to_numpy(), cached['a'].to_numpy())
+
+    projected = catalog.load(path, ['b', 'a'], copy=False)
+    assert list(projected.columns) == ['b', 'a']
+    assert np.shares_memory(projected['a'].to_numpy(), cached['a'].to_numpy())
+    with pytest.raises(KeyError):
+        catalog.load(path, ['a', 'missing'], copy=False)
+
+
+@pytest.mark.parametrize("body, shared", [
+    ("print(df['a'].sum())", True),
+    ("print(df.groupby('c')['b'].mean().to_dict())", True),
+    ("df.loc[0, 'a'] = 100\nprint(df['a'].sum())", False),
+    ("df['b'] += 1\nprint(df['b'].sum())", False),
+    ("df.sort_values('a', inplace=True)\nprint(df['a'].tolist())", False),
+    ("s = df['a']\ns[0] = 100\nprint(df['a'].sum())", False),
+    ("values = df['a'].values\nvalues.sort()\nprint(values.tolist())", False),
+])
+def test_only_code_that_cannot_modify_data_shares_cached_frames(dataset_folder, body, shared):
+    code = f"import pandas as pd\ndf = pd.read_parquet('small.parquet')\n{body}"
+    modified = modify_dataset_paths(code, dataset_folder_path=dataset_folder)
+    assert "load_dataset(" in modified
+    assert ("copy=False" in modified) == shared
+
+    # Running it twice gives the same answer: nothing leaked into the cache
+    assert capture_exec_output(modified) == capture_exec_output(modified)
@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+from utilities.code_processing import resolve_dataset_reads
+from utilities.dataset_catalog import DatasetCatalog
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    pd.DataFrame({'id': [1, 2]}).to_parquet(tmp_path / "orders.parquet")
+    pd.DataFrame({'id': [1, 2]}).to_csv(tmp_path / "customers.csv", index=False)
+    return DatasetCatalog(str(tmp_path))
+
+
+def resolve(code, catalog):
+    return resolve_dataset_reads("import pandas as pd\n" + code, catalog).split("\n", 1)[1]
+
+
+@pytest.mark.parametrize("code, expected", [
+    ("df = pd.read_parquet('orders.parquet')", "df = pd.read_parquet('{folder}orders.parquet')"),
+    ("df = pd.read_parquet(path='data/orders.parquet')", "df = pd.read_parquet('{folder}orders.parquet')"),
+    ("name = 'orders'\ndf = pd.read_parquet(f'data/{name}.parquet')", "name = 'orders'\ndf = pd.read_parquet('{folder}orders.parquet')"),
+    ("df = pd.read_parquet('data/' + 'orders.parquet')", "df = pd.read_parquet('{folder}orders.parquet')"),
+    # Unknown datasets inside the folder get the folder prefixed
+    ("df = pd.read_csv('sub/other.csv')", "df = pd.read_csv('{folder}sub/other.csv')"),
+])
+def test_static_paths_are_resolved_against_the_catalog(catalog, code, expected):
+    assert resolve(code, catalog) == expected.format(folder=catalog.dataset_folder_path)
+
+
+def test_extra_arguments_are_kept_only_for_the_same_reader(catalog):
+    folder = catalog.dataset_folder_path
+    assert resolve("df = pd.read_parquet('orders.parquet', columns=['id'], engine='pyarrow')", catalog) == \
+        f"df = pd.read_parquet('{folder}orders.parquet', columns=['id'], engine='pyarrow')"
+    # customers only exists as a csv, and the parquet arguments do not apply to read_csv
+    assert resolve("df = pd.read_parquet('customers.parquet', columns=['id'])", catalog) == \
+        f"df = pd.read_csv('{folder}customers.csv')"
+
+
+@pytest.mark.parametrize("code", [
+    # Paths that are not known statically
+    "def load(path):\n    return pd.read_parquet(path)",
+    "df = pd.read_parquet(input())",
+    "name = 'orders.parquet'\nname = 'customers.csv'\ndf = pd.read_parquet(name)",
+    "df = pd.read_parquet(f'{\"orders\":>10}.parquet')",
+    # Unknown files outside the dataset folder
+    "df = pd.read_csv('../other.csv')",
+    "df = pd.read_csv('sub/../../other.csv')",
+    "df = pd.read_csv('/tmp/other.csv')",
+])
+def test_reads_it_cannot_resolve_are_left_alone(catalog, code):
+    assert resolve(code, catalog) == code
+
+
+def test_code_that_does_not_parse_is_reported(catalog):
+    assert resolve_dataset_reads("df = pd.read_parquet('orders.parquet'", catalog) is None
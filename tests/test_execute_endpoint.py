@@ -0,0 +1,28 @@
+import asyncio
+import time
+
+import httpx
+
+SLOW_CODE = "import time\nimport pandas as pd\ndf = pd.read_parquet('051_Pokemon.parquet')\ntime.sleep(0.5)\nprint(df['speed'].max())"
+
+
+def test_executing_code_does_not_block_other_requests():
+    import app
+
+    async def execute_and_poll():
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            start = time.perf_counter()
+            execution = asyncio.ensure_future(client.post("/api/execute", json={"code": SLOW_CODE}))
+            await asyncio.sleep(0.1)
+            # Served while the code runs, not after it
+            metrics = await client.get("/api/metrics")
+            metrics_seconds = time.perf_counter() - start
+            return await execution, metrics, metrics_seconds
+
+    execution, metrics, metrics_seconds = asyncio.run(execute_and_poll())
+
+    assert execution.status_code == 200
+    assert execution.json()["result"] == 200
+    assert metrics.status_code == 200
+    assert metrics_seconds < 0.4
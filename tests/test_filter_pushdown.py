@@ -0,0 +1,37 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from utilities.code_execution import capture_exec_output
+from utilities.code_processing import push_down_filters
+
+
+@pytest.fixture
+def nullable_parquet(tmp_path):
+    # Nulls only in the second row group, so the rows kept by the filter have none
+    table = pa.table({
+        'group': ['a', 'a', 'a', 'b', 'b', 'b'],
+        'count': pa.array([5, 5, 5, None, 1, 2], pa.int64()),
+        'flag': pa.array([True, False, True, None, True, True]),
+    })
+    path = tmp_path / "nullable.parquet"
+    pq.write_table(table, path, row_group_size=3)
+    return str(path)
+
+
+@pytest.mark.parametrize("answer", [
+    "df['count'].tolist()",
+    "df['flag'].tolist()",
+    "df.dtypes.astype(str).tolist()",
+    "df",
+])
+def test_pushed_down_filters_keep_full_read_results(nullable_parquet, answer):
+    code = (
+        "import pandas as pd\n"
+        f"df = pd.read_parquet({nullable_parquet!r})\n"
+        "df = df[df['group'] == 'a']\n"
+        f"print({answer})"
+    )
+    rewritten = push_down_filters(code)
+    assert "read_parquet_filtered" in rewritten
+    assert capture_exec_output(rewritten) == capture_exec_output(code)
@@ -0,0 +1,33 @@
+import asyncio
+import time
+
+from utilities.metrics import get_counters
+
+SPEED_CODE = "import pandas as pd\ndf = pd.read_parquet('datasets/051_Pokemon.parquet')\nprint(df['speed'].max())"
+
+
+def test_speculative_mode_counts_tokens_of_losing_candidates(fake_llm, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "SPECULATIVE_CANDIDATES", 3)
+    # The winner's call takes long enough for every candidate's thread to start (a
+    # candidate cancelled before its thread starts makes no call at all)
+    completions = fake_llm(SPEED_CODE, delays=[0.2, 0.7, 0.7])
+    before = get_counters()
+
+    response = asyncio.run(app.process_question_async(
+        "Which pokemon is the fastest one by its speed stat?", "051_Pokemon", mode="speculative"))
+    assert response.success and response.answer == "200"
+
+    def added(counter):
+        name = f"generation.speculative.{counter}"
+        return get_counters().get(name, 0) - before.get(name, 0)
+
+    # The two slower candidates lose the race, but their calls are still paid for
+    deadline = time.monotonic() + 5
+    while added("llm_calls") < 3:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert completions.calls == 3
+    assert added("prompt_tokens") == 30
+    assert added("completion_tokens") == 15
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from app import format_mysql_result_structured, format_table_rows
+from benchmarks.mysql_formatting import legacy_structured, legacy_table_rows, random_frame
+
+KINDS = ['int', 'float', 'bool', 'text', 'datetime', 'decimal', 'date']
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_column_wise_formatting_matches_iterrows_formatting(seed):
+    rng = np.random.default_rng(seed)
+    kinds = list(rng.choice(KINDS, size=int(rng.integers(1, 5))))
+    df = random_frame(rng, int(rng.integers(1, 40)), kinds)
+
+    assert format_table_rows(df) == legacy_table_rows(df)
+    for question in ("list them", "is there any"):
+        assert format_mysql_result_structured(df, question) == legacy_structured(df, question)
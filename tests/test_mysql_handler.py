@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from utilities import mysql_handler
+from utilities.mysql_handler import AsyncMySQLHandler, shutdown_mysql_executor
+
+POOL_SIZE = 3
+
+
+class StubHandler:
+    """Stands in for MySQLHandler: every query takes delay seconds and records how many ran at once."""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def execute_query(self, query: str, limit: int = 100) -> pd.DataFrame:
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.delay)
+            if "fail" in query:
+                raise Exception("Query execution failed: stub failure")
+            return pd.DataFrame({'query': [query], 'limit': [limit]})
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+@pytest.fixture
+def executor():
+    pool = ThreadPoolExecutor(max_workers=POOL_SIZE)
+    yield pool
+    pool.shutdown()
+
+
+def test_concurrent_calls_never_exceed_the_pool_size(executor):
+    handler = StubHandler()
+
+    async def main():
+        facades = [AsyncMySQLHandler(handler, executor) for _ in range(4 * POOL_SIZE)]
+        return await asyncio.gather(*(facade.execute_query(f"SELECT {i}", 5) for i, facade in enumerate(facades)))
+
+    results = asyncio.run(main())
+    assert handler.max_running == POOL_SIZE
+    assert [df['query'][0] for df in results] == [f"SELECT {i}" for i in range(4 * POOL_SIZE)]
+    assert all(df['limit'][0] == 5 for df in results)
+
+
+def test_calls_do_not_block_the_event_loop(executor):
+    handler = StubHandler(delay=0.3)
+
+    async def main():
+        ticks = 0
+
+        async def heartbeat():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        beat = asyncio.create_task(heartbeat())
+        await AsyncMySQLHandler(handler, executor).execute_query("SELECT 1")
+        beat.cancel()
+        return ticks
+
+    assert asyncio.run(main()) >= 10
+
+
+def test_errors_propagate_to_the_caller(executor):
+    facade = AsyncMySQLHandler(StubHandler(), executor)
+    with pytest.raises(Exception, match="stub failure"):
+        asyncio.run(facade.execute_query("SELECT fail"))
+
+
+def test_shutdown_finishes_running_calls_and_rejects_new_ones(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(mysql_handler, "MYSQL_EXECUTOR", pool)
+    handler = StubHandler(delay=0.2)
+
+    async def main():
+        facade = AsyncMySQLHandler(handler)
+        running = asyncio.ensure_future(facade.execute_query("SELECT 1"))
+        await asyncio.sleep(0.05)
+        await asyncio.get_running_loop().run_in_executor(None, shutdown_mysql_executor)
+        result = await running
+        with pytest.raises(RuntimeError):
+            await facade.execute_query("SELECT 2")
+        return result
+
+    assert asyncio.run(main())['query'][0] == "SELECT 1"
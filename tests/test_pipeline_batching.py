@@ -0,0 +1,27 @@
+from utilities import pipeline, question_templates
+
+DATASET = "051_Pokemon"
+SCHEMA = "Column Name: name\nColumn Name: speed\nColumn Name: attack"
+READ = f"import pandas as pd\ndf = pd.read_parquet('datasets/{DATASET}.parquet')\n"
+QUESTIONS = ["How many pokemon are there?", "What is the highest speed stat?"]
+
+
+def test_failed_batched_code_is_regenerated_with_a_clean_prompt(fake_llm, monkeypatch):
+    monkeypatch.setattr(question_templates, "TEMPLATE_FAST_PATH", False)
+    batch_codes = [READ + "print(len(df))", READ + "print(df['top_speed_batched'].max())"]
+    monkeypatch.setattr(pipeline, "get_pandas_code_batch", lambda dataset, questions, schema: batch_codes)
+    completions = fake_llm(READ + "print(df['speed'].max())")
+
+    results = pipeline.process_batch([{'question': q, 'dataset': DATASET} for q in QUESTIONS],
+                                     {DATASET: SCHEMA}, "datasets/", max_retries=1)
+
+    assert [result['status'] for result in results] == ['success', 'success']
+    assert "print(df['speed'].max())" in results[1]['pandas_code']
+    assert 'top_speed_batched' in results[1]['error_history'][0]['message']
+
+    # One call, for the failed question alone, asking the question as a first attempt would
+    assert completions.calls == 1
+    prompt = "\n".join(str(message['content']) for message in completions.requests[0]['messages'])
+    assert 'top_speed_batched' not in prompt and 'generated an error' not in prompt
+    assert f"Generate a python code to answer this question: `{QUESTIONS[1]}`" in prompt
+    assert QUESTIONS[0] not in prompt
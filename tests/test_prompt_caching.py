@@ -0,0 +1,46 @@
+import os
+
+from utilities.agents import get_pandas_code
+from utilities.schema_pruning import SCHEMA_TOP_K
+
+
+def schema_text(columns):
+    return "\n".join(
+        f"Column Name: {name}, Data type -- float64, -- Example values: [1.0, 2.0], Total unique elements: 2"
+        for name in columns
+    )
+
+
+def prompts(fake_llm, schema, questions):
+    completions = fake_llm("print(1)")
+    for question in questions:
+        get_pandas_code("sales", question, schema)
+    return [request["messages"][0]["content"] for request in completions.requests]
+
+
+QUESTIONS = ["What is the average unit price?", "How many orders have a discount above 10?"]
+
+
+def schema_block(prompt):
+    return prompt.split("Dataset schema: ", 1)[1].split("\n\n", 1)[0]
+
+
+def test_narrow_schemas_keep_the_prompt_prefix_stable(fake_llm):
+    schema = schema_text(["unit_price", "discount", "quantity"])
+    first, second = prompts(fake_llm, schema, QUESTIONS)
+    assert schema_block(first) == schema
+    assert first.index(schema) + len(schema) <= len(os.path.commonprefix([first, second]))
+
+
+def test_wide_schemas_keep_the_prefix_stable_and_detail_relevant_columns_after_it(fake_llm):
+    columns = ["unit_price", "discount"] + [f"metric_{i}" for i in range(SCHEMA_TOP_K + 10)]
+    first, second = prompts(fake_llm, schema_text(columns), QUESTIONS)
+
+    # The schema block lists every column name and is shared by both prompts
+    block = schema_block(first)
+    assert block == "Columns: " + ", ".join(columns)
+    assert first.index(block) + len(block) <= len(os.path.commonprefix([first, second]))
+    # The column details come after it, limited to the top columns
+    details = first[first.index(block) + len(block):]
+    assert details.count("Column Name:") == SCHEMA_TOP_K
+    assert "Column Name: unit_price" in details
@@ -0,0 +1,31 @@
+import asyncio
+import time
+
+import httpx
+
+SPEED_CODE = "import pandas as pd\ndf = pd.read_parquet('datasets/051_Pokemon.parquet')\nprint(df['speed'].max())"
+
+
+def test_concurrent_identical_questions_share_one_generation(fake_llm):
+    import app
+
+    completions = fake_llm(SPEED_CODE, delay=0.5)
+
+    async def ask_concurrently():
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            question = {"question": "Which pokemon has the highest speed stat of all?", "dataset": "051_Pokemon"}
+            asks = [asyncio.ensure_future(client.post("/api/ask", json=question)) for _ in range(5)]
+            await asyncio.sleep(0.1)
+            # The event loop keeps serving other routes while the LLM call is in progress
+            start = time.perf_counter()
+            metrics = await client.get("/api/metrics")
+            metrics_seconds = time.perf_counter() - start
+            return await asyncio.gather(*asks), metrics, metrics_seconds
+
+    responses, metrics, metrics_seconds = asyncio.run(ask_concurrently())
+
+    assert [response.json()["answer"] for response in responses] == ["200"] * 5
+    assert completions.calls == 1
+    assert metrics.status_code == 200
+    assert metrics_seconds < 0.4
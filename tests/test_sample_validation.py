@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utilities import question_processing
+from utilities.data_preprocessing import DATASET_SAMPLE_ROWS
+from utilities.question_processing import run_generated_code, validate_on_sample
+
+ROWS = DATASET_SAMPLE_ROWS + 1000
+
+
+@pytest.fixture
+def dataset_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(question_processing, "SAMPLE_VALIDATION", True)
+    pd.DataFrame({
+        'order_id': np.arange(ROWS),
+        'category': np.resize(['books', 'games', 'music'], ROWS),
+        'unit_price': np.linspace(1.0, 100.0, ROWS),
+        'label': np.resize(['a', 'b'], ROWS),
+    }).to_parquet(tmp_path / "orders.parquet")
+    return str(tmp_path) + "/"
+
+
+def sample_rejects(code, dataset_folder):
+    return validate_on_sample("import pandas as pd\ndf = pd.read_parquet('orders.parquet')\n" + code, "orders", dataset_folder)
+
+
+@pytest.mark.parametrize("code, error_type", [
+    ("print(df['Unit Price'].mean())", KeyError),
+    ("print(df[['category', 'unit_prices']].head())", KeyError),
+    ("print(df.UnitPrice.mean())", AttributeError),
+    ("print(df['label'].mean())", TypeError),
+    ("print(df['category'] - 1)", TypeError),
+    ("print(undefined_name)", NameError),
+])
+def test_errors_from_columns_and_dtypes_fail_fast_on_the_sample(dataset_folder, code, error_type):
+    assert isinstance(sample_rejects(code, dataset_folder), error_type)
+
+
+def test_errors_that_depend_on_the_sampled_rows_go_to_the_full_run(dataset_folder):
+    # Creates the sample
+    assert sample_rejects("print(len(df))", dataset_folder) is None
+    sample = pd.read_parquet(dataset_folder + "samples/orders.parquet")
+    missing_id = int(np.setdiff1d(np.arange(ROWS), sample['order_id'])[0])
+
+    # A row label, a column name unlike any column and an empty selection
+    assert sample_rejects(f"print(df.set_index('order_id').loc[{missing_id}, 'category'])", dataset_folder) is None
+    assert sample_rejects("print(df['revenue'].sum())", dataset_folder) is None
+    assert sample_rejects(f"print(df[df['order_id'] == {missing_id}]['unit_price'].max() + 'x')", dataset_folder) is None
+
+    # ... and the full run answers them
+    code = f"import pandas as pd\ndf = pd.read_parquet('orders.parquet')\nprint(df.set_index('order_id').loc[{missing_id}, 'category'])"
+    _, result, error = run_generated_code(code, "orders", dataset_folder)
+    assert error is None and result in ('books', 'games', 'music')
@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from utilities.caching import SQLResultCache
+
+
+class FakeHandler:
+    """Stands in for MySQLHandler: tables are versioned values with settable change markers."""
+
+    current_database = 'shop'
+
+    def __init__(self):
+        self.markers = {'orders': ('2024-01-01 00:00:00', 10), 'customers': ('2024-01-01 00:00:00', 5)}
+        self.version = 1
+        self.executions = 0
+        self.marker_requests = []
+        self._lock = threading.Lock()
+
+    def execute_query(self, query, limit=100):
+        with self._lock:
+            self.executions += 1
+        return pd.DataFrame({'version': [self.version]})
+
+    def get_table_change_markers(self, table_names, database_name=None):
+        self.marker_requests.append(list(table_names))
+        return {name: self.markers.get(name) for name in table_names}
+
+    def write(self, table, update_time=None, table_rows=None):
+        old_time, old_rows = self.markers[table]
+        self.markers[table] = (update_time or old_time, old_rows if table_rows is None else table_rows)
+        self.version += 1
+
+    def connect_to_database(self, database_name):
+        pass
+
+    def close_connection(self):
+        pass
+
+
+QUERY = "SELECT COUNT(*) FROM orders"
+
+
+@pytest.fixture
+def handler():
+    return FakeHandler()
+
+
+def answer(cache, handler, query=QUERY, tables=()):
+    return int(cache.execute(handler, query, list(tables))['version'][0])
+
+
+def test_results_are_reused_while_markers_are_unchanged(handler):
+    cache = SQLResultCache(max_age=60)
+    assert answer(cache, handler) == 1
+    assert answer(cache, handler, "SELECT  COUNT(*)\nFROM orders;") == 1
+    # Within max_age the markers are not even checked
+    assert handler.executions == 1 and cache.marker_checks == 1
+
+    cache.max_age = 0
+    assert answer(cache, handler) == 1
+    assert handler.executions == 1 and cache.marker_checks == 2
+
+
+@pytest.mark.parametrize("change", [
+    {'update_time': '2024-01-01 00:00:01'},
+    {'table_rows': 11},
+])
+def test_a_changed_marker_invalidates_the_entry(handler, change):
+    cache = SQLResultCache(max_age=0)
+    assert answer(cache, handler) == 1
+    handler.write('orders', **change)
+    assert answer(cache, handler) == 2
+    assert handler.executions == 2
+
+
+def test_every_table_the_query_reads_is_checked(handler):
+    cache = SQLResultCache(max_age=0)
+    query = "SELECT * FROM orders o JOIN `shop`.`customers` c ON o.customer_id = c.id"
+    assert answer(cache, handler, query) == 1
+    assert handler.marker_requests[-1] == ['customers', 'orders']
+
+    handler.write('customers', table_rows=6)
+    assert answer(cache, handler, query) == 2
+
+
+def test_tables_without_update_time_are_never_cached(handler):
+    handler.markers['orders'] = None
+    cache = SQLResultCache(max_age=60)
+    assert answer(cache, handler) == 1
+    handler.version += 1
+    assert answer(cache, handler) == 2
+    assert handler.executions == 2
+    assert cache.stats()['uncacheable'] == 2 and cache.stats()['size'] == 0
+
+    # A table missing from information_schema is just as uncacheable
+    assert answer(cache, handler, "SELECT * FROM customers JOIN archive ON 1 = 1") == 2
+    assert cache.stats()['uncacheable'] == 3
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_stale_entries_are_served_while_revalidating_in_the_background(handler):
+    cache = SQLResultCache(max_age=0, stale_while_revalidate=True, handler_factory=lambda: handler)
+    assert answer(cache, handler) == 1
+    handler.write('orders', update_time='2024-01-01 00:00:01')
+
+    # The stale answer comes back at once; the background check re-runs the query
+    assert answer(cache, handler) == 1
+    assert cache.stats()['stale_hits'] == 1
+    wait_for(lambda: handler.executions == 2 and not cache._revalidating)
+
+    assert answer(cache, handler) == 2
+    wait_for(lambda: not cache._revalidating)
+    assert handler.executions == 2
+
+
+def test_without_a_handler_factory_expired_entries_are_checked_inline(handler):
+    cache = SQLResultCache(max_age=0, stale_while_revalidate=True)
+    assert answer(cache, handler) == 1
+    handler.write('orders', table_rows=11)
+    assert answer(cache, handler) == 2
+    assert cache.stats()['stale_hits'] == 0
@@ -1,7 +1,13 @@
+import re
 from pydantic import BaseModel
-from typing import List, Tuple, Union
+from typing import Any, List, Optional, Tuple, Union
 import openai
 from utilities.utils import get_text_after_last_think_tag
+from utilities.llm import create_chat_completion
+from utilities.prompts import PromptBuilder
+from utilities.schema_pruning import split_schema, widened_top_k
+from utilities.error_handling import compress_error_history
+from utilities.metrics import increment, get_counters
 import os
 from dotenv import load_dotenv
 
@@ -9,13 +15,13 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Initialize OpenAI clients with proper configuration
-error_args = {"api_key": os.getenv("API_KEY")}
+error_args = {"api_key": os.getenv("API_KEY"), "max_retries": 0}  # retried in utilities.llm
 if os.getenv("API_BASE_URL"):
     error_args["base_url"] = os.getenv("API_BASE_URL")
     
 ERROR_LLM_PROVIDER = openai.OpenAI(**error_args)
 
-main_args = {"api_key": os.getenv("API_KEY")}
+main_args = {"api_key": os.getenv("API_KEY"), "max_retries": 0}  # retried in utilities.llm
 if os.getenv("API_BASE_URL"):
     main_args["base_url"] = os.getenv("API_BASE_URL")
     
@@ -24,40 +30,119 @@ MAIN_LLM_PROVIDER = openai.OpenAI(**main_args)
 MAIN_LLM = os.getenv("MAIN_LLM", "deepseek-ai/DeepSeek-R1")  # Default model
 ERROR_LLM = os.getenv("ERROR_LLM", "deepseek-ai/DeepSeek-R1")  # Error handling model
 
+# Optional cheap, low-latency model for the first attempts at a question. Execution
+# failures and low-confidence answers escalate to MAIN_LLM/ERROR_LLM.
+FAST_LLM = os.getenv("FAST_LLM", "")
+FAST_LLM_ATTEMPTS = int(os.getenv("FAST_LLM_ATTEMPTS", "1"))
+FAST_LLM_MAX_TOKENS = int(os.getenv("FAST_LLM_MAX_TOKENS", "1500"))
 
-def get_pandas_code(
-    dataset_name: str,
-    question: str,
-    schema: str,
-    temperature: float = 0,
-    error_code: Union[Tuple[str, str], List[Tuple[str, str]], None] = None
-) -> str:
+MODEL_TIERS = ["fast", "main", "error"]
+
+# Completion token limit for a batch of questions (see get_pandas_code_batch)
+BATCH_MAX_TOKENS = int(os.getenv("BATCH_MAX_TOKENS", "16000"))
+
+
+def attempt_number(error_code: Union[Tuple[str, str], List[Tuple[str, str]], None] = None) -> int:
+    """Return how many attempts failed before this one, from the error_code argument of get_pandas_code."""
+    if not error_code:
+        return 0
+    if isinstance(error_code, tuple):
+        return 1
+    return len(error_code)
+
+
+def model_tier(error_code: Union[Tuple[str, str], List[Tuple[str, str]], None] = None) -> str:
     """
-    Generates Python code using pandas to answer a given question based on a dataset schema.
-    If error_code is provided, it attempts to fix the error(s) in the previous code.
+    Choose the model tier for an attempt.
 
-    Parameters:
-    dataset_name (str): The name of the dataset.
-    question (str): The question to be answered using the dataset.
-    schema (str): The schema of the dataset.
-    temperature (float): Temperature for LLM generation.
-    error_code (tuple or list[tuple], optional):
-        * If a single retry, a 2‑tuple (previous_code, error_message).
-        * If multiple retries, a list of such tuples ordered oldest→newest.
+    The first FAST_LLM_ATTEMPTS attempts use FAST_LLM when it is set; after that,
+    first attempts use MAIN_LLM and retries use ERROR_LLM, as without a fast model.
+    """
+    if FAST_LLM and attempt_number(error_code) < FAST_LLM_ATTEMPTS:
+        return "fast"
+    return "error" if error_code else "main"
 
-    Returns:
-    str: The generated Python code as a string.
+
+def is_low_confidence_answer(result: Any) -> bool:
+    """Check whether an answer is empty or missing, which usually means a wrong filter or column value."""
+    if result is None or (isinstance(result, str) and result.strip() in ("", "None", "nan", "[]", "{}")):
+        return True
+    if isinstance(result, float) and result != result:
+        return True
+    if isinstance(result, (list, tuple, dict, set)) and len(result) == 0:
+        return True
+    return False
+
+
+def escalation_reason(tier: str, result: Any) -> Optional[str]:
     """
-    instructions = '''The code should return a print statement with the answer to the question.
-    The code should leave the answer be and not print anything other than the variable that holds the answer.
-    Please write a single Python code block that answers the following question and prints the result in one line at the end.'''
+    Return why a fast-tier answer should be retried on the reasoning model, or None to accept it.
+
+    Parameters:
+    tier (str): The tier that generated the code (see model_tier).
+    result: The executed code's answer.
+    """
+    if tier == "fast" and is_low_confidence_answer(result):
+        increment('llm_tier.fast.escalations')
+        return f"The code ran but returned an empty answer ({result!r}); check the filters and the column values used"
+    return None
+
+
+def record_tier_outcome(tier: str, success: bool):
+    """Count an attempt, and whether its code answered the question, for the tier that generated it."""
+    increment(f'llm_tier.{tier}.attempts')
+    increment(f'llm_tier.{tier}.successes', int(success))
+
 
+def tier_stats() -> dict:
+    """Return the models and the attempts, successes and success rate of each tier."""
+    counters = get_counters()
+    models = {"fast": FAST_LLM, "main": MAIN_LLM, "error": ERROR_LLM}
+    stats = {}
+    for tier in MODEL_TIERS:
+        attempts = counters.get(f'llm_tier.{tier}.attempts', 0)
+        successes = counters.get(f'llm_tier.{tier}.successes', 0)
+        stats[tier] = {
+            'model': models[tier],
+            'attempts': attempts,
+            'successes': successes,
+            'success_rate': successes / attempts if attempts else 0.0
+        }
+    stats['escalations'] = counters.get('llm_tier.fast.escalations', 0)
+    return stats
+
+
+def tier_model(tier: str) -> Tuple[str, "openai.OpenAI"]:
+    """Return the model name and provider client of a tier."""
+    if tier == "fast":
+        return FAST_LLM, MAIN_LLM_PROVIDER
+    if tier == "error":
+        return ERROR_LLM, ERROR_LLM_PROVIDER
+    return MAIN_LLM, MAIN_LLM_PROVIDER
+
+
+UNIQUE_RULE = "If the question doesn't specifically ask for it, don't use unique() or drop_duplicates() functions."
+
+
+def asks_for_unique(question: str) -> bool:
+    """Check whether a question asks for unique/different/distinct values."""
     unique_keywords = ['unique', 'different', 'distinct']
-    if all(keyword not in question.lower() for keyword in unique_keywords):
-        instructions += '''
-        If the question doesn't specifically ask for it, don't use unique() or drop_duplicates() functions.'''
+    return any(keyword in question.lower() for keyword in unique_keywords)
 
-    instructions += '''
+
+def answer_instructions(llm: str) -> str:
+    """
+    Return the instructions for the generated code and its answer format.
+
+    They depend only on the model, so they can start every prompt to that model
+    (see PromptBuilder); question-specific rules go in the prompt's tail.
+
+    Parameters:
+    llm (str): The model the instructions are for.
+    """
+    instructions = '''The code should return a print statement with the answer to the question.
+    The code should leave the answer be and not print anything other than the variable that holds the answer.
+    Please write a single Python code block that answers the question and prints the result in one line at the end.
     If it is a Yes or No question, the answer should be a boolean.
     Do not include any explanations, comments, or additional code blocks.
     Do not print intermediate steps just the answer.
@@ -75,88 +160,166 @@ def get_pandas_code(
 
     '''
     # For GPT o models, this instruction is needed as they tend to generate overly complex code
-    if MAIN_LLM.startswith("o"):
+    if llm.startswith("o"):
         instructions += '''
     Generate the *simplest possible* pandas code that correctly answers the question. Avoid unnecessary complexity, helper functions, or overly defensive programming unless strictly required by the question's logic. Prefer direct pandas operations.
     '''
 
-    user_prompt = f'''Given the dataset schema {schema}
-                Generate a python code to answer this question: `{question}` that strictly follows the instructions below:
-                {instructions}`:'''
+    return instructions
+
 
-    user_prompt += (
-        f"The following python code made for pandas for the parquet file {dataset_name}.parquet reads the parquet file and "
-        f"running it returns the answer that is enough to answer the question `{question}`"
+def pandas_prompt(llm: str, dataset_name: str, schema: str) -> PromptBuilder:
+    """Start a pandas code prompt: the instructions for llm, then the dataset's schema."""
+    return PromptBuilder(
+        f'''Generate python code that answers a question about a dataset and strictly follows the instructions below:
+    {answer_instructions(llm)}
+    The code reads the dataset's parquet file with pandas, and running it returns the answer that is enough to answer the question.''',
+        f"Dataset: {dataset_name}.parquet\nDataset schema: {schema}"
     )
 
-    # ------------------  Error‑handling / retry specific block --------------
-    if error_code:
-        if isinstance(error_code, tuple):
-            prev_code, error_msg = error_code
-
-            user_prompt = f'''
-                    Please fix the code to properly answer the question: `{question}`
-                    Dataset schema: {schema}
-                    Follow these instructions:
-                    {instructions}
-                    The following code generated an error when executed:
-                    ```python
-                    {prev_code}
-                    ```
-                    Error: {error_msg} Solve the error and provide the corrected code '''
-            user_prompt += (
-                f"The following python code made for pandas for the parquet file {dataset_name}.parquet reads the parquet file and "
-                f"running it returns the answer that is enough to answer the question `{question}` with the error fixed"
-            )
-
-        # Handle *multiple* previous errors – new behaviour
-        elif isinstance(error_code, list):
-            # keep the *latest* attempt exactly as the single‑retry prompt
-            last_code, last_error = error_code[-1]
-
-            user_prompt = f'''
-                    Please fix the code to properly answer the question: `{question}`
-                    Dataset schema: {schema}
-                    Follow these instructions:
-                    {instructions}
-                    The following code generated an error when executed:
-                    ```python
-                    {last_code}
-                    ```
-                    Error: {last_error} Solve the error and provide the corrected code'''
-
-            # -------- Append an *extra* section enumerating earlier failures -----
-            user_prompt += "\n\nHere are earlier attempts that also failed:\n"
-            for idx, (p_code, p_err) in enumerate(error_code[:-1], start=1):
-                user_prompt += f"\nAttempt {idx}:\n{p_code}\n```\nError: {p_err}\n"
-
-            user_prompt += (
-                f"The following python code made for pandas for the parquet file {dataset_name}.parquet reads the parquet file and "
-                f"running it returns the answer that is enough to answer the question `{question}` with the error fixed"
-            )
-
-
-
-    CURRENT_LLM = ERROR_LLM if error_code else MAIN_LLM
-    CURRENT_PROVIDER = ERROR_LLM_PROVIDER if error_code else MAIN_LLM_PROVIDER
 
+def completion_arguments(llm: str, tier: str, messages: List[dict], temperature: float = 0, max_tokens: Optional[int] = None) -> dict:
+    """Return the chat.completions.create arguments for a prompt, adapted to the model family."""
     # Choose proper parameter name based on model name
-    token_param_name = "max_completion_tokens" if CURRENT_LLM.startswith("o") else "max_tokens"
-    
+    token_param_name = "max_completion_tokens" if llm.startswith("o") else "max_tokens"
+
     completion_args = {
-        "model": CURRENT_LLM,
-        "messages": [{"role": "user", "content": user_prompt}],
-        token_param_name: 5000,
+        "model": llm,
+        "messages": messages,
+        token_param_name: max_tokens or (FAST_LLM_MAX_TOKENS if tier == "fast" else 5000),
         # "seed": 42
     }
-    
+
     # Only include temperature for non-'o' models
-    if not CURRENT_LLM.startswith("o"):
+    if not llm.startswith("o"):
         completion_args["temperature"] = temperature
     else:
-        # Include reasoning_effort for 'o' models
-        completion_args["reasoning_effort"] = "high"
-    
-    chat_completion = CURRENT_PROVIDER.chat.completions.create(**completion_args)
+        # Include reasoning_effort for 'o' models; the fast tier trades depth for latency
+        completion_args["reasoning_effort"] = "low" if tier == "fast" else "high"
+    return completion_args
+
+
+def get_pandas_code(
+    dataset_name: str,
+    question: str,
+    schema: str,
+    temperature: float = 0,
+    error_code: Union[Tuple[str, str], List[Tuple[str, str]], None] = None,
+    tier: Optional[str] = None
+) -> str:
+    """
+    Generates Python code using pandas to answer a given question based on a dataset schema.
+    If error_code is provided, it attempts to fix the error(s) in the previous code.
+
+    Parameters:
+    dataset_name (str): The name of the dataset.
+    question (str): The question to be answered using the dataset.
+    schema (str): The schema of the dataset.
+    temperature (float): Temperature for LLM generation.
+    error_code (tuple or list[tuple], optional):
+        * If a single retry, a 2‑tuple (previous_code, error_message).
+        * If multiple retries, a list of such tuples ordered oldest→newest.
+    tier (str, optional): The model tier to use ("fast", "main" or "error");
+        chosen with model_tier(error_code) when not given.
+
+    Returns:
+    str: The generated Python code as a string.
+    """
+    tier = tier or model_tier(error_code)
+    CURRENT_LLM, CURRENT_PROVIDER = tier_model(tier)
+
+    # Only the columns most relevant to the question, widened after missing-column errors
+    attempts = [] if not error_code else [error_code] if isinstance(error_code, tuple) else list(error_code)
+    schema, column_details = split_schema(schema, question, widened_top_k(error_msg for _, error_msg in attempts))
+
+    prompt = pandas_prompt(CURRENT_LLM, dataset_name, schema)
+    if column_details:
+        # After the cached prefix, since the columns chosen depend on the question
+        prompt.add(f"Details of the columns most relevant to the question:\n{column_details}")
+    if not asks_for_unique(question):
+        prompt.add(UNIQUE_RULE)
+
+    # ------------------  Error‑handling / retry specific block --------------
+    if error_code:
+        # The latest code is shown in full; earlier attempts are reduced to their
+        # error and diff, within RETRY_CONTEXT_MAX_TOKENS
+        earlier_attempts, last_code, last_error = compress_error_history(attempts)
+        if earlier_attempts:
+            prompt.add(earlier_attempts, optional=True)
+        prompt.add(f'''The following code generated an error when executed:
+```python
+{last_code}
+```
+Error: {last_error}
+Solve the error and provide the corrected code that answers the question: `{question}`''')
+    else:
+        prompt.add(f"Generate a python code to answer this question: `{question}`")
+
+    completion_args = completion_arguments(CURRENT_LLM, tier, prompt.messages(), temperature)
+    chat_completion = create_chat_completion(CURRENT_PROVIDER, **completion_args)
     to_return = get_text_after_last_think_tag(chat_completion.choices[0].message.content)
     return to_return
+
+
+def get_pandas_code_batch(
+    dataset_name: str,
+    questions: List[str],
+    schema: str,
+    temperature: float = 0,
+    tier: Optional[str] = None
+) -> List[Optional[str]]:
+    """
+    Generates pandas code for several questions about one dataset in a single LLM call,
+    so the schema is sent once instead of once per question.
+
+    Parameters:
+    dataset_name (str): The name of the dataset.
+    questions (list[str]): The questions to be answered using the dataset.
+    schema (str): The schema of the dataset.
+    temperature (float): Temperature for LLM generation.
+    tier (str, optional): The model tier to use; chosen with model_tier() when not given.
+
+    Returns:
+    list: The generated code for each question, in order, as a ```python block; None
+    for questions whose code block is missing from the response.
+    """
+    tier = tier or model_tier()
+    CURRENT_LLM, CURRENT_PROVIDER = tier_model(tier)
+    numbered_questions = "\n".join(f"Question {i}: `{question}`" for i, question in enumerate(questions, start=1))
+    prompt = pandas_prompt(CURRENT_LLM, dataset_name, schema)
+    prompt.add(
+        "Write separate code for each of the following questions, each following the instructions on its own. "
+        "If a question doesn't specifically ask for unique, different or distinct values, don't use unique() or drop_duplicates() functions in its code.\n"
+        "For every question, write a line `Answer <question number>:` followed by a single Python code block, and nothing else.\n\n"
+        + numbered_questions
+    )
+
+    completion_args = completion_arguments(CURRENT_LLM, tier, prompt.messages(), temperature,
+                                           max_tokens=min(BATCH_MAX_TOKENS, 5000 * len(questions)))
+    chat_completion = create_chat_completion(CURRENT_PROVIDER, **completion_args)
+    increment('llm.batch_calls')
+    increment('llm.batch_questions', len(questions))
+
+    codes = split_batch_response(get_text_after_last_think_tag(chat_completion.choices[0].message.content), len(questions))
+    increment('llm.batch_missing_blocks', codes.count(None))
+    return codes
+
+
+def split_batch_response(response: str, count: int) -> List[Optional[str]]:
+    """
+    Split a batched response into one ```python block per question.
+
+    Blocks are matched to questions by their `Answer <n>:` labels; when the labels
+    are missing but there are exactly count blocks, they are taken in order.
+    """
+    codes = [None] * count
+    labeled = re.findall(r"Answer\s*(\d+)\s*:?[^\n`]*\n?\s*```(?:python)?\s*\n(.*?)```", response, flags=re.DOTALL)
+    for number, code in labeled:
+        index = int(number) - 1
+        if 0 <= index < count and codes[index] is None:
+            codes[index] = f"```python\n{code.strip()}\n```"
+    if not labeled:
+        blocks = re.findall(r"```(?:python)?\s*\n(.*?)```", response, flags=re.DOTALL)
+        if len(blocks) == count:
+            codes = [f"```python\n{code.strip()}\n```" for code in blocks]
+    return codes
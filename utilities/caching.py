@@ -0,0 +1,305 @@
+"""
+Caching helpers
+Provides a thread-safe LRU cache, a result cache for generated SQL queries and
+single-flight coalescing of identical concurrent requests.
+"""
+
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+import pandas as pd
+
+
+class LRUCache:
+    """Thread-safe, size-bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max(1, max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for key (marking it recently used) or default."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any):
+        """Store value under key, evicting the oldest entries beyond max_entries."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove key from the cache and return its value."""
+        with self._lock:
+            return self._entries.pop(key, default)
+
+    def items(self) -> List[tuple]:
+        """Return the (key, value) pairs, oldest first, without touching recency or counters."""
+        with self._lock:
+            return list(self._entries.items())
+
+    def clear(self):
+        """Drop every entry (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss/eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Normalize SQL text for use as a cache key.
+
+    Collapses whitespace outside of quoted literals/identifiers and drops
+    trailing semicolons, so formatting differences map to the same entry.
+    """
+    parts = re.split(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)""", query.strip())
+    normalized = []
+    for i, part in enumerate(parts):
+        # Odd indexes are the quoted pieces captured by the split
+        normalized.append(part if i % 2 else re.sub(r'\s+', ' ', part))
+    return ''.join(normalized).strip().rstrip(';').strip()
+
+
+def referenced_tables(query: str) -> List[str]:
+    """Return the table names that follow FROM/JOIN in a SQL query."""
+    matches = re.findall(r'\b(?:from|join)\s+`?([\w$]+)`?(?:\s*\.\s*`?([\w$]+)`?)?', query, flags=re.IGNORECASE)
+    # For `db`.`table` references keep the table part
+    return sorted({second or first for first, second in matches})
+
+
+class _CachedResult:
+    """A cached query result together with the table markers it was computed from."""
+
+    def __init__(self, df: pd.DataFrame, markers: Dict[str, Any]):
+        self.df = df
+        self.markers = markers
+        self.checked_at = time.monotonic()
+
+
+class SQLResultCache:
+    """
+    Cache generated-SQL results keyed on database + normalized query text.
+
+    An entry stays valid while the change markers (UPDATE_TIME and row count) of
+    every table it reads are unchanged. Markers are re-checked at most once per
+    max_age seconds; within that window hits skip MySQL entirely. With
+    stale_while_revalidate, expired entries are still served immediately while a
+    background thread re-checks them.
+
+    Results reading a table without a marker (no UPDATE_TIME) are never cached.
+    UPDATE_TIME only has one-second granularity, so a write landing in the same
+    second as the one an entry was computed after is missed, and that entry is
+    served stale until the table changes again (see get_table_change_markers).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        max_age: float = 5.0,
+        stale_while_revalidate: bool = False,
+        handler_factory: Optional[Callable[[], Any]] = None
+    ):
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate
+        self.handler_factory = handler_factory
+        self._cache = LRUCache(max_entries)
+        self._lock = threading.Lock()
+        self._revalidating = set()
+        self.marker_checks = 0
+        self.stale_hits = 0
+        self.uncacheable = 0
+
+    def execute(self, handler, query: str, tables: List[str], limit: int = 100) -> pd.DataFrame:
+        """
+        Return the result of handler.execute_query(query, limit), from cache when valid.
+
+        Parameters:
+        handler: A connected MySQLHandler.
+        query (str): The SQL query to run.
+        tables (List[str]): Tables the query reads (tables named in FROM/JOIN are added).
+        limit (int): Row limit passed to execute_query.
+
+        Returns:
+        pd.DataFrame: The query result (a copy; callers may modify it).
+        """
+        key = (handler.current_database, normalize_sql(query), limit)
+        tables = sorted(set(tables) | set(referenced_tables(query)))
+        entry = self._cache.get(key)
+
+        if entry is not None:
+            if time.monotonic() - entry.checked_at < self.max_age:
+                return entry.df.copy()
+            if self.stale_while_revalidate and self.handler_factory:
+                self.stale_hits += 1
+                self._revalidate_in_background(key, query, tables, limit)
+                return entry.df.copy()
+
+        return self._refresh(handler, key, query, tables, limit, entry).copy()
+
+    def _refresh(self, handler, key, query: str, tables: List[str], limit: int, entry: Optional[_CachedResult]) -> pd.DataFrame:
+        """Re-check table markers and re-run the query only if they changed."""
+        markers = handler.get_table_change_markers(tables)
+        with self._lock:
+            self.marker_checks += 1
+        if any(marker is None for marker in markers.values()):
+            # Changes to these tables cannot be detected, so the result is not kept
+            with self._lock:
+                self.uncacheable += 1
+            self._cache.pop(key)
+            return handler.execute_query(query, limit)
+        if entry is not None and entry.markers == markers:
+            entry.checked_at = time.monotonic()
+            return entry.df
+
+        df = handler.execute_query(query, limit)
+        self._cache.put(key, _CachedResult(df, markers))
+        return df
+
+    def _revalidate_in_background(self, key, query: str, tables: List[str], limit: int):
+        """Start a background revalidation of key unless one is already running."""
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        def revalidate():
+            handler = None
+            try:
+                handler = self.handler_factory()
+                handler.connect_to_database(key[0])
+                self._refresh(handler, key, query, tables, limit, self._cache.get(key))
+            except Exception:
+                # A failed revalidation leaves the stale entry for the next request to retry
+                pass
+            finally:
+                if handler is not None:
+                    handler.close_connection()
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        threading.Thread(target=revalidate, daemon=True).start()
+
+    def clear(self):
+        """Drop every cached result."""
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters."""
+        stats = self._cache.stats()
+        stats.update({
+            'marker_checks': self.marker_checks,
+            'stale_hits': self.stale_hits,
+            'uncacheable': self.uncacheable,
+            'max_age': self.max_age,
+            'stale_while_revalidate': self.stale_while_revalidate
+        })
+        return stats
+
+
+class _Flight:
+    """An in-flight execution and the number of callers waiting on it."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical requests into a single execution.
+
+    The first caller for a key starts the work; callers arriving with the same key
+    while it runs await the same result (or exception) instead of starting their
+    own. The work runs as its own task, so a caller that disconnects does not cancel
+    it for the others. Must be used from a single event loop.
+    """
+
+    # Fan-out sizes counted individually up to this; larger ones share one bucket
+    MAX_FAN_OUT_BUCKET = 16
+
+    def __init__(self):
+        self._flights = {}
+        # Number of finished flights per fan-out (callers served by one execution)
+        self._fan_out = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.max_fan_out = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the result of factory(), shared with concurrent calls for the same key.
+
+        Parameters:
+        key: Identifies identical requests (e.g. dataset and normalized question).
+        factory: Called with no arguments to start the work; returns an awaitable.
+        """
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            self.executions += 1
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        return await asyncio.shield(flight.task)
+
+    def _finish(self, key: Hashable, flight: _Flight):
+        """Forget a finished flight and record how many callers it served."""
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            flight.task.exception()
+        self.max_fan_out = max(self.max_fan_out, flight.waiters)
+        bucket = str(flight.waiters) if flight.waiters < self.MAX_FAN_OUT_BUCKET else f"{self.MAX_FAN_OUT_BUCKET}+"
+        self._fan_out[bucket] = self._fan_out.get(bucket, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return coalescing counters and how many executions served 1, 2, ... callers."""
+        return {
+            'in_flight': len(self._flights),
+            'calls': self.calls,
+            'executions': self.executions,
+            'coalesced': self.coalesced,
+            'max_fan_out': self.max_fan_out,
+            'fan_out_counts': dict(self._fan_out)
+        }
@@ -1,10 +1,386 @@
 import io
+import os
 import ast
+import sys
+import copy
+import math
+import hashlib
+import builtins
+import importlib
+import threading
+import types
 import numpy as np
 import pandas as pd
-from contextlib import redirect_stdout
+from contextlib import contextmanager
 from tqdm import tqdm
 from .code_processing import clean_pandas_code, modify_dataset_paths
+from .data_loading import read_parquet_filtered
+from .dataset_catalog import load_dataset, dataset_fingerprint
+from .caching import LRUCache
+from .metrics import increment, register_stats, timed
+
+
+class _ThreadLocalStdout:
+    """
+    sys.stdout replacement that sends each thread's output to its own buffer.
+
+    Threads inside capture_stdout() write to their capture buffer; every other
+    thread writes to the stdout that was in place when the proxy was installed.
+    Unlike contextlib.redirect_stdout, concurrent captures do not interfere.
+    """
+
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    def _target(self):
+        buffer = getattr(self.local, 'buffer', None)
+        return self.default if buffer is None else buffer
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
+_stdout_proxy = _ThreadLocalStdout(sys.stdout)
+_stdout_lock = threading.Lock()
+
+
+@contextmanager
+def capture_stdout(buffer):
+    """Send what the current thread prints to buffer (thread-safe redirect_stdout)."""
+    with _stdout_lock:
+        # (Re)install the proxy if something else replaced sys.stdout since
+        if sys.stdout is not _stdout_proxy:
+            _stdout_proxy.default = sys.stdout
+            sys.stdout = _stdout_proxy
+    previous = getattr(_stdout_proxy.local, 'buffer', None)
+    _stdout_proxy.local.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        _stdout_proxy.local.buffer = previous
+
+
+# Answers with more items than this are cut to this many items
+EXEC_RESULT_MAX_ITEMS = int(os.getenv("EXEC_RESULT_MAX_ITEMS", "100000"))
+# Added to a cut answer (as its last item, or under the key '...') so the cut is visible
+EXEC_RESULT_TRUNCATED_NOTE = "... ({} more items truncated)"
+# Printed output longer than this is returned as text instead of being evaluated
+EXEC_EVAL_MAX_CHARS = int(os.getenv("EXEC_EVAL_MAX_CHARS", "1000000"))
+
+_NO_RESULT = object()
+
+# Compiled code objects, keyed by source hash
+COMPILE_CACHE_MAX_ENTRIES = int(os.getenv("COMPILE_CACHE_MAX_ENTRIES", "512"))
+# Optional memo of results of deterministic code that only reads datasets
+EXEC_RESULT_CACHE = os.getenv("EXEC_RESULT_CACHE", "false").lower() == "true"
+EXEC_RESULT_CACHE_MAX_ENTRIES = int(os.getenv("EXEC_RESULT_CACHE_MAX_ENTRIES", "256"))
+
+_compiled_code = LRUCache(COMPILE_CACHE_MAX_ENTRIES)
+_result_memo = LRUCache(EXEC_RESULT_CACHE_MAX_ENTRIES)
+register_stats('compile_cache', _compiled_code.stats)
+register_stats('exec_result_cache', lambda: dict(_result_memo.stats(), enabled=EXEC_RESULT_CACHE))
+
+# Modules generated code may import. They are imported once here, so executions never
+# pay for a cold import; optional ones that are not installed are left out.
+EXEC_ALLOWED_MODULES = [
+    'pandas', 'numpy', 'datetime', 're', 'math', 'collections', 'statistics', 'itertools',
+    'functools', 'operator', 'json', 'string', 'decimal', 'fractions', 'random', 'time',
+    'calendar', 'typing', 'ast', 'copy', 'heapq', 'bisect', 'difflib', 'unicodedata',
+    'textwrap', 'warnings', 'dateutil', 'pytz', 'scipy', 'scipy.stats'
+] + [name.strip() for name in os.getenv("EXEC_EXTRA_MODULES", "").split(",") if name.strip()]
+
+# The only parts of os that generated code gets: path helpers for building dataset paths
+_OS_PATH_FUNCTIONS = ('join', 'basename', 'dirname', 'split', 'splitext', 'normpath', 'abspath',
+                      'exists', 'isfile', 'isdir', 'getsize')
+
+
+def _os_shim():
+    """Return a stand-in for the os module with only os.sep and the _OS_PATH_FUNCTIONS of os.path."""
+    path = types.ModuleType('os.path')
+    for name in _OS_PATH_FUNCTIONS:
+        setattr(path, name, getattr(os.path, name))
+    path.sep = os.sep
+    shim = types.ModuleType('os')
+    shim.path = path
+    shim.sep = os.sep
+    return shim
+
+
+_modules = {}
+for _module_name in EXEC_ALLOWED_MODULES:
+    try:
+        _modules[_module_name] = importlib.import_module(_module_name)
+    except ImportError:
+        pass
+_modules['os'] = _os_shim()
+_modules['os.path'] = _modules['os'].path
+_allowed_packages = {name.split('.')[0] for name in _modules}
+
+
+def _check_module(module_name):
+    """Raise ImportError for modules outside the execution whitelist."""
+    if module_name.split('.')[0] not in _allowed_packages:
+        raise ImportError(
+            f"Module '{module_name}' is not available; allowed modules: {', '.join(sorted(_allowed_packages))}"
+        )
+
+
+def _guarded_import(name, globals=None, locals=None, fromlist=(), level=0):
+    """__import__ for executed code that only allows whitelisted modules (and the os shim)."""
+    if level != 0:
+        raise ImportError("Relative imports are not available")
+    _check_module(name)
+    if name == 'os' or name == 'os.path':
+        # "import os.path" binds os; "from os.path import join" needs os.path itself
+        return _modules[name] if fromlist else _modules['os']
+    return builtins.__import__(name, globals, locals, fromlist, level)
+
+
+# Template globals copied for every execution. load_dataset and read_parquet_filtered
+# are used by reads rewritten in modify_dataset_paths. Builtins that touch files or
+# the console directly are left out (datasets are read through pandas).
+_REMOVED_BUILTINS = ('open', 'input', 'breakpoint', 'exit', 'quit')
+_exec_builtins = {name: value for name, value in builtins.__dict__.items() if name not in _REMOVED_BUILTINS}
+_exec_builtins['__import__'] = _guarded_import
+_TEMPLATE_GLOBALS = {
+    "__builtins__": _exec_builtins, "np": np, "pd": pd, "ast": ast,
+    "load_dataset": load_dataset, "read_parquet_filtered": read_parquet_filtered
+}
+
+# Names whose use makes a result depend on more than the code and the datasets it reads
+_NONDETERMINISTIC_NAMES = {
+    'random', 'time', 'datetime', 'now', 'today', 'sample', 'shuffle', 'permutation', 'uuid',
+    'os', 'sys', 'open', 'input', 'eval', 'exec', '__import__', 'globals', 'locals',
+    'requests', 'urllib', 'subprocess', 'socket'
+}
+# Callables whose first argument is a dataset file read by the code
+_DATASET_READERS = {'load_dataset', 'read_parquet_filtered', 'read_parquet', 'read_csv', 'read_json', 'read_excel'}
+
+
+class _PreparedCode:
+    """
+    Generated code compiled for execution, with the names its imports bind and the
+    datasets it reads if it is memoizable.
+    """
+
+    def __init__(self, key, compiled, imports, dataset_paths):
+        self.key = key
+        self.compiled = compiled
+        self.imports = imports
+        self.dataset_paths = dataset_paths
+
+
+def _answer_final_print(code):
+    """
+    Rewrite a final top-level `print(x)` into `answer(x)`.
+
+    The value then reaches capture_exec_output as a Python object instead of text
+    that has to be parsed back. Code that shadows print or already uses the name
+    answer is left unchanged.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code
+    if not tree.body:
+        return code
+    last = tree.body[-1]
+    if not (isinstance(last, ast.Expr) and isinstance(last.value, ast.Call)
+            and isinstance(last.value.func, ast.Name) and last.value.func.id == 'print'
+            and len(last.value.args) == 1 and not last.value.keywords
+            and not isinstance(last.value.args[0], ast.Starred)):
+        return code
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and (node.id == 'answer' or node.id == 'print' and not isinstance(node.ctx, ast.Load)):
+            return code
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and node.name in ('print', 'answer'):
+            return code
+        if isinstance(node, (ast.Import, ast.ImportFrom)) and any((alias.asname or alias.name) in ('print', 'answer') for alias in node.names):
+            return code
+
+    # Only the name token changes, so line numbers in tracebacks stay the same
+    lines = code.splitlines(keepends=True)
+    func = last.value.func
+    line = lines[func.lineno - 1].encode('utf-8')
+    lines[func.lineno - 1] = (line[:func.col_offset] + b'answer' + line[func.end_col_offset:]).decode('utf-8')
+    return ''.join(lines)
+
+
+def _memoizable_dataset_paths(tree):
+    """
+    Return the dataset files the code reads, or None if its result cannot be memoized.
+
+    Memoizable code reads datasets only through reader calls with literal paths and
+    uses nothing that can change between runs (randomness, clocks, files, the OS).
+    """
+    paths = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in _NONDETERMINISTIC_NAMES:
+            return None
+        if isinstance(node, ast.Attribute) and node.attr in _NONDETERMINISTIC_NAMES:
+            return None
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            names = [alias.name for alias in node.names] + [getattr(node, 'module', None) or '']
+            if any(name.split('.')[0] in _NONDETERMINISTIC_NAMES for name in names):
+                return None
+        if isinstance(node, ast.Call):
+            func = node.func
+            name = func.id if isinstance(func, ast.Name) else func.attr if isinstance(func, ast.Attribute) else None
+            if name in _DATASET_READERS:
+                if not (node.args and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)):
+                    return None
+                paths.append(node.args[0].value)
+    return sorted(set(paths))
+
+
+def _import_bindings(tree):
+    """
+    Return (name, module, attribute) for every name bound by an import in the code.
+
+    Raises ImportError for modules outside the whitelist, before anything runs.
+    """
+    bindings = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                _check_module(alias.name)
+                if alias.asname:
+                    bindings.append((alias.asname, alias.name, None))
+                else:
+                    top_level = alias.name.split('.')[0]
+                    bindings.append((top_level, top_level, None))
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            _check_module(node.module)
+            for alias in node.names:
+                if alias.name != '*':
+                    bindings.append((alias.asname or alias.name, node.module, alias.name))
+    return bindings
+
+
+def _resolve_import(module_name, attribute):
+    """Look up an imported module or name, importing only whitelisted modules that were not preloaded."""
+    _check_module(module_name)
+    module = _modules.get(module_name) or importlib.import_module(module_name)
+    if attribute is None:
+        return module
+    try:
+        return getattr(module, attribute)
+    except AttributeError:
+        # from package import submodule
+        return importlib.import_module(f"{module_name}.{attribute}")
+
+
+def _prepare_code(code):
+    """Compile code for execution, reusing the compiled object for code seen before."""
+    key = hashlib.sha256(code.encode('utf-8')).hexdigest()
+    prepared = _compiled_code.get(key)
+    if prepared is None:
+        code = _answer_final_print(code)
+        compiled = compile(code, '<string>', 'exec')
+        tree = ast.parse(code)
+        prepared = _PreparedCode(key, compiled, _import_bindings(tree), _memoizable_dataset_paths(tree))
+        _compiled_code.put(key, prepared)
+    return prepared
+
+
+def _result_memo_key(prepared):
+    """Key the result of prepared code by its hash and the content of the datasets it reads."""
+    if not EXEC_RESULT_CACHE or prepared.dataset_paths is None:
+        return None
+    try:
+        return (prepared.key, tuple(dataset_fingerprint(path) for path in prepared.dataset_paths))
+    except OSError:
+        return None
+
+
+def _round_trips(value, depth=0):
+    """Check that eval(str(value)) would give value back, as the printed-output path does."""
+    if value is None or isinstance(value, (str, bool, int, np.bool_, np.integer)):
+        return True
+    if isinstance(value, np.floating) and value.dtype.itemsize < 8:
+        # Printed as 0.1, which evaluates to a different (double) value
+        return False
+    if isinstance(value, (float, np.floating)):
+        return math.isfinite(value)
+    if depth > 20:
+        return False
+    if isinstance(value, (list, tuple, set)):
+        return all(_round_trips(item, depth + 1) for item in value)
+    if isinstance(value, dict):
+        return all(_round_trips(k, depth + 1) and _round_trips(v, depth + 1) for k, v in value.items())
+    return False
+
+
+def _array_to_list(array):
+    """
+    Convert a NumPy array to a list, with datetimes and timedeltas as Timestamps and
+    Timedeltas, and float32/float16 values as the floats they print as.
+    """
+    if array.dtype.kind in 'Mm':
+        # tolist() would give nanosecond values as plain integers
+        return pd.Series(array.ravel()).to_numpy(dtype=object).reshape(array.shape).tolist()
+    if array.dtype.kind == 'f' and array.dtype.itemsize < 8:
+        # tolist() would widen them, exposing the binary error (0.1 -> 0.10000000149011612)
+        return array.astype(str).astype(np.float64).tolist()
+    return array.tolist()
+
+
+def _truncate_result(value, size=None):
+    """
+    Cut a list, tuple, set or dict to EXEC_RESULT_MAX_ITEMS items, noting how many were
+    dropped. size is the length of the original answer if value was already cut from it.
+    """
+    dropped = (len(value) if size is None else size) - EXEC_RESULT_MAX_ITEMS
+    if dropped <= 0:
+        return value
+    increment('exec_results_truncated')
+    note = EXEC_RESULT_TRUNCATED_NOTE.format(dropped)
+    if isinstance(value, dict):
+        truncated = dict(list(value.items())[:EXEC_RESULT_MAX_ITEMS])
+        truncated['...'] = note
+        return truncated
+    if isinstance(value, set):
+        return set(list(value)[:EXEC_RESULT_MAX_ITEMS]) | {note}
+    return type(value)(list(value[:EXEC_RESULT_MAX_ITEMS]) + [note])
+
+
+def _native_result(value):
+    """
+    Return an answer value as capture_exec_output's result, or _NO_RESULT.
+
+    Values whose printed form evaluates back to the same value (numbers, strings
+    that are not literals themselves, containers of those) are returned directly,
+    cut to EXEC_RESULT_MAX_ITEMS items with a note saying how many were dropped;
+    NumPy arrays become lists. Anything else (DataFrames, NaN, Timestamps,
+    datetime64 arrays, strings such as '42') gives _NO_RESULT and goes through the
+    printed-text path, so the result is the same as before.
+    """
+    if isinstance(value, (np.ndarray, np.generic)) and value.dtype.kind in 'Mm':
+        # tolist()/item() turn nanosecond datetimes and timedeltas into plain integers
+        return _NO_RESULT
+    if isinstance(value, np.ndarray) and value.ndim:
+        # Only the items that are kept are converted
+        items = _array_to_list(value[:EXEC_RESULT_MAX_ITEMS])
+        return _truncate_result(items, len(value)) if _round_trips(items) else _NO_RESULT
+    if isinstance(value, np.ndarray):
+        value = value[()]
+    if isinstance(value, np.floating):
+        # At the precision it prints with, not widened to a double
+        value = float(str(value))
+    elif isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, str) or not _round_trips(value):
+        return _NO_RESULT
+    if isinstance(value, (list, tuple, set, dict)):
+        return _truncate_result(value)
+    return value
 
 
 def capture_exec_output(code):
@@ -12,84 +388,105 @@ def capture_exec_output(code):
     Execute code and return its output in its original format. If no output,
     return 'None'. If an error occurs, return the exception.
 
-    Dynamically extracts imports from the code and includes them in the execution context.
+    The code runs in a copy of a template environment with the whitelisted modules
+    preloaded (EXEC_ALLOWED_MODULES); imports of other modules are rejected.
+    The value passed to answer() (a final print(x) is rewritten into answer(x)) is
+    returned as the Python object itself when that gives the same result as
+    printing and evaluating it; otherwise the printed output is evaluated.
     """
+    result, error = run_code(code)
+    if error is not None:
+        return "Error :" + str(error)  # Return exception as a string
+    return result
 
-    def extract_imports(code):
-        """
-        Extract all imported modules and objects from the given code.
-        Returns a dictionary of imported modules and their names.
-        If an error occurs during parsing, returns an empty dictionary.
-        """
-        try:
-            tree = ast.parse(code)
-            imports = {}
-
-            for node in ast.walk(tree):
-                # Handle `import` statements
-                if isinstance(node, ast.Import):
-                    for alias in node.names:
-                        module_name = alias.name
-                        as_name = alias.asname or alias.name
-                        imports[as_name] = __import__(module_name)
-
-                # Handle `from ... import ...` statements
-                elif isinstance(node, ast.ImportFrom):
-                    module_name = node.module
-                    for alias in node.names:
-                        name = alias.name
-                        as_name = alias.asname or alias.name
-                        if module_name:
-                            full_name = f"{module_name}.{name}"
-                            imports[as_name] = __import__(module_name, fromlist=[name]).__dict__[name]
-
-            return imports
-        except Exception:
-            # Return empty dictionary if any error occurs during import extraction
-            return {}
 
-    # Extract imports from the code
-    dynamic_imports = extract_imports(code)
+@timed('execution')
+def run_code(code):
+    """
+    Execute code like capture_exec_output, but report failures as the exception itself.
 
-    # Prepare the execution environment with built-ins and dynamic imports
-    execution_globals = {"__builtins__": __builtins__, "np": np, "pd": pd, "ast": ast}
-    execution_globals.update(dynamic_imports)
+    Returns:
+        Tuple: (result, None) on success, (None, exception) if the code failed.
+    """
+    increment('code_executions')
+    try:
+        prepared = _prepare_code(code)
+    except Exception as e:
+        return None, e
+
+    memo_key = _result_memo_key(prepared)
+    if memo_key is not None:
+        cached = _result_memo.get(memo_key, _NO_RESULT)
+        if cached is not _NO_RESULT:
+            return copy.deepcopy(cached), None
+
+    # Copy the template environment and bind the code's imports in it, so functions
+    # and comprehensions in the code can see them
+    execution_globals = dict(_TEMPLATE_GLOBALS)
+    for name, module_name, attribute in prepared.imports:
+        try:
+            execution_globals[name] = _resolve_import(module_name, attribute)
+        except (ImportError, AttributeError):
+            # The import statement itself reports the error when the code runs
+            pass
+
+    # Result channel: answer(x) records x
+    answers = []
+    execution_globals["answer"] = answers.append
 
-    f = io.StringIO()
     try:
-        local_vars = {}
-        with redirect_stdout(f):
-            exec(code, execution_globals, local_vars)
-
-        # Check if there are any local variables
-        if local_vars:
-            # Get the last defined variable
-            last_var = list(local_vars.values())[-1]
-            if isinstance(last_var, np.ndarray):
-                return last_var.tolist()  # Convert NumPy array to Python list
-
-        # If last variable is not a NumPy ndarray, proceed to capture stdout
-        output = f.getvalue().strip()
-
-        # If there's stdout output, return it
-        if output:
-            try:
-                eval_output = eval(output)
-                if isinstance(eval_output, np.ndarray):
-                    return eval_output.tolist()  # Convert NumPy array to Python list
-                return eval_output
-            except Exception:
-                return output  # If not evaluatable, return raw output
-        # If no stdout, check for the last variable again (in case it's not ndarray)
-        elif local_vars:
-            last_var = list(local_vars.values())[-1]
-            if isinstance(last_var, np.ndarray):
-                return last_var.tolist()  # Convert NumPy array to Python list
-            return last_var
-        else:
-            return 'None'  # No output, no variables
+        result = _run_prepared(prepared, execution_globals, answers)
     except Exception as e:
-        return "Error :" + str(e)  # Return exception as a string
+        return None, e
+    if memo_key is not None:
+        _result_memo.put(memo_key, copy.deepcopy(result))
+    return result, None
+
+
+def _run_prepared(prepared, execution_globals, answers):
+    """Execute prepared code and turn what it printed or answered into the result (exceptions propagate)."""
+    f = io.StringIO()
+    local_vars = {}
+    with capture_stdout(f):
+        exec(prepared.compiled, execution_globals, local_vars)
+
+    # Check if there are any local variables
+    if local_vars:
+        # Get the last defined variable
+        last_var = list(local_vars.values())[-1]
+        if isinstance(last_var, np.ndarray):
+            return _array_to_list(last_var)  # Convert NumPy array to Python list
+
+    # If last variable is not a NumPy ndarray, proceed to capture stdout
+    output = f.getvalue()
+    if answers:
+        if not output.strip():
+            result = _native_result(answers[-1])
+            if result is not _NO_RESULT:
+                return result
+        # Same text the final print would have written
+        output += str(answers[-1]) + "\n"
+    output = output.strip()
+
+    # If there's stdout output, return it
+    if output:
+        if len(output) > EXEC_EVAL_MAX_CHARS:
+            return output  # Too large to evaluate safely
+        try:
+            eval_output = eval(output)
+            if isinstance(eval_output, np.ndarray):
+                return eval_output.tolist()  # Convert NumPy array to Python list
+            return eval_output
+        except Exception:
+            return output  # If not evaluatable, return raw output
+    # If no stdout, check for the last variable again (in case it's not ndarray)
+    elif local_vars:
+        last_var = list(local_vars.values())[-1]
+        if isinstance(last_var, np.ndarray):
+            return _array_to_list(last_var)  # Convert NumPy array to Python list
+        return last_var
+    else:
+        return 'None'  # No output, no variables
 
 
 def convert_types(obj):
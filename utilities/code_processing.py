@@ -1,37 +1,58 @@
 import re
 import os
-from typing import Tuple
+import ast
+import pandas as pd
+import pyarrow.parquet as pq
+from typing import Tuple, Optional, Set, Dict, List
+from .dataset_catalog import DatasetCatalog, SUPPORTED_EXTENSIONS, SAMPLE_FOLDER, get_catalog
+from .metrics import timed
 
 
-SUPPORTED_EXTENSIONS = [
-    ('.parquet', 'read_parquet'),
-    ('.csv', 'read_csv'),
-    ('.json', 'read_json'),
-    ('.xlsx', 'read_excel')
-]
+# Keyword names the pandas readers use for the file path
+_PATH_KEYWORDS = ('path', 'filepath_or_buffer', 'path_or_buf', 'io')
 
 
-def _find_dataset_file(dataset_name: str, dataset_folder_path: str) -> Tuple[str, str]:
-    """Return (file_path, pandas_reader) for the first supported extension that exists."""
-    for ext, reader in SUPPORTED_EXTENSIONS:
-        potential_file = os.path.join(dataset_folder_path, f"{dataset_name}{ext}")
-        if os.path.exists(potential_file):
-            return potential_file, reader
-    return None, None
+def modify_dataset_paths(code, dataset_folder_path="datasets/", is_sample=False, project_columns=True, push_filters=True,
+                         use_catalog=True):
+    """
+    Point the pandas reads in the code at the actual dataset files.
+
+    Every pd.read_* call whose path can be determined statically is resolved against
+    the dataset catalog (see resolve_dataset_reads). With project_columns, parquet reads
+    are then restricted to the columns the code uses; with use_catalog, reads of datasets
+    small enough to keep in memory are served from the catalog; and with push_filters,
+    the remaining parquet reads that are immediately filtered skip the rows that cannot
+    match. Code that does not parse falls back to the regex-based rewrite.
+    With is_sample, reads go to the dataset samples (see ensure_dataset_sample) instead.
+    """
+    if is_sample:
+        dataset_folder_path = os.path.join(dataset_folder_path, SAMPLE_FOLDER)
+    catalog = get_catalog(dataset_folder_path)
+    resolved = resolve_dataset_reads(code, catalog)
+    if resolved is None:
+        return _modify_dataset_paths_regex(code, catalog)
+    code = resolved
+
+    if project_columns:
+        code = push_down_columns(code)
+    if use_catalog:
+        code = use_cached_datasets(code, catalog)
+    if push_filters:
+        code = push_down_filters(code)
+
+    return code
 
 
-def modify_dataset_paths(code, dataset_folder_path="datasets/", is_sample=False):
-    """Modifies pandas read paths in the code to prepend a fixed path and adjust file extensions if needed."""
-    dataset_folder_path = dataset_folder_path.rstrip("/\\") + "/"
+def _modify_dataset_paths_regex(code, catalog: DatasetCatalog):
+    """Prepend the dataset folder to simple pd.read_* calls (for code that does not parse)."""
+    dataset_folder_path = catalog.dataset_folder_path
 
     def replace_parquet(match):
         """Replace pd.read_parquet calls with correct reader/path based on existing dataset file."""
         # Extract provided path inside the read_parquet call
         original_path = match.group(1)  # e.g., "my_file.parquet" or "subdir/my_file.parquet"
-        # Get the base filename without directory and extension
-        dataset_name = os.path.splitext(os.path.basename(original_path))[0]
 
-        file_path, reader = _find_dataset_file(dataset_name, dataset_folder_path)
+        file_path, reader = catalog.resolve(original_path)
         if file_path and reader:
             # Build replacement string
             if reader == 'read_excel':
@@ -57,6 +78,738 @@ def modify_dataset_paths(code, dataset_folder_path="datasets/", is_sample=False)
     return code
 
 
+def _string_constants(tree: ast.Module) -> Dict[str, str]:
+    """Return the names bound exactly once, at the top level, to a static string."""
+    stores = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            stores[node.id] = stores.get(node.id, 0) + 1
+    constants = {}
+    for statement in tree.body:
+        if (isinstance(statement, ast.Assign) and len(statement.targets) == 1
+                and isinstance(statement.targets[0], ast.Name) and stores[statement.targets[0].id] == 1):
+            value = _static_string(statement.value, constants)
+            if value is not None:
+                constants[statement.targets[0].id] = value
+    return constants
+
+
+def _static_string(node: ast.AST, constants: Dict[str, str]) -> Optional[str]:
+    """Evaluate string literals, f-strings, + and os.path.join over known string names."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.Name):
+        return constants.get(node.id)
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.FormattedValue):
+                if value.conversion != -1 or value.format_spec is not None:
+                    return None
+                value = value.value
+            part = _static_string(value, constants)
+            if part is None:
+                return None
+            parts.append(part)
+        return ''.join(parts)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left, right = _static_string(node.left, constants), _static_string(node.right, constants)
+        return None if left is None or right is None else left + right
+    if (isinstance(node, ast.Call) and not node.keywords and ast.unparse(node.func) == 'os.path.join'):
+        parts = [_static_string(arg, constants) for arg in node.args]
+        return None if not parts or None in parts else os.path.join(*parts)
+    return None
+
+
+def _reader_path(call: ast.Call) -> Optional[ast.AST]:
+    """Return the path argument of a pandas reader call (positional or keyword)."""
+    if call.args:
+        return call.args[0]
+    for keyword in call.keywords:
+        if keyword.arg in _PATH_KEYWORDS:
+            return keyword.value
+    return None
+
+
+def _replace_spans(code: str, replacements: List[Tuple[ast.AST, str]]) -> str:
+    """Replace the source text of each node with new text."""
+    data = code.encode('utf-8')
+    line_starts = [0]
+    for line in code.splitlines(keepends=True):
+        line_starts.append(line_starts[-1] + len(line.encode('utf-8')))
+
+    def offset(lineno, col_offset):
+        return line_starts[lineno - 1] + col_offset
+
+    # Edit from the end so earlier offsets stay valid
+    for node, text in sorted(replacements, key=lambda item: offset(item[0].lineno, item[0].col_offset), reverse=True):
+        start, end = offset(node.lineno, node.col_offset), offset(node.end_lineno, node.end_col_offset)
+        data = data[:start] + text.encode('utf-8') + data[end:]
+    return data.decode('utf-8')
+
+
+def resolve_dataset_reads(code: str, catalog: DatasetCatalog) -> Optional[str]:
+    """
+    Rewrite every pandas reader call with a static path to read the actual dataset file.
+
+    Paths may be given positionally or by keyword, as f-strings or concatenations, or
+    through a name bound once to such a string. The dataset is looked up by base name in
+    the catalog and the call is rewritten to `pd.<reader>('<file>', ...)`, switching the
+    reader when the file has another format (in which case the other arguments, which
+    belong to the old reader, are dropped). Unknown datasets get the folder prefixed,
+    except for absolute paths and paths leading out of the folder, which are left alone.
+
+    Args:
+        code (str): Python code generated for a question.
+        catalog (DatasetCatalog): Catalog of the dataset folder.
+
+    Returns:
+        Optional[str]: The rewritten code, or None if the code does not parse.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+
+    readers = {reader for _, reader in SUPPORTED_EXTENSIONS}
+    constants = _string_constants(tree)
+    replacements = []
+    for node in ast.walk(tree):
+        if not any(_is_pandas_reader(node, reader) for reader in readers):
+            continue
+        path_node = _reader_path(node)
+        path = _static_string(path_node, constants) if path_node is not None else None
+        if path is None:
+            continue
+
+        reader = node.func.attr
+        file_path, found_reader = catalog.resolve(path)
+        if file_path is None:
+            folder = catalog.dataset_folder_path
+            if path.startswith(folder):
+                file_path = path
+            elif os.path.isabs(path) or os.path.normpath(path).split(os.sep)[0] == os.pardir:
+                continue
+            else:
+                file_path = f"{folder}{path}"
+            found_reader = reader
+
+        arguments = [repr(file_path)]
+        if found_reader == reader:
+            arguments += [ast.get_source_segment(code, arg) for arg in node.args[1:]]
+            arguments += [
+                ast.get_source_segment(code, keyword) for keyword in node.keywords
+                if keyword.value is not path_node
+            ]
+        if found_reader == 'read_excel' and not any(keyword.arg == 'engine' for keyword in node.keywords):
+            arguments.append("engine='openpyxl'")
+        replacements.append((node, f"{node.func.value.id}.{found_reader}({', '.join(arguments)})"))
+
+    if not replacements:
+        return code
+    return _replace_spans(code, replacements)
+
+
+# Methods and functions that can modify an object (frame, series, array, ...) in place
+_IN_PLACE_CALLS = {
+    'insert', 'pop', 'popitem', 'update', 'clear', 'sort', 'partition', 'fill', 'put', 'resize',
+    'itemset', 'setflags', 'copyto', 'place', 'putmask', 'fill_diagonal', 'shuffle',
+    '__setitem__', '__delitem__', 'setattr', 'delattr', 'exec', 'eval'
+}
+
+
+def _may_modify_data(tree: ast.AST) -> bool:
+    """
+    Tell whether code could modify a frame, or data shared with one, in place.
+
+    Conservative: any item or attribute assignment or deletion, augmented assignment
+    (`s += 1` is in place for pandas objects), inplace=/out= argument or call of an
+    in-place method name counts, whatever object it applies to.
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Subscript, ast.Attribute)) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            return True
+        if isinstance(node, ast.AugAssign):
+            return True
+        if isinstance(node, ast.Call):
+            if any(keyword.arg in ('inplace', 'out') or keyword.arg is None for keyword in node.keywords):
+                return True
+            name = node.func.attr if isinstance(node.func, ast.Attribute) else getattr(node.func, 'id', None)
+            if name in _IN_PLACE_CALLS:
+                return True
+    return False
+
+
+def use_cached_datasets(code: str, catalog: DatasetCatalog) -> str:
+    """
+    Serve plain reads of datasets small enough for memory from the dataset catalog.
+
+    `pd.read_parquet('<file>'[, columns=[...]])` (and plain read_csv/read_json/read_excel
+    calls) on a catalog file become `load_dataset('<file>'[, columns=[...]])`, which
+    returns a private copy of the already-loaded frame. When the code cannot modify any
+    data in place (see _may_modify_data) the calls get copy=False and the frame shares
+    the cached data instead of copying it. Reads with other arguments, and files above
+    the catalog's size limit, are left as file reads so column and filter pushdown still
+    apply to them.
+
+    Args:
+        code (str): Python code with resolved dataset paths.
+        catalog (DatasetCatalog): Catalog of the dataset folder.
+
+    Returns:
+        str: The code with cached reads replaced by load_dataset calls.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code
+
+    replacements = []
+    shared = [] if _may_modify_data(tree) else ['copy=False']
+    for ext, reader in SUPPORTED_EXTENSIONS:
+        allowed = {'read_parquet': {'columns'}, 'read_excel': {'engine'}}.get(reader, set())
+        for node in ast.walk(tree):
+            if not _is_pandas_reader(node, reader) or len(node.args) != 1:
+                continue
+            if not (isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)):
+                continue
+            if any(keyword.arg not in allowed for keyword in node.keywords):
+                continue
+            if any(keyword.arg == 'engine' and not (isinstance(keyword.value, ast.Constant) and keyword.value.value == 'openpyxl')
+                   for keyword in node.keywords):
+                continue
+            file_path = node.args[0].value
+            if catalog.resolve(file_path)[0] != file_path or not catalog.is_cacheable(file_path):
+                continue
+            arguments = [repr(file_path)] + [
+                ast.get_source_segment(code, keyword) for keyword in node.keywords if keyword.arg == 'columns'
+            ] + shared
+            replacements.append((node, f"load_dataset({', '.join(arguments)})"))
+
+    if not replacements:
+        return code
+    return _replace_spans(code, replacements)
+
+
+# Frame methods that keep every row/column of the frame they are called on and only
+# depend on the columns named in their arguments. Methods mapped to True read all
+# columns unless their subset argument names them.
+_FRAME_PRESERVING_METHODS = {
+    'head': False, 'tail': False, 'copy': False, 'sample': False, 'sort_index': False,
+    'reset_index': False, 'fillna': False, 'astype': False, 'round': False, 'abs': False,
+    'sort_values': False, 'nlargest': False, 'nsmallest': False, 'set_index': False,
+    'dropna': True, 'drop_duplicates': True
+}
+
+# Frame attributes that do not depend on which columns were loaded
+_ROW_ONLY_ATTRIBUTES = {'index', 'empty'}
+
+# Names that can reach variables dynamically, which static analysis cannot follow
+_DYNAMIC_NAMES = {'eval', 'exec', 'locals', 'globals', 'vars', 'getattr'}
+
+
+class _ColumnUsage:
+    """
+    Collect the columns a piece of code reads from one loaded DataFrame.
+
+    Starting from the reader call, every expression that still holds the full frame
+    is followed through its parents: explicit column access (df['a'], df.a,
+    df[['a', 'b']], groupby('a')['b'], ...) records columns, row selections and
+    frame-preserving methods keep following, and assignments to plain names add
+    aliases. Any other use makes the analysis give up (columns is None).
+    """
+
+    def __init__(self, tree: ast.AST, available: List[str]):
+        self.available = set(available)
+        self.parents = {}
+        for node in ast.walk(tree):
+            for child in ast.iter_child_nodes(node):
+                self.parents[child] = node
+        self.names = {}
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name):
+                self.names.setdefault(node.id, []).append(node)
+        self.assignments = {}
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Assign):
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        self.assignments.setdefault(target.id, []).append(node.value)
+        self.columns = set()
+        self.frames = set()
+        self.failed = bool(_DYNAMIC_NAMES & set(self.names))
+
+    def collect(self, read_call: ast.Call) -> Optional[Set[str]]:
+        """Return the columns used from the frame read_call loads, or None if unknown."""
+        pending = []
+        self._follow_frame(read_call, pending)
+        while pending and not self.failed:
+            name = pending.pop()
+            for occurrence in self.names.get(name, []):
+                if isinstance(occurrence.ctx, ast.Load):
+                    self._follow_frame(occurrence, pending)
+        return None if self.failed else self.columns
+
+    def _fail(self):
+        self.failed = True
+
+    def _add_static_columns(self, node: ast.AST):
+        """Record every string constant in node that names a column."""
+        for child in ast.walk(node):
+            if isinstance(child, ast.Constant) and isinstance(child.value, str) and child.value in self.available:
+                self.columns.add(child.value)
+
+    def _string_list(self, node: ast.AST) -> Optional[List[str]]:
+        """Return the strings of a constant string or list/tuple of strings, else None."""
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            return [node.value]
+        if isinstance(node, (ast.List, ast.Tuple)) and all(
+                isinstance(elt, ast.Constant) and isinstance(elt.value, str) for elt in node.elts):
+            return [elt.value for elt in node.elts]
+        return None
+
+    def _is_static(self, node: ast.AST) -> bool:
+        """Check that an argument only contains constants or expressions on tracked frames."""
+        for child in ast.walk(node):
+            if isinstance(child, (ast.Lambda, ast.Starred)):
+                return False
+            if isinstance(child, ast.Name) and child.id not in self.frames:
+                return False
+        return True
+
+    def _refers_to_frame(self, node: ast.AST) -> bool:
+        return any(isinstance(child, ast.Name) and child.id in self.frames for child in ast.walk(node))
+
+    def _is_mask(self, node: ast.AST) -> bool:
+        """Check whether a subscript selects rows (boolean mask or slice) rather than columns."""
+        if isinstance(node, ast.Slice):
+            return True
+        if isinstance(node, ast.Name):
+            values = self.assignments.get(node.id, [])
+            return bool(values) and all(self._is_mask(value) for value in values)
+        if isinstance(node, (ast.Compare, ast.UnaryOp, ast.Call)) or (
+                isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr, ast.BitXor))):
+            return self._refers_to_frame(node)
+        return False
+
+    def _follow_frame(self, node: ast.AST, pending: List[str]):
+        """Follow an expression that evaluates to the full frame (or a row of it)."""
+        if isinstance(node, ast.Name):
+            self.frames.add(node.id)
+        parent = self.parents.get(node)
+
+        if isinstance(parent, ast.Subscript) and parent.value is node:
+            columns = self._string_list(parent.slice)
+            if columns is not None:
+                self.columns.update(col for col in columns if col in self.available)
+            elif self._is_mask(parent.slice):
+                self._follow_frame(parent, pending)
+            else:
+                self._fail()
+
+        elif isinstance(parent, ast.Attribute) and parent.value is node:
+            self._follow_attribute(parent, pending)
+
+        elif isinstance(parent, ast.Assign) and parent.value is node:
+            if len(parent.targets) == 1 and isinstance(parent.targets[0], ast.Name):
+                target = parent.targets[0].id
+                if target not in self.frames:
+                    self.frames.add(target)
+                    pending.append(target)
+            else:
+                self._fail()
+
+        elif isinstance(parent, ast.Call) and isinstance(parent.func, ast.Name) and parent.func.id == 'len' \
+                and parent.args == [node]:
+            pass
+
+        elif isinstance(parent, ast.Expr):
+            pass
+
+        else:
+            self._fail()
+
+    def _follow_attribute(self, attribute: ast.Attribute, pending: List[str]):
+        """Follow attribute access (column access, .loc/.at, methods) on a full frame."""
+        attr = attribute.attr
+        parent = self.parents.get(attribute)
+        is_call = isinstance(parent, ast.Call) and parent.func is attribute
+
+        if attr in self.available and not hasattr(pd.DataFrame, attr):
+            self.columns.add(attr)
+
+        elif attr in _ROW_ONLY_ATTRIBUTES:
+            pass
+
+        elif attr == 'shape':
+            if not (isinstance(parent, ast.Subscript) and isinstance(parent.slice, ast.Constant)
+                    and parent.slice.value == 0):
+                self._fail()
+
+        elif attr in ('loc', 'at') and isinstance(parent, ast.Subscript) and parent.value is attribute:
+            selector = parent.slice
+            if isinstance(selector, ast.Tuple) and len(selector.elts) == 2:
+                columns = self._string_list(selector.elts[1])
+                if columns is not None:
+                    self.columns.update(col for col in columns if col in self.available)
+                elif (attr == 'loc' and isinstance(selector.elts[1], ast.Slice)
+                        and not (selector.elts[1].lower or selector.elts[1].upper or selector.elts[1].step)):
+                    self._follow_frame(parent, pending)
+                else:
+                    self._fail()
+            elif attr == 'loc':
+                self._follow_frame(parent, pending)
+            else:
+                self._fail()
+
+        elif attr in _FRAME_PRESERVING_METHODS and is_call:
+            arguments = list(parent.args) + [keyword.value for keyword in parent.keywords]
+            if not all(self._is_static(argument) for argument in arguments):
+                self._fail()
+                return
+            needs_subset = _FRAME_PRESERVING_METHODS[attr]
+            has_subset = any(keyword.arg == 'subset' for keyword in parent.keywords) or (
+                attr == 'drop_duplicates' and parent.args)
+            if needs_subset and not has_subset:
+                self._fail()
+                return
+            for argument in arguments:
+                self._add_static_columns(argument)
+            self._follow_frame(parent, pending)
+
+        elif attr == 'groupby' and is_call:
+            arguments = list(parent.args) + [keyword.value for keyword in parent.keywords]
+            if not all(self._is_static(argument) for argument in arguments):
+                self._fail()
+                return
+            for argument in arguments:
+                self._add_static_columns(argument)
+            self._follow_groupby(parent)
+
+        else:
+            self._fail()
+
+    def _follow_groupby(self, groupby_call: ast.Call):
+        """Follow a GroupBy object; only explicit column selections are understood."""
+        parent = self.parents.get(groupby_call)
+        if isinstance(parent, ast.Subscript) and parent.value is groupby_call:
+            columns = self._string_list(parent.slice)
+            if columns is None:
+                self._fail()
+            else:
+                self.columns.update(col for col in columns if col in self.available)
+        elif isinstance(parent, ast.Attribute) and parent.value is groupby_call:
+            if parent.attr in ('size', 'ngroups', 'groups', 'indices'):
+                return
+            call = self.parents.get(parent)
+            if parent.attr in ('agg', 'aggregate') and isinstance(call, ast.Call) and call.func is parent \
+                    and len(call.args) == 1 and isinstance(call.args[0], ast.Dict) and not call.keywords:
+                for key in call.args[0].keys:
+                    if not (isinstance(key, ast.Constant) and isinstance(key.value, str)):
+                        self._fail()
+                        return
+                    if key.value in self.available:
+                        self.columns.add(key.value)
+            else:
+                self._fail()
+        else:
+            self._fail()
+
+
+def _is_pandas_reader(node: ast.AST, reader: str) -> bool:
+    """Check whether node is a call to pd.<reader> / pandas.<reader>."""
+    return (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+            and node.func.attr == reader and isinstance(node.func.value, ast.Name)
+            and node.func.value.id in ('pd', 'pandas'))
+
+
+def _insert_call_arguments(code: str, calls: List[Tuple[ast.Call, str]]) -> str:
+    """Insert extra keyword argument text before the closing parenthesis of each call."""
+    lines = code.splitlines(keepends=True)
+    # Edit from the end so earlier positions stay valid
+    for call, argument_text in sorted(calls, key=lambda item: (item[0].end_lineno, item[0].end_col_offset), reverse=True):
+        line = lines[call.end_lineno - 1].encode('utf-8')
+        closing = call.end_col_offset - 1
+        before = line[:closing].decode('utf-8')
+        preceding = (''.join(lines[:call.end_lineno - 1]) + before).rstrip()
+        if preceding.endswith('('):
+            separator = ''
+        elif preceding.endswith(','):
+            separator = ' '
+        else:
+            separator = ', '
+        lines[call.end_lineno - 1] = before + separator + argument_text + line[closing:].decode('utf-8')
+    return ''.join(lines)
+
+
+def push_down_columns(code: str) -> str:
+    """
+    Rewrite pd.read_parquet calls to load only the columns the code uses.
+
+    A read is only restricted when static analysis can account for every use of the
+    loaded frame (see _ColumnUsage); otherwise, or if the code does not parse, the
+    full read is kept.
+
+    Args:
+        code (str): Python code with dataset paths already resolved.
+
+    Returns:
+        str: The code with columns=[...] added to the parquet reads that allow it.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code
+
+    calls = []
+    for node in ast.walk(tree):
+        if not _is_pandas_reader(node, 'read_parquet'):
+            continue
+        if any(keyword.arg in ('columns', None) for keyword in node.keywords):
+            continue
+        path_args = list(node.args[:1]) + [keyword.value for keyword in node.keywords if keyword.arg == 'path']
+        if len(path_args) != 1 or not (isinstance(path_args[0], ast.Constant) and isinstance(path_args[0].value, str)):
+            continue
+        try:
+            available = pq.read_schema(path_args[0].value).names
+        except Exception:
+            continue
+
+        used = _ColumnUsage(tree, available).collect(node)
+        if not used or len(used) == len(set(available)):
+            continue
+        columns = [col for col in available if col in used]
+        calls.append((node, f"columns={columns!r}"))
+
+    if not calls:
+        return code
+
+    new_code = _insert_call_arguments(code, calls)
+    try:
+        ast.parse(new_code)
+    except SyntaxError:
+        return code
+    return new_code
+
+
+# Comparison operators that can be pushed into a parquet filter, and their mirror image
+# for comparisons written literal-first (5 < df['a'])
+_PUSHABLE_COMPARISONS = {ast.Eq: ('==', '=='), ast.Lt: ('<', '>'), ast.LtE: ('<=', '>='), ast.Gt: ('>', '<'), ast.GtE: ('>=', '<=')}
+
+# Series methods (and .str/.dt accessor members) that compute each row from that row alone
+_ROWWISE_METHODS = {
+    'isin', 'between', 'isna', 'notna', 'isnull', 'notnull', 'abs', 'round', 'astype', 'fillna',
+    'contains', 'startswith', 'endswith', 'match', 'fullmatch', 'lower', 'upper', 'strip', 'len', 'title'
+}
+_ROWWISE_ACCESSORS = {'str', 'dt'}
+_ROWWISE_OPERATORS = (ast.BitAnd, ast.BitOr, ast.BitXor, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+
+
+def _literal(node: ast.AST):
+    """Return (True, value) for a str/number/bool literal (including negative numbers)."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, (str, int, float)):
+        return True, node.value
+    if (isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant)
+            and isinstance(node.operand.value, (int, float)) and not isinstance(node.operand.value, bool)):
+        return True, -node.operand.value
+    return False, None
+
+
+def _literal_list(node: ast.AST):
+    """Return (True, values) for a non-empty list/tuple/set of literals."""
+    if not isinstance(node, (ast.List, ast.Tuple, ast.Set)) or not node.elts:
+        return False, None
+    values = []
+    for element in node.elts:
+        ok, value = _literal(element)
+        if not ok:
+            return False, None
+        values.append(value)
+    return True, values
+
+
+def _frame_column(node: ast.AST, frame: str) -> Optional[str]:
+    """Return the column name for df['col'] / df.col on the named frame."""
+    if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == frame:
+        if isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str):
+            return node.slice.value
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == frame:
+        return node.attr
+    return None
+
+
+def _is_rowwise(node: ast.AST, frame: str) -> bool:
+    """
+    Check that an expression on the frame computes each row from that row alone.
+
+    Only such masks give the same rows when evaluated on a subset of the frame;
+    anything involving aggregates (df['a'].mean()), other variables or calls we
+    do not know is rejected.
+    """
+    if _literal(node)[0] or _frame_column(node, frame) is not None:
+        return True
+    if isinstance(node, ast.Compare):
+        return all(_is_rowwise(part, frame) for part in [node.left] + node.comparators)
+    if isinstance(node, ast.BinOp):
+        return isinstance(node.op, _ROWWISE_OPERATORS) and _is_rowwise(node.left, frame) and _is_rowwise(node.right, frame)
+    if isinstance(node, ast.UnaryOp):
+        return isinstance(node.op, (ast.Invert, ast.USub)) and _is_rowwise(node.operand, frame)
+    if isinstance(node, ast.Attribute):
+        # df['d'].dt.year
+        return (isinstance(node.value, ast.Attribute) and node.value.attr == 'dt'
+                and _frame_column(node.value.value, frame) is not None)
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in _ROWWISE_METHODS:
+        target = node.func.value
+        if isinstance(target, ast.Attribute) and target.attr in _ROWWISE_ACCESSORS:
+            target = target.value
+        arguments = list(node.args) + [keyword.value for keyword in node.keywords]
+        return (_is_rowwise(target, frame)
+                and all(_literal(arg)[0] or _literal_list(arg)[0] or isinstance(arg, ast.Name) and arg.id in ('str', 'int', 'float')
+                        for arg in arguments))
+    return False
+
+
+def _conjuncts(node: ast.AST) -> List[ast.AST]:
+    """Split a mask on its top-level & operators."""
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitAnd):
+        return _conjuncts(node.left) + _conjuncts(node.right)
+    return [node]
+
+
+def _pushable_filters(mask: ast.AST, frame: str) -> List[Tuple[str, str, object]]:
+    """Translate the simple conditions ANDed together in a mask into (column, op, value) filters."""
+    filters = []
+    for condition in _conjuncts(mask):
+        if isinstance(condition, ast.Compare) and len(condition.ops) == 1 and type(condition.ops[0]) in _PUSHABLE_COMPARISONS:
+            op, mirrored = _PUSHABLE_COMPARISONS[type(condition.ops[0])]
+            left, right = condition.left, condition.comparators[0]
+            column, (is_literal, value) = _frame_column(left, frame), _literal(right)
+            if column is None:
+                column, (is_literal, value), op = _frame_column(right, frame), _literal(left), mirrored
+            if column is not None and is_literal:
+                filters.append((column, op, value))
+        elif isinstance(condition, ast.Call) and isinstance(condition.func, ast.Attribute):
+            column = _frame_column(condition.func.value, frame)
+            if column is None:
+                continue
+            if condition.func.attr == 'isin' and len(condition.args) == 1 and not condition.keywords:
+                is_list, values = _literal_list(condition.args[0])
+                if is_list:
+                    filters.append((column, 'in', values))
+            elif condition.func.attr == 'between' and len(condition.args) == 2 and not condition.keywords:
+                (low_ok, low), (high_ok, high) = _literal(condition.args[0]), _literal(condition.args[1])
+                if low_ok and high_ok:
+                    filters.extend([(column, '>=', low), (column, '<=', high)])
+    return filters
+
+
+def _frame_mask(node: ast.AST, frame: str) -> Optional[ast.AST]:
+    """Return M for a row selection df[M], df.loc[M] or df.loc[M, cols] on the named frame."""
+    if not isinstance(node, ast.Subscript):
+        return None
+    if isinstance(node.value, ast.Name) and node.value.id == frame:
+        return node.slice
+    if (isinstance(node.value, ast.Attribute) and node.value.attr == 'loc'
+            and isinstance(node.value.value, ast.Name) and node.value.value.id == frame):
+        if isinstance(node.slice, ast.Tuple):
+            return node.slice.elts[0] if len(node.slice.elts) == 2 else None
+        return node.slice
+    return None
+
+
+def _leading_filters(tree: ast.Module, read_call: ast.Call) -> List[Tuple[str, str, object]]:
+    """
+    Find the filters that can be pushed into a parquet read.
+
+    The read has to be a top-level `df = pd.read_parquet(...)` whose next use is a
+    single row-wise boolean selection of df in a plain statement, with no other use
+    of the unfiltered frame: either that statement rebinds df, or df is not used
+    again afterwards.
+    """
+    statements = tree.body
+    index = next((i for i, statement in enumerate(statements)
+                  if isinstance(statement, ast.Assign) and statement.value is read_call), None)
+    if index is None or len(statements[index].targets) != 1 or not isinstance(statements[index].targets[0], ast.Name):
+        return []
+    frame = statements[index].targets[0].id
+
+    def frame_names(node):
+        return [n for n in ast.walk(node) if isinstance(n, ast.Name) and n.id == frame and isinstance(n.ctx, ast.Load)]
+
+    position = next((i for i in range(index + 1, len(statements)) if frame_names(statements[i])), None)
+    if position is None or not isinstance(statements[position], (ast.Assign, ast.Expr)):
+        return []
+    statement = statements[position]
+
+    # Outermost row selections of the frame (df['a'] inside a mask is part of that mask)
+    selections = [(node, _frame_mask(node, frame)) for node in ast.walk(statement) if _frame_mask(node, frame) is not None]
+    nested = {id(n) for _, mask in selections for n in ast.walk(mask)}
+    selections = [(node, mask) for node, mask in selections if id(node) not in nested]
+    if len(selections) != 1:
+        return []
+    selection, mask = selections[0]
+    # The only uses of the frame are the selection itself and the columns inside its mask
+    in_mask = {id(n) for n in frame_names(mask)}
+    outside = [n for n in frame_names(statement) if id(n) not in in_mask]
+    selected_frame = selection.value if isinstance(selection.value, ast.Name) else selection.value.value
+    if outside != [selected_frame] or not _is_rowwise(mask, frame):
+        return []
+    # Unless the statement rebinds df, later code must not see the filtered frame
+    rebinds = any(isinstance(n, ast.Name) and n.id == frame and isinstance(n.ctx, ast.Store) for n in ast.walk(statement))
+    if not rebinds and any(frame_names(later) for later in statements[position + 1:]):
+        return []
+    return _pushable_filters(mask, frame)
+
+
+def push_down_filters(code: str) -> str:
+    """
+    Rewrite parquet reads that are immediately filtered to skip non-matching rows.
+
+    `df = pd.read_parquet(p); df = df[(df['a'] == 'x') & ...]` becomes a
+    read_parquet_filtered(p, filters=[...]) call, which skips row groups by their
+    statistics and drops rows in Arrow while keeping the original row labels. The
+    pandas mask is kept as written, so results are unchanged; only simple literal
+    comparisons, isin and between are pushed (see _leading_filters for when).
+
+    Args:
+        code (str): Python code with dataset paths already resolved.
+
+    Returns:
+        str: The code with pushed-down filters where possible.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code
+
+    rewrites = []
+    for node in ast.walk(tree):
+        if not _is_pandas_reader(node, 'read_parquet'):
+            continue
+        if any(keyword.arg not in ('path', 'columns') for keyword in node.keywords) or len(node.args) > 1:
+            continue
+        filters = _leading_filters(tree, node)
+        if filters:
+            rewrites.append((node, f"filters={filters!r}"))
+
+    if not rewrites:
+        return code
+
+    lines = code.splitlines(keepends=True)
+    for call, argument_text in sorted(rewrites, key=lambda item: (item[0].lineno, item[0].col_offset), reverse=True):
+        lines = _insert_call_arguments(''.join(lines), [(call, argument_text)]).splitlines(keepends=True)
+        line = lines[call.func.lineno - 1].encode('utf-8')
+        lines[call.func.lineno - 1] = (line[:call.func.col_offset] + b'read_parquet_filtered'
+                                       + line[call.func.end_col_offset:]).decode('utf-8')
+    new_code = ''.join(lines)
+    try:
+        ast.parse(new_code)
+    except SyntaxError:
+        return code
+    return new_code
+
+
+@timed('code_cleaning')
 def clean_pandas_code(raw_code):
     """
     Clean and extract Python code from a raw string.
@@ -0,0 +1,236 @@
+"""
+Code Repair
+Rule-based fixes for common, trivial failures of generated code (a column name that
+differs only in case, accents, punctuation or a plural s, a dataset path with the
+wrong extension, .unique()/.tolist() called on a scalar), applied and re-run locally
+before an LLM retry is spent on them. Anything less certain, e.g. a column name that
+is merely similar to a real one, is left to the LLM.
+"""
+
+import ast
+import os
+import re
+from typing import Any, Callable, List, Optional, Tuple
+
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from .data_preprocessing import normalize_letters
+from .dataset_catalog import get_catalog, SUPPORTED_EXTENSIONS
+from .error_handling import classify_error, is_dtype_error, SAMPLE_TRUSTED_ERRORS
+from .metrics import increment
+
+# Load environment variables
+load_dotenv()
+
+# Try local repairs before asking the LLM to fix failed code
+AUTO_REPAIR = os.getenv("AUTO_REPAIR", "true").lower() == "true"
+# Successive repairs tried on one piece of code (each fixes one error)
+AUTO_REPAIR_MAX_STEPS = 3
+
+# Methods that generated code often calls on what turns out to be a scalar
+SCALAR_METHODS = ('unique', 'tolist', 'item')
+_SCALAR_ATTRIBUTE_ERROR = re.compile(
+    r"'(?:numpy\.\w+|int|float|str|bool|Timestamp)' object has no attribute '(?P<attribute>\w+)'"
+)
+_MISSING_ATTRIBUTE = re.compile(r"'(?:DataFrame|Series|DataFrameGroupBy|SeriesGroupBy)' object has no attribute '(?P<attribute>\w+)'")
+
+
+def normalize_column_name(name: str) -> str:
+    """Reduce a column name to lowercase ASCII letters and digits, as used for fuzzy matching."""
+    return re.sub(r'[^a-z0-9]', '', normalize_letters(str(name)).lower())
+
+
+def _singular(normalized: str) -> str:
+    return normalized[:-1] if len(normalized) > 1 and normalized.endswith('s') else normalized
+
+
+class ColumnIndex:
+    """Finds a dataset's real column name for one written with different case, accents, punctuation or plural."""
+
+    def __init__(self, columns: List[str]):
+        self.columns = [str(column) for column in columns]
+        self._normalized = {}
+        for column in self.columns:
+            self._normalized.setdefault(_singular(normalize_column_name(column)), []).append(column)
+
+    def match(self, name: str) -> Optional[str]:
+        """
+        Return the column name meant by name, or None unless exactly one column is
+        the same name up to case, accents, punctuation and a plural s.
+
+        Merely similar names (e.g. Sales_2022 for Sales_2021) are never matched: the
+        repaired code would run and answer about a different column.
+        """
+        if name in self.columns:
+            return None
+        candidates = self._normalized.get(_singular(normalize_column_name(name)), [])
+        return candidates[0] if len(candidates) == 1 else None
+
+
+def dataset_columns(dataset_name: str, dataset_folder_path: str = "datasets/") -> List[str]:
+    """Return a dataset's column names (from the parquet footer when possible)."""
+    file_path, _ = get_catalog(dataset_folder_path).resolve(dataset_name)
+    if file_path is None:
+        return []
+    if file_path.endswith('.parquet'):
+        return [name for name in pq.read_schema(file_path).names if not name.startswith('__index_level_')]
+    return list(get_catalog(dataset_folder_path).load(file_path, copy=False).columns)
+
+
+def missing_column_names(error: Exception) -> List[str]:
+    """Return the column names an error says are missing (KeyError, "not in index", attribute access)."""
+    message = str(error)
+    if isinstance(error, KeyError) and error.args and isinstance(error.args[0], str) \
+            and "not in index" not in error.args[0] and "None of [" not in error.args[0]:
+        return [error.args[0]]
+    if "None of [" in message:
+        # "None of [Index(['a', 'b'], dtype='object')] are in the [columns]": only the Index list
+        listed = re.search(r"None of \[(?:Index\()?\[(.*?)\]", message)
+        return re.findall(r"'((?:[^'\\]|\\.)*)'", listed.group(1)) if listed else []
+    if "not in index" in message:
+        return re.findall(r"'((?:[^'\\]|\\.)*)'", message.split("]")[0])
+    match = _MISSING_ATTRIBUTE.search(message)
+    if isinstance(error, AttributeError) and match:
+        return [match.group('attribute')]
+    return []
+
+
+def is_trusted_sample_error(error: Exception, dataset_name: str, dataset_folder_path: str = "datasets/") -> bool:
+    """
+    Tell whether an error raised on a dataset sample would also occur on the full dataset.
+
+    Syntax, name and import errors are trusted, and so are TypeErrors from a column's
+    dtype (see is_dtype_error). A KeyError or frame attribute error is trusted when every
+    column it names is missing from the full dataset's schema but is a misspelling of
+    one of its columns (see ColumnIndex), so keys that are values, such as a row label
+    absent from the sample or a column made by a pivot, are not. Anything else, e.g. an
+    IndexError on a selection that is empty in the sample, has to be confirmed on the
+    full dataset.
+    """
+    if isinstance(error, SAMPLE_TRUSTED_ERRORS) or is_dtype_error(error):
+        return True
+    if not isinstance(error, (KeyError, AttributeError)):
+        return False
+    names = missing_column_names(error)
+    if not names:
+        return False
+    index = ColumnIndex(dataset_columns(dataset_name, dataset_folder_path))
+    return all(index.match(name) is not None for name in names)
+
+
+def _replace_string_literal(code: str, old: str, new: str) -> str:
+    """Replace string literals equal to old (either quote style) with a literal for new."""
+    return re.sub(r"""(['"])""" + re.escape(old) + r"\1", lambda m: repr(new), code)
+
+
+def _column_repairs(code: str, error: Exception, index: ColumnIndex) -> List[str]:
+    """Rename misspelled columns (string keys and df.attribute access) to the real ones."""
+    repaired = code
+    for name in missing_column_names(error):
+        column = index.match(name)
+        if column is None:
+            continue
+        repaired = _replace_string_literal(repaired, name, column)
+        if isinstance(error, AttributeError):
+            repaired = re.sub(r"\." + re.escape(name) + r"\b(?!\s*\()", f"[{column!r}]", repaired)
+    return [repaired] if repaired != code else []
+
+
+def _path_repairs(code: str, error: Exception, dataset_name: str, dataset_folder_path: str) -> List[str]:
+    """Point dataset reads with a wrong name or extension at the dataset's actual file and reader."""
+    if not isinstance(error, FileNotFoundError):
+        return []
+    file_path, reader = get_catalog(dataset_folder_path).resolve(dataset_name)
+    if file_path is None:
+        return []
+    extensions = "|".join(re.escape(ext) for ext, _ in SUPPORTED_EXTENSIONS)
+    repaired = re.sub(r"""(['"])[^'"\n]*(?:""" + extensions + r""")\1""", lambda m: repr(file_path), code)
+    repaired = re.sub(r"\bpd\.read_(parquet|csv|json|excel)\(", f"pd.{reader}(", repaired)
+    return [repaired] if repaired != code else []
+
+
+def _scalar_method_repairs(code: str, error: Exception) -> List[str]:
+    """Drop a method (e.g. .unique()) that was called on a scalar, one call at a time, then all of them."""
+    match = _SCALAR_ATTRIBUTE_ERROR.search(str(error))
+    if not isinstance(error, AttributeError) or not match or match.group('attribute') not in SCALAR_METHODS:
+        return []
+    pattern = re.compile(r"\." + match.group('attribute') + r"\b(?:\(\))?")
+    calls = list(pattern.finditer(code))
+    candidates = [code[:call.start()] + code[call.end():] for call in reversed(calls)]
+    if len(calls) > 1:
+        candidates.append(pattern.sub("", code))
+    return candidates
+
+
+def repair_candidates(code: str, error: Exception, dataset_name: str, dataset_folder_path: str = "datasets/",
+                      index: Optional[ColumnIndex] = None) -> List[Tuple[str, str]]:
+    """
+    Return (rule, repaired code) candidates for code that failed with error, most likely first.
+
+    Parameters:
+    code (str): The cleaned generated code (before dataset path rewriting).
+    error (Exception): The exception the code raised.
+    dataset_name (str): The dataset the code is about.
+    dataset_folder_path (str): The folder with the dataset.
+    index (ColumnIndex, optional): The dataset's column index (built when not given).
+    """
+    candidates = [('path', repaired) for repaired in _path_repairs(code, error, dataset_name, dataset_folder_path)]
+    if missing_column_names(error):
+        if index is None:
+            index = ColumnIndex(dataset_columns(dataset_name, dataset_folder_path))
+        candidates += [('column', repaired) for repaired in _column_repairs(code, error, index)]
+    candidates += [('scalar_method', repaired) for repaired in _scalar_method_repairs(code, error)]
+
+    # Only candidates that still parse are worth running
+    valid = []
+    for rule, repaired in candidates:
+        try:
+            ast.parse(repaired)
+        except SyntaxError:
+            continue
+        valid.append((rule, repaired))
+    return valid
+
+
+def auto_repair(code: str, error: Exception, dataset_name: str, run: Callable[[str], Tuple[Any, Optional[Exception]]],
+                dataset_folder_path: str = "datasets/") -> Optional[Tuple[str, Any]]:
+    """
+    Repair failed generated code locally, re-running each repair with run.
+
+    A repair that gets past the error (it succeeds, or fails with another error) is
+    kept, and the next error is repaired in turn, for up to AUTO_REPAIR_MAX_STEPS
+    errors. Every success is an LLM round trip saved.
+
+    Parameters:
+    code (str): The cleaned generated code that failed.
+    error (Exception): The exception it raised.
+    dataset_name (str): The dataset the code is about.
+    run: Runs cleaned code and returns (result, None) or (None, exception).
+    dataset_folder_path (str): The folder with the dataset.
+
+    Returns:
+    Tuple: (repaired code, result), or None if the code could not be repaired.
+    """
+    if not AUTO_REPAIR:
+        return None
+    increment('auto_repair.attempts')
+    increment(f'auto_repair.attempts.{classify_error(error)}')
+    index = None
+    for _ in range(AUTO_REPAIR_MAX_STEPS):
+        if missing_column_names(error) and index is None:
+            index = ColumnIndex(dataset_columns(dataset_name, dataset_folder_path))
+        progressed = False
+        for rule, repaired in repair_candidates(code, error, dataset_name, dataset_folder_path, index):
+            result, new_error = run(repaired)
+            if new_error is None:
+                increment('auto_repair.successes')
+                increment(f'auto_repair.rule.{rule}')
+                increment('auto_repair.llm_round_trips_saved')
+                return repaired, result
+            if type(new_error) is not type(error) or str(new_error) != str(error):
+                code, error, progressed = repaired, new_error, True
+                break
+        if not progressed:
+            break
+    return None
@@ -1,6 +1,11 @@
 import json
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import os
+from typing import List, Tuple, Any, Optional
 
 
 def load_schemas(schema_path):
@@ -9,12 +14,21 @@ def load_schemas(schema_path):
         return json.load(f)
 
 
-def read_dataset(file_path: str) -> pd.DataFrame:
+# Share loaded datasets between processes through Arrow IPC files in shared memory:
+# "on" maps them with the usual numpy dtypes (numeric columns without nulls are
+# zero-copy), "arrow" maps every column zero-copy as pd.ArrowDtype.
+SHARED_DATASETS = os.getenv('SHARED_DATASETS', 'off').lower()
+SHARED_DATASET_DIR = os.getenv('SHARED_DATASET_DIR', '/dev/shm/easyqa')
+
+
+def read_dataset(file_path: str, shared: Optional[bool] = None) -> pd.DataFrame:
     """
     Read a dataset file in various formats (parquet, csv, json, xlsx).
     
     Args:
         file_path (str): Path to the dataset file
+        shared (bool, optional): Go through the shared-memory copy of the dataset
+            (defaults to whether SHARED_DATASETS is enabled)
         
     Returns:
         pd.DataFrame: The loaded dataset
@@ -22,6 +36,26 @@ def read_dataset(file_path: str) -> pd.DataFrame:
     Raises:
         ValueError: If the file format is not supported
     """
+    if shared is None:
+        shared = SHARED_DATASETS in ('on', 'arrow')
+    if shared:
+        df = map_shared_dataset(file_path)
+        if df is None:
+            df = _read_dataset_file(file_path)
+            try:
+                publish_shared_dataset(file_path, df)
+                mapped = map_shared_dataset(file_path)
+                if mapped is not None:
+                    df = mapped
+            except (OSError, pa.ArrowException):
+                # Shared memory is an optimization; keep the private copy
+                pass
+        return df
+    return _read_dataset_file(file_path)
+
+
+def _read_dataset_file(file_path: str) -> pd.DataFrame:
+    """Read a dataset file with the pandas reader for its format."""
     file_extension = os.path.splitext(file_path)[1].lower()
     
     try:
@@ -39,6 +73,240 @@ def read_dataset(file_path: str) -> pd.DataFrame:
         raise ValueError(f"Error reading file {file_path}: {str(e)}")
 
 
+def shared_dataset_path(file_path: str) -> str:
+    """Return the path of the shared-memory Arrow IPC file for a dataset file."""
+    return os.path.join(SHARED_DATASET_DIR, os.path.basename(file_path) + '.arrow')
+
+
+def _source_version(file_path: str) -> bytes:
+    """Identify the version of a dataset file by its modification time and size."""
+    stat = os.stat(file_path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}".encode()
+
+
+def publish_shared_dataset(file_path: str, df: Optional[pd.DataFrame] = None) -> str:
+    """
+    Write a dataset to shared memory as an Arrow IPC file, for map_shared_dataset.
+
+    The file is tagged with the source file's version and replaced atomically, so
+    processes mapping it never see a partial write.
+
+    Args:
+        file_path (str): Path to the dataset file
+        df (pd.DataFrame, optional): The dataset as read from file_path (read if omitted)
+
+    Returns:
+        str: Path of the shared-memory file
+    """
+    version = _source_version(file_path)
+    if df is None:
+        df = _read_dataset_file(file_path)
+    table = pa.Table.from_pandas(df)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'source_version': version})
+
+    target = shared_dataset_path(file_path)
+    os.makedirs(SHARED_DATASET_DIR, exist_ok=True)
+    temp_path = f"{target}.{os.getpid()}.tmp"
+    with pa.OSFile(temp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temp_path, target)
+    return target
+
+
+def map_shared_dataset(file_path: str) -> Optional[pd.DataFrame]:
+    """
+    Map the shared-memory copy of a dataset as a DataFrame.
+
+    The Arrow data stays in the memory-mapped file, which every process shares. With
+    SHARED_DATASETS=arrow every column is a zero-copy pd.ArrowDtype column; otherwise
+    the usual numpy dtypes are restored, which only avoids copies for numeric columns
+    without nulls (those arrays are read-only).
+
+    Returns:
+        pd.DataFrame or None: The dataset, or None if there is no up-to-date shared copy.
+    """
+    try:
+        version = _source_version(file_path)
+        table = pa.ipc.open_file(pa.memory_map(shared_dataset_path(file_path), 'r')).read_all()
+    except (OSError, pa.ArrowException):
+        return None
+    if (table.schema.metadata or {}).get(b'source_version') != version:
+        return None
+    if SHARED_DATASETS == 'arrow':
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    return table.to_pandas(split_blocks=True)
+
+
+def remove_shared_dataset(file_path: str):
+    """Remove the shared-memory copy of a dataset, if any."""
+    try:
+        os.remove(shared_dataset_path(file_path))
+    except OSError:
+        pass
+
+
+# Comparison operators accepted in read_parquet_filtered filters
+FILTER_OPERATORS = {
+    '==': lambda field, value: field == value,
+    '<': lambda field, value: field < value,
+    '<=': lambda field, value: field <= value,
+    '>': lambda field, value: field > value,
+    '>=': lambda field, value: field >= value,
+    'in': lambda field, value: field.isin(value)
+}
+
+
+def _filter_fits_type(arrow_type: pa.DataType, op: str, value: Any) -> bool:
+    """Check that a filter compares a column with values of a matching kind."""
+    values = value if op == 'in' else [value]
+    if op == 'in' and not values:
+        return False
+    if pa.types.is_dictionary(arrow_type):
+        arrow_type = arrow_type.value_type
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return all(isinstance(v, str) for v in values)
+    if pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type):
+        return all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values)
+    if pa.types.is_boolean(arrow_type):
+        return op == '==' and all(isinstance(v, bool) for v in values)
+    return False
+
+
+def _row_group_may_match(row_group, column_positions, filters) -> bool:
+    """Use row group min/max statistics to rule out groups without matching rows."""
+    for column, op, value in filters:
+        statistics = row_group.column(column_positions[column]).statistics
+        if statistics is None or not statistics.has_min_max:
+            continue
+        try:
+            low, high = statistics.min, statistics.max
+            if op == '==' and (value < low or value > high):
+                return False
+            if op == '<' and low >= value:
+                return False
+            if op == '<=' and low > value:
+                return False
+            if op == '>' and high <= value:
+                return False
+            if op == '>=' and high < value:
+                return False
+            if op == 'in' and all(v < low or v > high for v in value):
+                return False
+        except TypeError:
+            continue
+    return True
+
+
+def _file_null_count(metadata, column_positions, column: str) -> Optional[int]:
+    """Return the number of nulls in a column of the whole file, from row group statistics (None if unknown)."""
+    position = column_positions.get(column)
+    if position is None:
+        return None
+    total = 0
+    for i in range(metadata.num_row_groups):
+        statistics = metadata.row_group(i).column(position).statistics
+        if statistics is None or not statistics.has_null_count:
+            return None
+        total += statistics.null_count
+    return total
+
+
+def read_parquet_filtered(path: str, filters: List[Tuple[str, str, Any]], columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read only the parquet rows that can satisfy filters, keeping their original row labels.
+
+    Row groups whose statistics rule the filters out are skipped and the rest is
+    filtered in Arrow. Unlike pd.read_parquet(filters=...), rows keep the index they
+    would have in a full read, so applying the same pandas mask afterwards gives
+    exactly the frame a full read would.
+
+    Args:
+        path (str): Path to the parquet file
+        filters (list): (column, op, value) tuples, op one of ==, <, <=, >, >=, in
+        columns (list, optional): Columns to return (all by default)
+
+    Returns:
+        pd.DataFrame: The rows that may match, with the dtypes of a full read. Filters
+        that do not fit the column type are ignored and files with a stored (non-range)
+        index are read in full.
+        With categorical columns every row group is kept, so categories come out
+        exactly as in a full read.
+    """
+    parquet_file = pq.ParquetFile(path)
+    schema = parquet_file.schema_arrow
+    pandas_metadata = schema.pandas_metadata or {}
+    index_columns = pandas_metadata.get('index_columns', [])
+    has_categoricals = any(col.get('pandas_type') == 'categorical' for col in pandas_metadata.get('columns', []))
+    if any(not isinstance(index, dict) or index.get('kind') != 'range' for index in index_columns):
+        return pd.read_parquet(path, columns=columns)
+
+    filters = [
+        (column, op, value) for column, op, value in filters
+        if op in FILTER_OPERATORS and column in schema.names
+        and _filter_fits_type(schema.field(column).type, op, value)
+    ]
+    if not filters:
+        return pd.read_parquet(path, columns=columns)
+
+    # Positions of the rows in the whole file, used to rebuild the index
+    metadata = parquet_file.metadata
+    column_positions = {metadata.schema.column(i).path: i for i in range(metadata.num_columns)}
+    row_groups, positions, offset = [], [], 0
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        if has_categoricals or _row_group_may_match(row_group, column_positions, filters):
+            row_groups.append(i)
+            positions.append(np.arange(offset, offset + row_group.num_rows))
+        offset += row_group.num_rows
+
+    read_columns = None
+    if columns is not None:
+        read_columns = list(columns) + [col for col, _, _ in filters if col not in columns]
+    if row_groups:
+        table = parquet_file.read_row_groups(row_groups, columns=read_columns, use_pandas_metadata=True)
+    else:
+        table = schema.empty_table()
+        if read_columns is not None:
+            table = table.select(read_columns)
+
+    expression = None
+    for column, op, value in filters:
+        condition = FILTER_OPERATORS[op](pc.field(column), value)
+        expression = condition if expression is None else expression & condition
+    position_column = '__row_position__'
+    table = table.append_column(position_column, pa.array(np.concatenate(positions) if positions else [], type=pa.int64()))
+    try:
+        table = table.filter(expression)
+    except (pa.ArrowException, TypeError):
+        return pd.read_parquet(path, columns=columns)
+
+    row_positions = table.column(position_column).to_numpy()
+    table = table.drop_columns([position_column])
+    if columns is not None:
+        table = table.select(list(columns))
+    df = table.to_pandas()
+
+    # A full read gives integer and bool columns with nulls anywhere in the file as
+    # float64 and object; the kept rows may have none, so convert them the same way
+    for column in df.columns:
+        dtype = df[column].dtype
+        if not isinstance(dtype, np.dtype) or dtype.kind not in 'iub':
+            continue
+        null_count = _file_null_count(metadata, column_positions, column)
+        if null_count is None:
+            return pd.read_parquet(path, columns=columns)
+        if null_count:
+            df[column] = df[column].astype(object if dtype.kind == 'b' else np.float64)
+
+    # Same labels as a full read: the stored RangeIndex (or the default one) at those positions
+    start, step, name = 0, 1, None
+    if index_columns:
+        start, step, name = index_columns[0]['start'], index_columns[0]['step'], index_columns[0].get('name')
+    df.index = pd.Index(start + step * row_positions, name=name)
+    return df
+
+
 def load_questions(qa_path):
     """Load the questions from file."""
     with open(qa_path, encoding='utf-8') as f:
@@ -1,9 +1,17 @@
 import pandas as pd
 import numpy as np
+import pyarrow.parquet as pq
 import re
 import json
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from .data_loading import SHARED_DATASETS, publish_shared_dataset
+from .dataset_catalog import get_catalog, SAMPLE_FOLDER
+
+# Size of the dataset samples used to validate generated code before the full run
+DATASET_SAMPLE_ROWS = int(os.getenv('DATASET_SAMPLE_ROWS', '2000'))
+# Columns with at most this many distinct values have every value kept in the sample
+SAMPLE_STRATIFY_MAX_UNIQUE = 100
 
 
 def normalize_letters(text):
@@ -119,5 +127,91 @@ def save_preprocessed_dataset(df: pd.DataFrame, file_name: str, output_dir: str
     # Save as parquet by default (more efficient)
     output_path = os.path.join(output_dir, f"{file_name}.parquet")
     df.to_parquet(output_path, index=False)
+
+    # Publish it to shared memory right away so workers map it instead of reading the file
+    if SHARED_DATASETS in ('on', 'arrow'):
+        try:
+            publish_shared_dataset(output_path)
+        except Exception:
+            # Readers publish it themselves on first use
+            pass
     
-    return output_path 
\ No newline at end of file
+    return output_path 
+
+
+def create_dataset_sample(df: pd.DataFrame, max_rows: int = DATASET_SAMPLE_ROWS, random_state: int = 0) -> pd.DataFrame:
+    """
+    Take a stratified sample of a dataset for validating generated code.
+
+    Every value of each low-cardinality column (categories, flags, types, ...) is kept
+    at least once, so filters on those values still match rows in the sample, and the
+    rest of the sample is drawn at random. Rows keep their order, index and dtypes
+    (categorical columns keep all their categories).
+
+    Args:
+        df (pd.DataFrame): The full dataset
+        max_rows (int): Target number of rows
+        random_state (int): Seed for the random rows
+
+    Returns:
+        pd.DataFrame: The sample (the dataset itself if it has at most max_rows rows)
+    """
+    if len(df) <= max_rows:
+        return df.copy()
+
+    keep = np.zeros(len(df), dtype=bool)
+    for column in df.columns:
+        try:
+            values = df[column]
+            if values.nunique(dropna=False) <= SAMPLE_STRATIFY_MAX_UNIQUE:
+                keep |= ~values.duplicated().to_numpy()
+        except TypeError:
+            # Unhashable values (lists, dicts) cannot be stratified on
+            continue
+
+    positions = np.flatnonzero(keep)[:max_rows]
+    remaining = max_rows - len(positions)
+    if remaining > 0:
+        rng = np.random.default_rng(random_state)
+        candidates = np.flatnonzero(~keep)
+        positions = np.concatenate([positions, rng.choice(candidates, size=min(remaining, len(candidates)), replace=False)])
+    return df.iloc[np.sort(positions)]
+
+
+def ensure_dataset_sample(dataset_name: str, dataset_folder_path: str = "datasets") -> Optional[str]:
+    """
+    Return the path of the sample of a dataset, creating or refreshing it if needed.
+
+    Samples are written to <dataset folder>/samples/<dataset>.parquet and rebuilt when
+    the dataset file is newer. Datasets with at most DATASET_SAMPLE_ROWS rows have no
+    sample, since running on them is as cheap as on a sample.
+
+    Args:
+        dataset_name (str): Name of the dataset (file name without extension)
+        dataset_folder_path (str): The folder holding the dataset
+
+    Returns:
+        Optional[str]: The sample path, or None if the dataset has no sample
+    """
+    catalog = get_catalog(dataset_folder_path)
+    file_path, _ = catalog.resolve(dataset_name)
+    if file_path is None:
+        return None
+
+    sample_dir = os.path.join(catalog.dataset_folder_path, SAMPLE_FOLDER)
+    sample_path = os.path.join(sample_dir, f"{dataset_name}.parquet")
+    if os.path.exists(sample_path) and os.path.getmtime(sample_path) >= os.path.getmtime(file_path):
+        return sample_path
+
+    if file_path.endswith('.parquet') and pq.read_metadata(file_path).num_rows <= DATASET_SAMPLE_ROWS:
+        # The parquet footer holds the row count, so small datasets are never read
+        return None
+    df = catalog.load(file_path, copy=False)
+    if len(df) <= DATASET_SAMPLE_ROWS:
+        return None
+
+    os.makedirs(sample_dir, exist_ok=True)
+    temp_path = f"{sample_path}.{os.getpid()}.tmp"
+    create_dataset_sample(df).to_parquet(temp_path)
+    os.replace(temp_path, sample_path)
+    return sample_path
@@ -0,0 +1,197 @@
+"""
+Dataset Catalog
+Resolves the dataset paths used in generated code against the dataset folder and
+keeps loaded datasets in memory, so repeated questions on a dataset do no file I/O.
+"""
+
+import os
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from .caching import LRUCache
+from .data_loading import read_dataset
+from .metrics import timed
+
+# Load environment variables
+load_dotenv()
+
+# Dataset file extensions in lookup order, with the pandas reader for each
+SUPPORTED_EXTENSIONS = [
+    ('.parquet', 'read_parquet'),
+    ('.csv', 'read_csv'),
+    ('.json', 'read_json'),
+    ('.xlsx', 'read_excel')
+]
+
+# Folder, inside a dataset folder, with the dataset samples used to validate generated code
+SAMPLE_FOLDER = 'samples'
+
+# Number of datasets kept loaded, and the largest file (on disk) that is kept in memory
+DATASET_CACHE_MAX_ENTRIES = int(os.getenv('DATASET_CACHE_MAX_ENTRIES', '16'))
+DATASET_CACHE_MAX_MB = float(os.getenv('DATASET_CACHE_MAX_MB', '256'))
+
+
+class DatasetCatalog:
+    """
+    The datasets in one folder, by name, plus an in-memory cache of loaded frames.
+
+    The folder listing is re-read only when the folder's modification time changes,
+    and cached frames are keyed on the file's mtime and size, so re-uploading a
+    dataset invalidates its entry. Cached frames are never handed out directly:
+    load() returns a copy, so code that modifies its frame cannot affect others,
+    or, for callers that only read it, a shallow copy sharing the cached data.
+    """
+
+    def __init__(self, dataset_folder_path: str = "datasets/", max_entries: int = DATASET_CACHE_MAX_ENTRIES,
+                 max_dataset_mb: float = DATASET_CACHE_MAX_MB):
+        self.dataset_folder_path = dataset_folder_path.rstrip("/\\") + "/"
+        self.max_dataset_bytes = max_dataset_mb * 1024 * 1024
+        self._frames = LRUCache(max_entries)
+        self._files = {}
+        self._listing_mtime = None
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.loads = 0
+
+    def _dataset_files(self) -> Dict[str, Tuple[str, str]]:
+        """Return {dataset_name: (file_path, reader)}, re-listing the folder only when it changed."""
+        try:
+            mtime = os.stat(self.dataset_folder_path).st_mtime_ns
+        except OSError:
+            return {}
+        with self._lock:
+            if mtime != self._listing_mtime:
+                names = set(os.listdir(self.dataset_folder_path))
+                files = {}
+                for ext, reader in SUPPORTED_EXTENSIONS:
+                    for name in names:
+                        dataset_name, file_ext = os.path.splitext(name)
+                        if file_ext == ext and dataset_name not in files:
+                            files[dataset_name] = (f"{self.dataset_folder_path}{name}", reader)
+                self._files = files
+                self._listing_mtime = mtime
+            return self._files
+
+    def resolve(self, path: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Resolve a path written in generated code to a dataset file.
+
+        Only the base name matters, so 'ING.parquet', 'data/050_ING.csv' and the
+        full dataset path all resolve to the dataset's actual file.
+
+        Returns:
+            Tuple: (file_path, pandas_reader), or (None, None) if there is no such dataset.
+        """
+        dataset_name = os.path.splitext(os.path.basename(path))[0]
+        return self._dataset_files().get(dataset_name, (None, None))
+
+    def dataset_names(self) -> List[str]:
+        """Return the names of the datasets in the folder."""
+        return sorted(self._dataset_files())
+
+    def is_cacheable(self, file_path: str) -> bool:
+        """Check whether a dataset file is small enough to be kept in memory."""
+        try:
+            return os.path.getsize(file_path) <= self.max_dataset_bytes
+        except OSError:
+            return False
+
+    @timed('dataset_load')
+    def load(self, file_path: str, columns: Optional[List[str]] = None, copy: bool = True) -> pd.DataFrame:
+        """
+        Return the dataset in file_path, from memory when it is loaded and unchanged.
+
+        Args:
+            file_path (str): Path to the dataset file
+            columns (list, optional): Columns to return, as for pd.read_parquet
+            copy (bool): Return a private copy. With False the frame shares its data
+                with the cache, so the caller must not modify it in place
+
+        Returns:
+            pd.DataFrame: The (column-projected) dataset
+        """
+        stat = os.stat(file_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        key = os.path.abspath(file_path)
+
+        entry = self._frames.get(key)
+        if entry is None or entry[0] != version:
+            # One load per file at a time; concurrent callers wait and reuse it
+            with self._lock:
+                load_lock = self._load_locks.setdefault(key, threading.Lock())
+            with load_lock:
+                entry = self._frames.get(key)
+                if entry is None or entry[0] != version:
+                    entry = (version, read_dataset(file_path))
+                    self.loads += 1
+                    if stat.st_size <= self.max_dataset_bytes:
+                        self._frames.put(key, entry)
+
+        df = entry[1]
+        if columns is None:
+            return df.copy(deep=copy)
+        columns = list(columns)
+        if copy or not df.columns.is_unique or len(set(columns)) != len(columns) \
+                or not all(column in df.columns for column in columns):
+            # Selecting columns copies them (and raises pandas' usual KeyError for missing ones)
+            return df[columns]
+        # Built from the column Series, the frame shares their data
+        return pd.DataFrame({column: df[column] for column in columns}, copy=False)
+
+    def clear(self):
+        """Drop every loaded dataset."""
+        self._frames.clear()
+
+    def stats(self) -> Dict[str, object]:
+        """Return cache counters."""
+        stats = self._frames.stats()
+        stats['loads'] = self.loads
+        return stats
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+_fingerprints = {}
+
+
+def dataset_fingerprint(file_path: str) -> str:
+    """
+    Return a hash of a dataset file's content.
+
+    The hash is computed once per version (mtime and size) of the file, so repeated
+    calls only cost a stat.
+    """
+    stat = os.stat(file_path)
+    key = os.path.abspath(file_path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _catalogs_lock:
+        cached = _fingerprints.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    fingerprint = digest.hexdigest()
+    with _catalogs_lock:
+        _fingerprints[key] = (version, fingerprint)
+    return fingerprint
+
+
+def get_catalog(dataset_folder_path: str = "datasets/") -> DatasetCatalog:
+    """Return the shared catalog for a dataset folder."""
+    key = os.path.abspath(dataset_folder_path)
+    with _catalogs_lock:
+        if key not in _catalogs:
+            _catalogs[key] = DatasetCatalog(dataset_folder_path)
+        return _catalogs[key]
+
+
+def load_dataset(file_path: str, columns: Optional[List[str]] = None, copy: bool = True) -> pd.DataFrame:
+    """Load a dataset through the catalog of its folder (used by rewritten generated code)."""
+    return get_catalog(os.path.dirname(file_path) or ".").load(file_path, columns, copy)
@@ -0,0 +1,161 @@
+"""
+DuckDB Dataset Handler
+Runs SQL directly over dataset files with an in-process DuckDB engine, so large
+files are scanned (with projection/predicate pushdown) instead of loaded into pandas.
+"""
+
+import os
+import copy
+import duckdb
+import pandas as pd
+from typing import List, Dict, Any
+from dotenv import load_dotenv
+from .caching import LRUCache
+from .dataset_catalog import dataset_fingerprint
+from .metrics import register_stats
+
+# Load environment variables
+load_dotenv()
+
+# DuckDB table functions for the dataset formats it can scan directly
+DUCKDB_READERS = {
+    '.parquet': 'read_parquet',
+    '.csv': 'read_csv_auto',
+    '.json': 'read_json_auto'
+}
+
+# Schemas (with their row and distinct counts, which take full scans), by dataset file content
+DUCKDB_SCHEMA_CACHE_MAX_ENTRIES = int(os.getenv("DUCKDB_SCHEMA_CACHE_MAX_ENTRIES", "64"))
+_schemas = LRUCache(DUCKDB_SCHEMA_CACHE_MAX_ENTRIES)
+register_stats('duckdb_schema_cache', _schemas.stats)
+
+
+def quote_identifier(name: str) -> str:
+    """Quote an identifier for DuckDB SQL."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def supports_file(file_path: str) -> bool:
+    """Check whether DuckDB can scan the given dataset file."""
+    return os.path.splitext(file_path)[1].lower() in DUCKDB_READERS
+
+
+class DuckDBHandler:
+    """Query a single dataset file with DuckDB, exposed as a view named after the dataset."""
+
+    def __init__(self, dataset_name: str, file_path: str):
+        """Open an in-memory DuckDB connection with a view over the dataset file."""
+        file_extension = os.path.splitext(file_path)[1].lower()
+        if file_extension not in DUCKDB_READERS:
+            raise ValueError(f"Unsupported file format for DuckDB: {file_extension}")
+
+        self.dataset_name = dataset_name
+        self.file_path = file_path
+        self.conn = duckdb.connect()
+
+        # Optional resource limits; DuckDB spills to disk above the memory limit
+        if os.getenv('DUCKDB_MEMORY_LIMIT'):
+            self.conn.execute(f"SET memory_limit = '{os.getenv('DUCKDB_MEMORY_LIMIT')}'")
+        if os.getenv('DUCKDB_THREADS'):
+            self.conn.execute(f"SET threads = {int(os.getenv('DUCKDB_THREADS'))}")
+
+        reader = DUCKDB_READERS[file_extension]
+        escaped_path = file_path.replace("'", "''")
+        self.conn.execute(
+            f"CREATE VIEW {quote_identifier(dataset_name)} AS SELECT * FROM {reader}('{escaped_path}')"
+        )
+
+    def get_table_schema(self) -> Dict[str, Any]:
+        """
+        Get schema information for the dataset in the same shape as MySQLHandler.get_table_schema.
+
+        The schema is computed once per version of the dataset file's content.
+        """
+        try:
+            key = (self.dataset_name, dataset_fingerprint(self.file_path))
+        except OSError:
+            return self._read_table_schema()
+        schema = _schemas.get(key)
+        if schema is None:
+            schema = self._read_table_schema()
+            _schemas.put(key, schema)
+        return copy.deepcopy(schema)
+
+    def _read_table_schema(self) -> Dict[str, Any]:
+        """Compute the dataset schema, with row count, unique counts and example values."""
+        table = quote_identifier(self.dataset_name)
+        try:
+            described = self.conn.execute(f"DESCRIBE {table}").fetchall()
+            column_names = [row[0] for row in described]
+            column_types = [row[1] for row in described]
+
+            # Row count and unique counts for every column in a single scan
+            aggregates = ", ".join(f"COUNT(DISTINCT {quote_identifier(col)})" for col in column_names)
+            counts = self.conn.execute(f"SELECT COUNT(*), {aggregates} FROM {table}").fetchone()
+            row_count = counts[0]
+
+            sample_data = self.conn.execute(f"SELECT * FROM {table} LIMIT 5").fetchall()
+
+            column_info = []
+            for i, col_name in enumerate(column_names):
+                column = quote_identifier(col_name)
+                distinct_result = self.conn.execute(
+                    f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL LIMIT 5"
+                ).fetchall()
+
+                # Process example values the same way as the MySQL schema
+                processed_values = []
+                cumulative_char_count = 0
+                for (value,) in distinct_result:
+                    if cumulative_char_count > 50:
+                        break
+                    value = str(value)
+                    if len(value) > 100:
+                        value = value[:97] + "..."
+                    processed_values.append(value)
+                    cumulative_char_count += len(value)
+
+                column_info.append({
+                    'name': col_name,
+                    'type': column_types[i],
+                    'nullable': True,
+                    'default': None,
+                    'primary_key': False,
+                    'example_values': processed_values,
+                    'total_unique': counts[i + 1]
+                })
+
+            return {
+                'table_name': self.dataset_name,
+                'database_name': 'datasets',
+                'row_count': row_count,
+                'columns': column_info,
+                'sample_data': [list(row) for row in sample_data]
+            }
+        except duckdb.Error as e:
+            raise Exception(f"Failed to get schema for dataset '{self.dataset_name}': {str(e)}")
+
+    def get_column_names(self) -> List[str]:
+        """Get the dataset's column names without scanning the data."""
+        return [row[0] for row in self.conn.execute(f"DESCRIBE {quote_identifier(self.dataset_name)}").fetchall()]
+
+    def execute_query(self, query: str, limit: int = 100) -> pd.DataFrame:
+        """Execute a SQL query and return results as pandas DataFrame."""
+        try:
+            # Add LIMIT clause if not already present
+            query_lower = query.lower().strip()
+            if not query_lower.startswith('select'):
+                raise Exception("Only SELECT queries are allowed")
+
+            if 'limit' not in query_lower:
+                query = f"{query.rstrip().rstrip(';')} LIMIT {limit}"
+
+            return self.conn.execute(query).df()
+        except duckdb.Error as e:
+            raise Exception(f"Query execution failed: {str(e)}")
+
+    def close_connection(self):
+        """Close the DuckDB connection."""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
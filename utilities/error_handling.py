@@ -1,5 +1,15 @@
+import os
+import re
+import difflib
 import logging
 import traceback
+from typing import List, Tuple
+from .prompts import estimate_tokens
+
+# Token ceiling for the failed attempts sent back to the LLM on a retry
+RETRY_CONTEXT_MAX_TOKENS = int(os.getenv("RETRY_CONTEXT_MAX_TOKENS", "1500"))
+# Longest error message, in characters, kept for the latest attempt
+RETRY_ERROR_MAX_CHARS = 1500
 
 
 def classify_error(exc):
@@ -12,4 +22,102 @@ def classify_error(exc):
     elif "groupby" in msg or "aggregation" in msg or "cannot insert" in msg:
         return "logic"
     else:
-        return "other" 
\ No newline at end of file
+        return "other" 
+
+
+# Errors from a run on a dataset sample that do not depend on which rows are present
+SAMPLE_TRUSTED_ERRORS = (SyntaxError, NameError, ImportError)
+# TypeErrors raised by the dtype or the kind of values of a column...
+_DTYPE_ERROR = re.compile(
+    r"dtype|could not convert|unsupported operand type|can only concatenate|not supported between instances",
+    re.IGNORECASE
+)
+# ...unless they involve missing values, which empty selections on a sample produce
+_MISSING_VALUE_ERROR = re.compile(r"NoneType|'float'|NaTType|NAType|\bnan\b")
+
+
+def is_dtype_error(exc) -> bool:
+    """
+    Tell whether a TypeError comes from the dtype of the data rather than from the rows present.
+
+    A sample holds a subset of the dataset's rows with the same dtypes, so e.g. strings
+    in a column averaged on the sample are in the full dataset too. Errors involving
+    None, NaN or NaT are excluded: on a sample they often come from a selection that
+    happens to be empty.
+    """
+    message = str(exc)
+    return isinstance(exc, TypeError) and bool(_DTYPE_ERROR.search(message)) \
+        and not _MISSING_VALUE_ERROR.search(message)
+
+
+def key_error_line(message: str) -> str:
+    """Return the line of an error message (or traceback) that names the exception."""
+    lines = [line.strip() for line in str(message).strip().splitlines() if line.strip()]
+    if not lines:
+        return ""
+    for line in reversed(lines):
+        if re.match(r"^[\w.]*(Error|Exception|Warning)\b", line):
+            return line[:300]
+    return lines[-1][:300]
+
+
+def _shorten_error(message: str, max_chars: int) -> str:
+    """Keep the start and the key line of a long error message."""
+    message = str(message).strip()
+    if len(message) <= max_chars:
+        return message
+    key_line = key_error_line(message)
+    return message[:max(0, max_chars - len(key_line) - 5)].rstrip() + "\n...\n" + key_line
+
+
+def compress_error_history(attempts: List[Tuple[str, str]], max_tokens: int = RETRY_CONTEXT_MAX_TOKENS) -> Tuple[str, str, str]:
+    """
+    Compress failed attempts (oldest→newest) into a bounded retry context.
+
+    Only the latest code is kept in full; each earlier attempt is reduced to its
+    key exception line and the diff between its code and the latest code.
+    Attempts that failed with the same error are merged. The oldest entries are
+    dropped, then the latest error is shortened, to stay within max_tokens.
+
+    Returns:
+    Tuple: (summary of the earlier attempts, or "" if there are none,
+            latest code, latest error message)
+    """
+    last_code, last_error = attempts[-1]
+    last_key = key_error_line(last_error)
+    last_error = _shorten_error(last_error, RETRY_ERROR_MAX_CHARS)
+
+    # Merge earlier attempts by error, keeping the most recent code for each
+    merged = {}
+    for number, (code, error) in enumerate(attempts[:-1], start=1):
+        key = key_error_line(error)
+        numbers = merged.pop(key, ([], None))[0]
+        merged[key] = (numbers + [number], code)
+
+    entries = []
+    for key, (numbers, code) in merged.items():
+        label = f"Attempt {numbers[0]}" if len(numbers) == 1 else f"Attempts {', '.join(map(str, numbers))}"
+        if key == last_key:
+            entries.append(f"{label}: failed with the same error as the latest code.")
+            continue
+        diff = "\n".join(line for line in difflib.unified_diff(
+            code.strip().splitlines(), last_code.strip().splitlines(), lineterm="", n=0
+        ) if not line.startswith(("---", "+++", "@@")))
+        entry = f"{label}: {key}"
+        if diff:
+            entry += f"\nChanges from that code to the latest code:\n```diff\n{diff}\n```"
+        else:
+            entry += "\n(the code was the same as the latest code)"
+        entries.append(entry)
+
+    def summary():
+        if not entries:
+            return ""
+        return "Earlier attempts that also failed:\n" + "\n".join(entries)
+
+    fixed_tokens = estimate_tokens(last_code) + estimate_tokens(last_error)
+    while entries and fixed_tokens + estimate_tokens(summary()) > max_tokens:
+        entries.pop(0)
+    if fixed_tokens > max_tokens:
+        last_error = _shorten_error(last_error, max(300, (max_tokens - estimate_tokens(last_code)) * 4))
+    return summary(), last_code, last_error
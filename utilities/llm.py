@@ -0,0 +1,355 @@
+"""
+LLM Calls
+A single entry point for chat completions. Calls share a rate limiter (requests and
+tokens per minute, adapted to the provider's 429 responses), are retried with jittered
+backoff, and record their token usage and latency (total, and time to first token
+when streaming), both in the process-wide metrics and for whatever unit of work is
+being tracked (e.g. a question).
+"""
+
+import os
+import time
+import random
+import contextvars
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from types import SimpleNamespace
+from typing import Any, Dict, Optional, Tuple
+
+import openai
+from dotenv import load_dotenv
+
+from .metrics import increment, register_stats, record_timing
+from .prompts import estimate_tokens
+
+# Load environment variables
+load_dotenv()
+
+# Provider quota (0 = unlimited); the limiter keeps requests under it
+LLM_REQUESTS_PER_MINUTE = float(os.getenv('LLM_REQUESTS_PER_MINUTE', '0'))
+LLM_TOKENS_PER_MINUTE = float(os.getenv('LLM_TOKENS_PER_MINUTE', '0'))
+# Retries of rate-limited and transient failures, with jittered exponential backoff
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '5'))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '1'))
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '60'))
+# Stream completions, which also measures the time to first token
+LLM_STREAM = os.getenv('LLM_STREAM', 'false').lower() == 'true'
+
+# Seconds of quota that may be used in a burst
+BURST_SECONDS = 10
+# AIMD: the allowed rate halves on a 429 and recovers by this fraction per success
+RATE_DECREASE_FACTOR = 0.5
+RATE_INCREASE_STEP = 0.05
+MIN_RATE_SCALE = 0.1
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError
+)
+
+
+class LLMUsage:
+    """
+    Calls and tokens used by the LLM requests made inside a track_usage() block (and added to the enclosing one).
+
+    With metrics_prefix, every call is also added to the <prefix>.llm_calls/.prompt_tokens/
+    .cached_prompt_tokens/.completion_tokens counters as it completes, so calls that
+    finish after the block has exited (e.g. abandoned speculative candidates) still count.
+    """
+
+    def __init__(self, parent: Optional["LLMUsage"] = None, metrics_prefix: Optional[str] = None):
+        self.parent = parent
+        self.metrics_prefix = metrics_prefix
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_prompt_tokens += cached_prompt_tokens
+            self.completion_tokens += completion_tokens
+        if self.metrics_prefix:
+            increment(f'{self.metrics_prefix}.llm_calls')
+            increment(f'{self.metrics_prefix}.prompt_tokens', prompt_tokens)
+            increment(f'{self.metrics_prefix}.cached_prompt_tokens', cached_prompt_tokens)
+            increment(f'{self.metrics_prefix}.completion_tokens', completion_tokens)
+        if self.parent is not None:
+            self.parent.add(prompt_tokens, completion_tokens, cached_prompt_tokens)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            'calls': self.calls,
+            'prompt_tokens': self.prompt_tokens,
+            'cached_prompt_tokens': self.cached_prompt_tokens,
+            'uncached_prompt_tokens': self.prompt_tokens - self.cached_prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.total_tokens
+        }
+
+
+_current_usage = contextvars.ContextVar('llm_usage', default=None)
+
+
+@contextmanager
+def track_usage(metrics_prefix: Optional[str] = None):
+    """
+    Collect the usage of LLM calls made inside the block.
+
+    The tracker lives in a context variable, so calls made from tasks and from
+    threads started with asyncio.to_thread / run_in_threadpool are included.
+    Blocks may be nested; calls count towards every enclosing block.
+    """
+    usage = LLMUsage(_current_usage.get(), metrics_prefix)
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(token)
+
+
+class RateLimiter:
+    """
+    Token buckets for requests and tokens per minute, shared by every LLM call.
+
+    acquire() blocks until a request fits in both budgets. The refill rate is scaled
+    additively-increase/multiplicatively-decrease: a 429 halves it (and pauses every
+    caller for the provider's Retry-After), each success raises it a step back
+    towards the configured quota. Buckets may go into debt, so a request larger
+    than the burst still goes through once the bucket has refilled.
+    """
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_level = self._capacity(requests_per_minute)
+        self._token_level = self._capacity(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.rate_scale = 1.0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.rate_limited = 0
+
+    @staticmethod
+    def _capacity(per_minute: float) -> float:
+        return max(1.0, per_minute * BURST_SECONDS / 60) if per_minute else 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._request_level = min(self._capacity(self.requests_per_minute),
+                                      self._request_level + elapsed * self.requests_per_minute / 60 * self.rate_scale)
+        if self.tokens_per_minute:
+            self._token_level = min(self._capacity(self.tokens_per_minute),
+                                    self._token_level + elapsed * self.tokens_per_minute / 60 * self.rate_scale)
+
+    def _wait_time(self, now: float) -> float:
+        """Seconds until a request may start (0 if it may start now)."""
+        wait = self._blocked_until - now
+        if self.requests_per_minute and self._request_level < 1:
+            wait = max(wait, (1 - self._request_level) * 60 / (self.requests_per_minute * self.rate_scale))
+        if self.tokens_per_minute and self._token_level <= 0:
+            wait = max(wait, -self._token_level * 60 / (self.tokens_per_minute * self.rate_scale) + 0.01)
+        return wait
+
+    def acquire(self, tokens: int = 0):
+        """Block until a request using about tokens tokens fits in the quota, then reserve it."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._wait_time(now)
+                if wait <= 0:
+                    if self.requests_per_minute:
+                        self._request_level -= 1
+                    if self.tokens_per_minute:
+                        self._token_level -= tokens
+                    if waited:
+                        self.waits += 1
+                        self.wait_seconds += waited
+                    return
+            time.sleep(min(wait, 1.0))
+            waited += min(wait, 1.0)
+
+    def record_usage(self, reserved_tokens: int, used_tokens: int):
+        """Correct the token bucket once a request's actual usage is known."""
+        if self.tokens_per_minute:
+            with self._lock:
+                self._token_level += reserved_tokens - used_tokens
+
+    def on_success(self):
+        """Additive increase of the rate after a successful request."""
+        with self._lock:
+            self.rate_scale = min(1.0, self.rate_scale + RATE_INCREASE_STEP)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        """Multiplicative decrease of the rate, and a pause for every caller if the provider asked for one."""
+        with self._lock:
+            self.rate_limited += 1
+            self.rate_scale = max(MIN_RATE_SCALE, self.rate_scale * RATE_DECREASE_FACTOR)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the configured quota, the current rate scale and wait counters."""
+        with self._lock:
+            return {
+                'requests_per_minute': self.requests_per_minute,
+                'tokens_per_minute': self.tokens_per_minute,
+                'rate_scale': self.rate_scale,
+                'rate_limited': self.rate_limited,
+                'waits': self.waits,
+                'wait_seconds': self.wait_seconds
+            }
+
+
+rate_limiter = RateLimiter(LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+register_stats('llm_rate_limiter', rate_limiter.stats)
+
+
+def estimate_prompt_tokens(messages) -> int:
+    """Estimate the prompt tokens of chat messages."""
+    return sum(estimate_tokens(str(message.get('content', ''))) for message in messages)
+
+
+def cached_tokens(usage) -> int:
+    """
+    Return the prompt tokens the provider served from its prompt cache.
+
+    OpenAI-compatible APIs report them in usage.prompt_tokens_details.cached_tokens,
+    DeepSeek in usage.prompt_cache_hit_tokens.
+    """
+    details = getattr(usage, 'prompt_tokens_details', None)
+    if isinstance(details, dict):
+        cached = details.get('cached_tokens')
+    else:
+        cached = getattr(details, 'cached_tokens', None)
+    if cached is None:
+        cached = getattr(usage, 'prompt_cache_hit_tokens', None)
+    return cached or 0
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Return the delay the provider asked for in a Retry-After(-ms) header, if any."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_seconds(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given retry (0-based)."""
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+
+def stream_chat_completion(provider, **completion_args) -> Tuple[Any, Optional[float]]:
+    """
+    Create a streamed chat completion and assemble it into a response like a non-streamed one.
+
+    Returns:
+    Tuple: (response with choices[0].message.content and usage, seconds to the first
+    content or reasoning token, or None if none arrived)
+    """
+    start = time.perf_counter()
+    stream = provider.chat.completions.create(stream=True, stream_options={'include_usage': True}, **completion_args)
+    first_token = None
+    content = []
+    usage = None
+    for chunk in stream:
+        if getattr(chunk, 'usage', None):
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        text = getattr(delta, 'content', None)
+        if first_token is None and (text or getattr(delta, 'reasoning_content', None)):
+            first_token = time.perf_counter() - start
+        if text:
+            content.append(text)
+    message = SimpleNamespace(role='assistant', content="".join(content))
+    return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message)], usage=usage), first_token
+
+
+def create_chat_completion(provider, **completion_args) -> Any:
+    """
+    Create a chat completion with provider and record its token usage.
+
+    The call waits for the shared rate limiter, and rate-limited (429), timed-out,
+    connection and server errors are retried up to LLM_MAX_RETRIES times with
+    jittered exponential backoff, waiting at least as long as Retry-After asks.
+    With LLM_STREAM the completion is streamed (see stream_chat_completion).
+
+    Parameters:
+    provider: An openai.OpenAI client.
+    completion_args: Arguments for chat.completions.create.
+
+    Returns:
+    The chat completion response.
+    """
+    # Reserve the prompt plus the most the completion may use; the difference is settled from usage
+    reserved_tokens = estimate_prompt_tokens(completion_args.get('messages', [])) \
+        + (completion_args.get('max_tokens') or completion_args.get('max_completion_tokens') or 0)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        start = time.perf_counter()
+        rate_limiter.acquire(reserved_tokens)
+        record_timing('llm_wait', time.perf_counter() - start)
+        start = time.perf_counter()
+        try:
+            if LLM_STREAM:
+                response, first_token = stream_chat_completion(provider, **completion_args)
+                if first_token is not None:
+                    record_timing('llm_ttft', first_token)
+            else:
+                response = provider.chat.completions.create(**completion_args)
+            record_timing('llm_total', time.perf_counter() - start)
+            break
+        except RETRYABLE_ERRORS as e:
+            retry_after = retry_after_seconds(e)
+            if isinstance(e, openai.RateLimitError):
+                increment('llm.rate_limited')
+                rate_limiter.on_rate_limited(retry_after)
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            increment('llm.retries')
+            time.sleep(max(backoff_seconds(attempt), retry_after or 0))
+
+    usage = getattr(response, 'usage', None)
+    prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+    completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+    cached_prompt_tokens = cached_tokens(usage)
+    rate_limiter.on_success()
+    rate_limiter.record_usage(reserved_tokens, (prompt_tokens + completion_tokens) if usage else reserved_tokens)
+    increment('llm.calls')
+    increment('llm.prompt_tokens', prompt_tokens)
+    increment('llm.cached_prompt_tokens', cached_prompt_tokens)
+    increment('llm.completion_tokens', completion_tokens)
+    tracker = _current_usage.get()
+    if tracker is not None:
+        tracker.add(prompt_tokens, completion_tokens, cached_prompt_tokens)
+    return response
@@ -0,0 +1,258 @@
+"""
+Metrics
+Process-wide counters, latency histograms per pipeline stage, and a registry of
+components (caches, pools, ...) that report their own stats, collected together for
+the metrics endpoints (JSON, and Prometheus text format). Stage timings are also
+collected per request while a track_timings() block is active.
+"""
+
+import bisect
+import contextvars
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Attach each question's timing breakdown to its response / pipeline result
+DEBUG_TIMINGS = os.getenv("DEBUG_TIMINGS", "false").lower() == "true"
+
+_lock = threading.Lock()
+_counters = {}
+_providers = {}
+_histograms = {}
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+PROMETHEUS_PREFIX = "easyqa"
+
+
+def increment(name: str, value: float = 1):
+    """Add value to the named counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def get_counters() -> Dict[str, float]:
+    """Return a copy of all counters."""
+    with _lock:
+        return dict(_counters)
+
+
+def register_stats(name: str, provider: Callable[[], Dict[str, Any]]):
+    """Register a function returning a component's stats under name (replacing any previous one)."""
+    with _lock:
+        _providers[name] = provider
+
+
+def snapshot() -> Dict[str, Any]:
+    """Return the counters, histogram summaries and the current stats of every registered component."""
+    with _lock:
+        providers = dict(_providers)
+        result = {'counters': dict(_counters)}
+        result['histograms'] = {
+            name + _labels(labels): {'count': h.count, 'sum': h.sum, 'mean': h.sum / h.count if h.count else 0.0}
+            for (name, labels), h in sorted(_histograms.items())
+        }
+    for name, provider in providers.items():
+        try:
+            result[name] = provider()
+        except Exception as e:
+            result[name] = {'error': str(e)}
+    return result
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def observe(name: str, value: float, labels: Optional[Dict[str, str]] = None, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+    """Record value in the named histogram (one series per label set)."""
+    key = (name, tuple(sorted((labels or {}).items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram(buckets)
+        histogram.observe(value)
+
+
+class RequestTimings:
+    """Seconds spent per stage (summed over repeats, e.g. retries) by one request."""
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'seconds': {stage: round(seconds, 6) for stage, seconds in self.stages.items()},
+                'counts': dict(self.counts)
+            }
+
+
+_current_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+@contextmanager
+def track_timings():
+    """
+    Collect the stage timings recorded inside the block.
+
+    Like llm.track_usage, the collector lives in a context variable, so work done in
+    tasks and in threads started with asyncio.to_thread / run_in_threadpool counts.
+    """
+    timings = RequestTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def record_timing(stage: str, seconds: float):
+    """Record seconds spent in stage, in the stage histogram and the current request's timings."""
+    observe('stage_seconds', seconds, {'stage': stage})
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+def record_retries(retries: int, retry_start: Optional[float]):
+    """
+    Record a question's retries, the same way for every code path: the retries counter
+    counts the attempts after the first, and the 'retry' stage is the time from the
+    start of the first retry (time.perf_counter()) to the end of the question.
+    """
+    if retries and retry_start is not None:
+        increment('retries', retries)
+        record_timing('retry', time.perf_counter() - retry_start)
+
+
+@contextmanager
+def timed(stage: str):
+    """Time the block (or, used as a decorator, the function) as stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(stage, time.perf_counter() - start)
+
+
+def _metric_name(name: str) -> str:
+    return PROMETHEUS_PREFIX + "_" + re.sub(r"[^a-zA-Z0-9_]", "_", name).strip("_")
+
+
+def _labels(labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = tuple(labels) + extra
+    if not pairs:
+        return ""
+    escaped = []
+    for key, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _stats_gauges(name: str, stats: Any) -> Dict[str, float]:
+    """
+    Return the top-level numeric stats of a component as gauge name -> value.
+
+    Nested dicts are skipped: their keys may be data (e.g. per-key breakdowns), which
+    must not become metric names.
+    """
+    if not isinstance(stats, dict):
+        return {}
+    gauges = {}
+    for key, value in stats.items():
+        if isinstance(value, bool):
+            gauges[f"{name}_{key}"] = int(value)
+        elif isinstance(value, (int, float)):
+            gauges[f"{name}_{key}"] = value
+    return gauges
+
+
+def prometheus_text() -> str:
+    """
+    Return every metric in the Prometheus text exposition format.
+
+    Counters become counters, histograms keep their buckets, and the numeric stats
+    of registered components (cache sizes, hit rates, ...) become gauges. A metric
+    whose sanitized name collides with one already written is left out, since a
+    family that appears twice makes Prometheus reject the whole scrape.
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in _histograms.items()}
+        providers = dict(_providers)
+
+    lines = []
+    # Names in use, including the series names a histogram family reserves
+    used = set()
+    histogram_types = {}
+
+    def claim(names) -> bool:
+        if used.intersection(names):
+            increment('metrics.name_collisions')
+            return False
+        used.update(names)
+        return True
+
+    for name in sorted(counters):
+        metric = _metric_name(name) + "_total"
+        if claim([metric]):
+            lines += [f"# TYPE {metric} counter", f"{metric} {_number(counters[name])}"]
+
+    for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+        metric = _metric_name(name)
+        if metric not in histogram_types:
+            histogram_types[metric] = claim([metric] + [metric + suffix for suffix in ("_bucket", "_sum", "_count")])
+            if histogram_types[metric]:
+                lines.append(f"# TYPE {metric} histogram")
+        if not histogram_types[metric]:
+            continue
+        cumulative = 0
+        for bound, bucket_count in zip(buckets + (math.inf,), counts):
+            cumulative += bucket_count
+            lines.append(f"{metric}_bucket{_labels(labels, (('le', _number(bound)),))} {cumulative}")
+        lines.append(f"{metric}_sum{_labels(labels)} {_number(total)}")
+        lines.append(f"{metric}_count{_labels(labels)} {count}")
+
+    for name, provider in sorted(providers.items()):
+        try:
+            gauges = _stats_gauges(name, provider())
+        except Exception:
+            continue
+        for gauge, value in gauges.items():
+            metric = _metric_name(gauge)
+            if claim([metric]):
+                lines += [f"# TYPE {metric} gauge", f"{metric} {_number(value)}"]
+    return "\n".join(lines) + "\n"
@@ -4,16 +4,36 @@ Provides functionality for connecting to MySQL databases, discovering tables, an
 """
 
 import os
+import asyncio
+import functools
 import pandas as pd
 import pymysql
-from sqlalchemy import create_engine, text, inspect
+from sqlalchemy import create_engine, text, inspect, bindparam
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Shared, bounded pool for blocking MySQL calls made from async request handlers
+MYSQL_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv('MYSQL_MAX_WORKERS', '8')),
+    thread_name_prefix='mysql'
+)
+
+
+def shutdown_mysql_executor(wait: bool = True):
+    """
+    Stop the shared MySQL thread pool, at application shutdown.
+
+    Calls already running always finish; with wait they are waited for and queued
+    calls still run, otherwise queued calls are cancelled.
+    """
+    MYSQL_EXECUTOR.shutdown(wait=wait, cancel_futures=not wait)
+
+
 class MySQLHandler:
     """Handle MySQL database connections and operations."""
     
@@ -26,11 +46,15 @@ class MySQLHandler:
         self.engine = None
         self.current_database = None
     
+    def _connection_url(self, database_name: str = "") -> str:
+        """Build the SQLAlchemy connection URL, optionally selecting a database."""
+        return f"mysql+pymysql://{self.user}:{self.password}@{self.host}:{self.port}/{database_name}"
+    
     def test_connection(self) -> Tuple[bool, str]:
         """Test connection to MySQL server without selecting a database."""
         try:
             # Create connection URL without database
-            connection_url = f"mysql+pymysql://{self.user}:{self.password}@{self.host}:{self.port}/"
+            connection_url = self._connection_url()
             engine = create_engine(connection_url)
             
             # Test connection
@@ -47,7 +71,7 @@ class MySQLHandler:
         """Get list of available databases."""
         try:
             # Create connection URL without database
-            connection_url = f"mysql+pymysql://{self.user}:{self.password}@{self.host}:{self.port}/"
+            connection_url = self._connection_url()
             engine = create_engine(connection_url)
             
             with engine.connect() as conn:
@@ -66,7 +90,7 @@ class MySQLHandler:
         """Connect to a specific database."""
         try:
             # Create connection URL with database
-            connection_url = f"mysql+pymysql://{self.user}:{self.password}@{self.host}:{self.port}/{database_name}"
+            connection_url = self._connection_url(database_name)
             self.engine = create_engine(connection_url)
             
             # Test the connection
@@ -254,6 +278,51 @@ class MySQLHandler:
         except SQLAlchemyError as e:
             raise Exception(f"Query execution failed: {str(e)}")
     
+    def get_table_change_markers(self, table_names: List[str], database_name: str = None) -> Dict[str, Any]:
+        """
+        Get a change marker for each table, used to detect modified data.
+
+        Uses UPDATE_TIME and TABLE_ROWS from information_schema. Tables without an
+        UPDATE_TIME (e.g. InnoDB after a server restart, or views) and tables not
+        found there get None: their changes cannot be detected without scanning them.
+
+        The markers are cheap but not exact. UPDATE_TIME has one-second granularity,
+        so a second write within the same second as the first goes unnoticed, and
+        TABLE_ROWS is only an estimate for InnoDB. A result cached on these markers
+        can therefore be stale until the table is written again.
+        """
+        if not database_name:
+            database_name = self.current_database
+        
+        if not database_name:
+            raise Exception("No database selected")
+        
+        if not table_names:
+            return {}
+        
+        try:
+            # Ensure we're connected to the right database
+            if self.current_database != database_name:
+                self.connect_to_database(database_name)
+            
+            markers = {}
+            with self.engine.connect() as conn:
+                query = text("""
+                    SELECT TABLE_NAME, UPDATE_TIME, TABLE_ROWS
+                    FROM information_schema.TABLES
+                    WHERE TABLE_SCHEMA = :database AND TABLE_NAME IN :tables
+                """).bindparams(bindparam('tables', expanding=True))
+                result = conn.execute(query, {'database': database_name, 'tables': list(table_names)})
+                for name, update_time, table_rows in result.fetchall():
+                    markers[name] = (str(update_time), table_rows) if update_time else None
+            
+            for name in table_names:
+                markers.setdefault(name, None)
+            
+            return markers
+        except SQLAlchemyError as e:
+            raise Exception(f"Failed to get change markers: {str(e)}")
+    
     def get_table_preview(self, table_name: str, limit: int = 10) -> pd.DataFrame:
         """Get a preview of table data."""
         if not self.engine:
@@ -266,6 +335,29 @@ class MySQLHandler:
         except SQLAlchemyError as e:
             raise Exception(f"Failed to preview table '{table_name}': {str(e)}")
     
+    def get_row_count(self, table_name: str) -> int:
+        """Get the number of rows in a table."""
+        if not self.engine:
+            raise Exception("No database connection established")
+        
+        try:
+            with self.engine.connect() as conn:
+                count_result = conn.execute(text(f"SELECT COUNT(*) FROM `{table_name}`"))
+                return count_result.fetchone()[0]
+        except SQLAlchemyError as e:
+            raise Exception(f"Failed to count rows in table '{table_name}': {str(e)}")
+    
+    def get_table_page(self, table_name: str, limit: int, offset: int) -> pd.DataFrame:
+        """Get one page of table data."""
+        if not self.engine:
+            raise Exception("No database connection established")
+        
+        try:
+            query = f"SELECT * FROM `{table_name}` LIMIT {int(limit)} OFFSET {int(offset)}"
+            return pd.read_sql(query, self.engine)
+        except SQLAlchemyError as e:
+            raise Exception(f"Failed to read page of table '{table_name}': {str(e)}")
+    
     def get_multi_table_schema(self, table_names: List[str], database_name: str = None) -> Dict[str, any]:
         """Get detailed schema information for multiple tables with relationship analysis."""
         if not database_name:
@@ -331,4 +423,85 @@ class MySQLHandler:
         if self.engine:
             self.engine.dispose()
             self.engine = None
-            self.current_database = None 
\ No newline at end of file
+            self.current_database = None
+
+
+class AsyncMySQLHandler:
+    """
+    Async facade over MySQLHandler for use inside FastAPI handlers.
+
+    Every call runs on a bounded thread pool (MYSQL_MAX_WORKERS threads), so a slow
+    query blocks one worker thread instead of the event loop. Calls on one instance
+    run one after another, like the synchronous handler they wrap.
+
+    The pool is shared by every instance (pass executor to use another one) and is
+    stopped at application shutdown with shutdown_mysql_executor().
+    """
+    
+    def __init__(self, handler: Optional[MySQLHandler] = None, executor: Optional[ThreadPoolExecutor] = None):
+        """Wrap handler (a new MySQLHandler by default) and run its calls on executor."""
+        self.handler = handler if handler is not None else MySQLHandler()
+        self.executor = executor if executor is not None else MYSQL_EXECUTOR
+    
+    @property
+    def engine(self):
+        """The wrapped handler's SQLAlchemy engine (None when not connected)."""
+        return self.handler.engine
+    
+    @property
+    def current_database(self) -> Optional[str]:
+        """The database the wrapped handler is connected to."""
+        return self.handler.current_database
+    
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a blocking callable on the MySQL thread pool and await its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+    
+    async def test_connection(self) -> Tuple[bool, str]:
+        """Test connection to MySQL server without selecting a database."""
+        return await self.run(self.handler.test_connection)
+    
+    async def get_databases(self) -> List[str]:
+        """Get list of available databases."""
+        return await self.run(self.handler.get_databases)
+    
+    async def connect_to_database(self, database_name: str) -> bool:
+        """Connect to a specific database."""
+        return await self.run(self.handler.connect_to_database, database_name)
+    
+    async def get_tables(self, database_name: str = None) -> List[Dict[str, any]]:
+        """Get list of tables with metadata."""
+        return await self.run(self.handler.get_tables, database_name)
+    
+    async def get_table_schema(self, table_name: str, database_name: str = None) -> Dict[str, any]:
+        """Get detailed schema information for a table with column value context."""
+        return await self.run(self.handler.get_table_schema, table_name, database_name)
+    
+    async def get_table_change_markers(self, table_names: List[str], database_name: str = None) -> Dict[str, Any]:
+        """Get a change marker for each table (see MySQLHandler.get_table_change_markers)."""
+        return await self.run(self.handler.get_table_change_markers, table_names, database_name)
+    
+    async def execute_query(self, query: str, limit: int = 100) -> pd.DataFrame:
+        """Execute a SQL query and return results as pandas DataFrame."""
+        return await self.run(self.handler.execute_query, query, limit)
+    
+    async def get_table_preview(self, table_name: str, limit: int = 10) -> pd.DataFrame:
+        """Get a preview of table data."""
+        return await self.run(self.handler.get_table_preview, table_name, limit)
+    
+    async def get_row_count(self, table_name: str) -> int:
+        """Get the number of rows in a table."""
+        return await self.run(self.handler.get_row_count, table_name)
+    
+    async def get_table_page(self, table_name: str, limit: int, offset: int) -> pd.DataFrame:
+        """Get one page of table data."""
+        return await self.run(self.handler.get_table_page, table_name, limit, offset)
+    
+    async def get_multi_table_schema(self, table_names: List[str], database_name: str = None) -> Dict[str, any]:
+        """Get detailed schema information for multiple tables with relationship analysis."""
+        return await self.run(self.handler.get_multi_table_schema, table_names, database_name)
+    
+    async def close_connection(self):
+        """Close the database connection."""
+        await self.run(self.handler.close_connection)
@@ -1,25 +1,91 @@
+import os
 import json
 import pathlib
 from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 from .data_loading import load_schemas, load_questions
 from .question_processing import process_question
+from .question_templates import template_code
+from .agents import get_pandas_code_batch
 from .code_execution import execute_pandas_code
 
+# Questions processed concurrently; the LLM rate limiter keeps them within the provider quota
+PIPELINE_MAX_WORKERS = int(os.getenv('PIPELINE_MAX_WORKERS', '8'))
+# Questions on the same dataset generated in one LLM call (1 = one call per question)
+PIPELINE_BATCH_SIZE = int(os.getenv('PIPELINE_BATCH_SIZE', '1'))
 
-def run_pipeline(schema_path, qa_path, output_path, max_retries=1, dataset_folder_path="data/"):
-    """Run the complete pipeline with error checking and retrying."""
+
+def batch_questions(questions, batch_size):
+    """Group questions by dataset into batches of up to batch_size, as lists of indexes into questions."""
+    by_dataset = {}
+    for index, question in enumerate(questions):
+        by_dataset.setdefault(question['dataset'], []).append(index)
+    batches = []
+    for indexes in by_dataset.values():
+        for start in range(0, len(indexes), batch_size):
+            batches.append(indexes[start:start + batch_size])
+    return batches
+
+
+def process_batch(questions, schemas, dataset_folder_path, max_retries):
+    """
+    Generate code for questions on one dataset with a single LLM call, then check each
+    question's code as process_question does. Questions whose code is missing from the
+    response, or fails, fall back to single-question calls.
+    """
+    dataset = questions[0]['dataset']
+    try:
+        codes = get_pandas_code_batch(dataset, [q['question'] for q in questions], schemas[dataset])
+    except Exception:
+        codes = [None] * len(questions)
+    return [
+        process_question(question, schemas, dataset_folder_path, max_retries, initial_code=code)
+        for question, code in zip(questions, codes)
+    ]
+
+
+def run_pipeline(schema_path, qa_path, output_path, max_retries=1, dataset_folder_path="data/", batch_size=None):
+    """
+    Run the complete pipeline with error checking and retrying.
+
+    With batch_size (default PIPELINE_BATCH_SIZE) above 1, code for up to batch_size
+    questions on the same dataset is generated in one LLM call. Questions matching a
+    template are left out of the batches and start from the template's code.
+    """
     # Load input data
     schemas = load_schemas(schema_path)
     questions = load_questions(qa_path)
+    batch_size = batch_size or PIPELINE_BATCH_SIZE
 
     # Generate pandas code with error checking
     print("Generating pandas code with error checking...")
     results = []
 
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        for result in tqdm(executor.map(lambda q: process_question(q, schemas, dataset_folder_path, max_retries), questions), total=len(questions)):
-            results.append(result)
+    with ThreadPoolExecutor(max_workers=PIPELINE_MAX_WORKERS) as executor:
+        if batch_size > 1:
+            results = [None] * len(questions)
+            # Match templates first: their questions need no LLM call, so batching them would waste one
+            templates = list(executor.map(lambda q: template_code(q['question'], q['dataset'], dataset_folder_path), questions))
+            unmatched = [i for i, code in enumerate(templates) if code is None]
+            batches = [[i] for i, code in enumerate(templates) if code is not None] + [
+                [unmatched[i] for i in batch] for batch in batch_questions([questions[i] for i in unmatched], batch_size)
+            ]
+
+            def process_indexes(indexes):
+                code = templates[indexes[0]]
+                if code is not None:
+                    return [process_question(questions[indexes[0]], schemas, dataset_folder_path, max_retries,
+                                             initial_code=code, from_template=True)]
+                return process_batch([questions[i] for i in indexes], schemas, dataset_folder_path, max_retries)
+
+            with tqdm(total=len(questions)) as progress:
+                for indexes, batch_results in zip(batches, executor.map(process_indexes, batches)):
+                    for index, result in zip(indexes, batch_results):
+                        results[index] = result
+                    progress.update(len(indexes))
+        else:
+            for result in tqdm(executor.map(lambda q: process_question(q, schemas, dataset_folder_path, max_retries), questions), total=len(questions)):
+                results.append(result)
 
     # Save intermediate results
     intermediate_file = "intermediate_results/all_qa_pandas_code_not_executed.json"
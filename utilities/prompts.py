@@ -0,0 +1,108 @@
+"""
+Prompt Building
+Lays prompts out as a fixed instruction block, then the schema block, then the
+variable tail (question, earlier attempts), so prompts for the same model and
+dataset share a long common prefix that provider-side prompt caching can reuse.
+Prompts are kept within a token budget estimated locally.
+"""
+
+import os
+from typing import Dict, List, Optional, Sequence
+
+from dotenv import load_dotenv
+
+from .metrics import timed
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # Without tiktoken, estimate about four characters per token
+    _ENCODING = None
+
+# Load environment variables
+load_dotenv()
+
+# Largest prompt, in estimated tokens, sent to the LLM (0 = no limit)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "24000"))
+
+SCHEMA_TRUNCATED_NOTE = "\n... (schema truncated to fit the prompt)"
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in text."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens tokens, at a line boundary when possible."""
+    if max_tokens <= 0:
+        return ""
+    if _ENCODING is not None:
+        tokens = _ENCODING.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        cut = _ENCODING.decode(tokens[:max_tokens])
+    else:
+        if len(text) <= max_tokens * 4:
+            return text
+        cut = text[:max_tokens * 4]
+    return cut[:cut.rfind("\n")] if "\n" in cut else cut
+
+
+class PromptBuilder:
+    """
+    Build a prompt as instructions + schema + tail, within a token budget.
+
+    The instructions and schema must not depend on the question, so they form a
+    prefix shared by every question on the same dataset. Optional tail sections
+    (e.g. earlier failed attempts) are dropped first, oldest first, when the
+    prompt is over budget; after that the schema is truncated.
+    """
+
+    def __init__(self, instructions: str, schema: str = "", token_budget: Optional[int] = None):
+        self.instructions = instructions.strip()
+        self.schema = schema.strip()
+        self.token_budget = PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+        self._tail = []
+
+    def add(self, text: str, optional: bool = False) -> "PromptBuilder":
+        """Append a section to the variable tail; optional sections may be dropped to fit the budget."""
+        self._tail.append((text.strip(), optional))
+        return self
+
+    @staticmethod
+    def _join(sections: Sequence[str]) -> str:
+        return "\n\n".join(section for section in sections if section)
+
+    @timed('prompt_build')
+    def build(self) -> str:
+        """Return the prompt text."""
+        tail = list(self._tail)
+        prompt = self._join([self.instructions, self.schema] + [text for text, _ in tail])
+        if not self.token_budget or estimate_tokens(prompt) <= self.token_budget:
+            return prompt
+
+        # Drop optional sections, oldest first
+        while any(optional for _, optional in tail) and estimate_tokens(prompt) > self.token_budget:
+            index = next(i for i, (_, optional) in enumerate(tail) if optional)
+            del tail[index]
+            prompt = self._join([self.instructions, self.schema] + [text for text, _ in tail])
+        if estimate_tokens(prompt) <= self.token_budget:
+            return prompt
+
+        # Then truncate the schema to what is left of the budget
+        fixed = estimate_tokens(self._join([self.instructions] + [text for text, _ in tail] + [SCHEMA_TRUNCATED_NOTE]))
+        schema = _truncate_to_tokens(self.schema, self.token_budget - fixed - 2) + SCHEMA_TRUNCATED_NOTE
+        return self._join([self.instructions, schema] + [text for text, _ in tail])
+
+    def messages(self) -> List[Dict[str, str]]:
+        """
+        Return the prompt as chat messages.
+
+        Everything goes in one user message (reasoning models such as DeepSeek-R1
+        work best without a system prompt); caching only needs the common prefix.
+        """
+        return [{"role": "user", "content": self.build()}]
@@ -1,13 +1,111 @@
+import os
+import time
 import traceback
-from typing import Dict, Any
-from .agents import get_pandas_code
+from typing import Dict, Any, Optional, Tuple
+from .agents import get_pandas_code, model_tier, escalation_reason, record_tier_outcome
 from .error_handling import classify_error
 from .code_processing import clean_pandas_code, modify_dataset_paths
-from .code_execution import capture_exec_output
+from .code_execution import run_code
+from .code_repair import auto_repair, is_trusted_sample_error
+from .question_templates import template_code, learn_template
+from .data_preprocessing import ensure_dataset_sample
+from .metrics import increment, record_retries, track_timings, DEBUG_TIMINGS
 
+# Run generated code on the dataset sample before the full dataset
+SAMPLE_VALIDATION = os.getenv("SAMPLE_VALIDATION", "true").lower() == "true"
 
-def process_question(question_data: Dict[str, Any], schemas: Dict[str, Any], dataset_folder_path: str = "datasets/", max_retries: int = 1) -> Dict[str, Any]:
-    """Process a single question to generate pandas code with error checking and retrying."""
+
+def validate_on_sample(code: str, dataset_name: str, dataset_folder_path: str = "datasets/") -> Optional[Exception]:
+    """
+    Run cleaned generated code on the dataset's sample.
+
+    Returns the exception if the code fails there in a way the full dataset would too
+    (see is_trusted_sample_error), so the caller can go straight to a retry; returns
+    None if it succeeded, if the failure needs confirming on the full dataset, or if
+    the dataset has no sample.
+    """
+    if not SAMPLE_VALIDATION:
+        return None
+    try:
+        if ensure_dataset_sample(dataset_name, dataset_folder_path) is None:
+            return None
+    except Exception:
+        # Samples only speed up validation; without one the full run decides
+        return None
+
+    increment('sample_validations')
+    sample_code = modify_dataset_paths(code, dataset_folder_path=dataset_folder_path, is_sample=True)
+    _, error = run_code(sample_code)
+    if error is None:
+        return None
+
+    if not is_trusted_sample_error(error, dataset_name, dataset_folder_path):
+        return None
+    increment('sample_rejections')
+    return error
+
+
+def run_generated_code(code: str, dataset_name: str, dataset_folder_path: str = "datasets/") -> Tuple[str, Any, Optional[Exception]]:
+    """
+    Validate cleaned generated code on the dataset sample, then run it on the full dataset.
+
+    Returns:
+        Tuple: (code with dataset paths rewritten, result, exception or None)
+    """
+    modified_code = modify_dataset_paths(code, dataset_folder_path=dataset_folder_path)
+    sample_error = validate_on_sample(code, dataset_name, dataset_folder_path)
+    if sample_error is not None:
+        return modified_code, None, sample_error
+    result, error = run_code(modified_code)
+    return modified_code, result, error
+
+
+def execute_with_repair(code: str, dataset_name: str, dataset_folder_path: str = "datasets/") -> Tuple[str, str, Any]:
+    """
+    Run cleaned generated code as run_generated_code does, repairing trivial failures locally.
+
+    Returns:
+        Tuple: (code, which is the repaired code if a repair worked, the code with
+        dataset paths rewritten, and the result, or "Error :<message>" as
+        capture_exec_output reports failures)
+    """
+    modified_code, result, error = run_generated_code(code, dataset_name, dataset_folder_path)
+    if error is None:
+        return code, modified_code, result
+
+    repaired = auto_repair(code, error, dataset_name,
+                           lambda repaired_code: run_generated_code(repaired_code, dataset_name, dataset_folder_path)[1:],
+                           dataset_folder_path)
+    if repaired is None:
+        increment(f'execution_errors.{classify_error(error)}')
+        return code, modified_code, "Error :" + str(error)
+    code, result = repaired
+    return code, modify_dataset_paths(code, dataset_folder_path=dataset_folder_path), result
+
+
+def process_question(question_data: Dict[str, Any], schemas: Dict[str, Any], dataset_folder_path: str = "datasets/", max_retries: int = 1,
+                     initial_code: Optional[str] = None, from_template: bool = False) -> Dict[str, Any]:
+    """
+    Process a single question to generate pandas code with error checking and retrying.
+
+    Questions matching a template start from its code. initial_code, when given (e.g.
+    from a batched generation), is tried first instead of matching templates or
+    generating code for the question. Template code or initial_code that fails is
+    replaced by code generated for the question alone, with the usual prompt, before
+    any fix-up retry. from_template tells that initial_code is the question's template
+    code, already matched by the caller. With DEBUG_TIMINGS the result gets the
+    question's per-stage timings.
+    """
+    if not DEBUG_TIMINGS:
+        return _process_question(question_data, schemas, dataset_folder_path, max_retries, initial_code, from_template)
+    with track_timings() as timings:
+        result = _process_question(question_data, schemas, dataset_folder_path, max_retries, initial_code, from_template)
+    result['timings'] = timings.as_dict()
+    return result
+
+
+def _process_question(question_data: Dict[str, Any], schemas: Dict[str, Any], dataset_folder_path: str, max_retries: int,
+                      initial_code: Optional[str], from_template: bool) -> Dict[str, Any]:
     # initialize per-question error history
     question_data.setdefault("error_history", [])
 
@@ -22,30 +120,59 @@ def process_question(question_data: Dict[str, Any], schemas: Dict[str, Any], dat
 
         dataset_info = schemas[TABLE_NAME]
         error_code = None
-        pandas_code = get_pandas_code(DATASET, MAIN_QUESTION, dataset_info)
+        tier = model_tier(error_code)
+        # Simple questions matching a template start from its code instead of an LLM call
+        from_template = from_template and initial_code is not None
+        if initial_code is None:
+            initial_code = template_code(MAIN_QUESTION, DATASET, dataset_folder_path)
+            from_template = initial_code is not None
+        # Code not generated for this question alone (a template's, or a batched
+        # generation's) is not worth fixing: if it fails, start over with a clean prompt
+        regenerate_on_failure = initial_code is not None
+        if initial_code is not None:
+            pandas_code = initial_code
+        else:
+            pandas_code = get_pandas_code(DATASET, MAIN_QUESTION, dataset_info, tier=tier)
 
         # Save original code before path modification
         original_code = clean_pandas_code(pandas_code)
         
         # Test the code on full dataset
-        modified_code = modify_dataset_paths(pandas_code, dataset_folder_path=dataset_folder_path, is_sample=False)
-        modified_code = clean_pandas_code(modified_code)
+        modified_code = modify_dataset_paths(original_code, dataset_folder_path=dataset_folder_path, is_sample=False)
         retries = 0
 
         exec_output = ""
+        retry_start = None
 
         while retries <= max_retries:
             try:
-                # Try executing the code
-                exec_output = capture_exec_output(clean_pandas_code(modified_code))
+                # Validate on the dataset sample first (failures that the full dataset
+                # would repeat skip the full run), then execute, repairing trivial
+                # failures locally before spending an LLM retry
+                original_code, modified_code, exec_output = execute_with_repair(original_code, DATASET, dataset_folder_path)
                 if isinstance(exec_output, str) and 'Error' in exec_output:
                     raise Exception(exec_output)
+                # Empty answers from the fast model are retried on the reasoning model
+                reason = escalation_reason(tier, exec_output) if retries < max_retries else None
+                if reason is not None:
+                    raise Exception("Error :" + reason)
 
-                # successful execution
+                # successful execution (keeping the code a local repair produced)
+                if original_code != clean_pandas_code(pandas_code):
+                    pandas_code = original_code
+                if from_template:
+                    increment('fast_path.hits')
+                else:
+                    record_tier_outcome(tier, True)
+                    learn_template(MAIN_QUESTION, DATASET, original_code)
                 question_data["status"] = "success"
                 break  # If successful, break the loop
 
             except Exception as exec_error:
+                if from_template:
+                    increment('fast_path.failures')
+                else:
+                    record_tier_outcome(tier, False)
                 # classify the error
                 category = classify_error(exec_error)
                 tb = traceback.format_exc()
@@ -60,6 +187,15 @@ def process_question(question_data: Dict[str, Any], schemas: Dict[str, Any], dat
                     "code": modified_code
                 })
 
+                if regenerate_on_failure:
+                    # A template only guesses the question's intent, and batched code was
+                    # written alongside other questions: generate code for this one alone
+                    regenerate_on_failure = from_template = False
+                    pandas_code = get_pandas_code(DATASET, MAIN_QUESTION, dataset_info, tier=tier)
+                    original_code = clean_pandas_code(pandas_code)
+                    modified_code = modify_dataset_paths(original_code, dataset_folder_path=dataset_folder_path, is_sample=False)
+                    continue
+
                 # ------------ keep a concise record for the next LLM call ---------
                 # Use original code (without path modifications) for error reporting to LLM
                 previous_attempts.append(
@@ -69,29 +205,33 @@ def process_question(question_data: Dict[str, Any], schemas: Dict[str, Any], dat
                     break
 
                 # If there's an error and we have retries left, try to fix it
+                retry_start = retry_start or time.perf_counter()
                 if len(previous_attempts) == 1:
                     error_arg = previous_attempts[0]           # tuple, old behaviour
                 else:
                     error_arg = previous_attempts[:]           # list – new behaviour
 
+                tier = model_tier(error_arg)
                 pandas_code = get_pandas_code(
                     DATASET,
                     MAIN_QUESTION,
                     dataset_info,
-                    error_code=error_arg
+                    error_code=error_arg,
+                    tier=tier
                 )
                 
                 # Update original code with the new code from LLM
                 original_code = clean_pandas_code(pandas_code)
                 
                 modified_code = modify_dataset_paths(
-                    pandas_code,
+                    original_code,
                     dataset_folder_path=dataset_folder_path,
                     is_sample=False
                 )
-                modified_code = clean_pandas_code(modified_code)
                 retries += 1
 
+        record_retries(retries, retry_start)
+
         # if we never succeeded, mark as failed
         if question_data.get("status") != "success":
             question_data["status"] = "failed"
@@ -0,0 +1,404 @@
+"""
+Question Templates
+Recognizes simple questions ("how many rows ...", "what is the average X",
+"max X where Y = Z", ...) against a dataset's columns and values and writes their
+pandas code directly, so they are answered without an LLM call. Questions that do
+not match a template with every slot resolved are left to the LLM.
+
+Successful answers also teach new templates: the literals a question shares with
+its code ("How many Pokemon of type Fire?" / df['type'] == 'Fire') become slots, so
+"... of type Water?" is answered by substituting the literal into the same code.
+"""
+
+import ast
+import io
+import os
+import re
+import tokenize
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from .caching import LRUCache
+from .code_repair import dataset_columns, normalize_column_name
+from .dataset_catalog import get_catalog
+from .metrics import increment, get_counters
+
+# Load environment variables
+load_dotenv()
+
+# Answer questions that match a template without calling the LLM
+TEMPLATE_FAST_PATH = os.getenv("TEMPLATE_FAST_PATH", "true").lower() == "true"
+# Learn templates from successfully answered questions
+LEARNED_TEMPLATES = os.getenv("LEARNED_TEMPLATES", "true").lower() == "true"
+LEARNED_TEMPLATES_MAX_ENTRIES = int(os.getenv("LEARNED_TEMPLATES_MAX_ENTRIES", "512"))
+# Words a learned question template must keep besides its slots, so a slot never stands for most of a question
+LEARNED_TEMPLATE_MIN_WORDS = 3
+
+AGGREGATIONS = {
+    'average': 'mean', 'mean': 'mean', 'avg': 'mean',
+    'total': 'sum', 'sum': 'sum',
+    'maximum': 'max', 'max': 'max', 'highest': 'max', 'largest': 'max', 'biggest': 'max',
+    'minimum': 'min', 'min': 'min', 'lowest': 'min', 'smallest': 'min',
+    'median': 'median'
+}
+_AGGREGATION = "|".join(sorted(AGGREGATIONS, key=len, reverse=True))
+_ROWS = r"(?:rows|records|entries|observations|lines)"
+_EQUALS = r"(?:is equal to|is|equals|equal to|==|=)"
+_FILTER = rf"(?P<fcol>.+?) {_EQUALS} (?P<value>.+)"
+
+TEMPLATES = [
+    ('row_count', re.compile(
+        rf"^(?:how many {_ROWS}|what is the number of {_ROWS}|what's the number of {_ROWS})"
+        rf"(?: are there| does (?:the|this) dataset (?:have|contain)| are in (?:the|this) dataset| in (?:the|this) dataset| in total)?$"
+    )),
+    ('column_count', re.compile(
+        r"^how many columns(?: are there| does (?:the|this) dataset (?:have|contain)| are in (?:the|this) dataset| in (?:the|this) dataset)?$"
+    )),
+    ('filtered_count', re.compile(
+        rf"^how many(?: {_ROWS})?(?: are there)? (?:where|with|have|has) {_FILTER}$"
+    )),
+    ('unique_count', re.compile(
+        r"^how many (?:unique|distinct|different) (?P<col>.+?)(?: values)?(?: are there)?(?: in (?:the|this) dataset)?$"
+    )),
+    ('aggregate', re.compile(
+        rf"^(?:(?:what is|what's|whats|find|give me|compute|calculate|show)(?: me)? )?the (?P<agg>{_AGGREGATION})"
+        rf"(?: value)?(?: of)?(?: the)? (?P<col>.+?)(?: column)?(?: (?:where|for|when|with) {_FILTER})?$"
+    ))
+]
+
+
+class TemplateMatch:
+    """A question matched to a template, with its pandas code."""
+
+    def __init__(self, template: str, code: str):
+        self.template = template
+        self.code = code
+
+
+def _normalize_question(question: str) -> str:
+    return " ".join(question.strip().rstrip("?.!").split()).lower()
+
+
+def resolve_column(phrase: str, columns: List[str]) -> Optional[str]:
+    """Return the one column a phrase names (ignoring case, punctuation and a plural s), or None."""
+    phrase = re.sub(r"^(?:the|a|an) ", "", phrase.strip().strip("'\"`"))
+    wanted = {normalize_column_name(phrase)}
+    wanted |= {name[:-1] for name in wanted if name.endswith('s')} | {name + 's' for name in wanted}
+    matches = [column for column in columns if normalize_column_name(column) in wanted]
+    if len(matches) != 1:
+        exact = [column for column in matches if normalize_column_name(column) == normalize_column_name(phrase)]
+        return exact[0] if len(exact) == 1 else None
+    return matches[0]
+
+
+def resolve_value(text: str, values: pd.Series) -> Tuple[bool, Any]:
+    """
+    Return (True, value) for the one value of a column that text names, else (False, None).
+
+    Numbers are compared numerically; other values ignore case and surrounding quotes.
+    """
+    text = text.strip().strip("'\"`").strip()
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return False, None
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        try:
+            number = float(text)
+        except ValueError:
+            return False, None
+        number = int(number) if number.is_integer() and pd.api.types.is_integer_dtype(values.dtype) else number
+        return bool((values == number).any()), number
+    unique = pd.Series(values.dropna().unique())
+    matches = [value for value in unique if isinstance(value, str) and value.lower() == text.lower()]
+    if len(matches) > 1:
+        matches = [value for value in matches if value == text]
+    return (True, matches[0]) if len(matches) == 1 else (False, None)
+
+
+def match_question(question: str, dataset_name: str, dataset_folder_path: str = "datasets/") -> Optional[TemplateMatch]:
+    """
+    Match a question to a template and write its pandas code.
+
+    Returns None unless the question matches a template and every column and value it
+    names resolves to exactly one column or value of the dataset.
+    """
+    catalog = get_catalog(dataset_folder_path)
+    file_path, reader = catalog.resolve(dataset_name)
+    if file_path is None:
+        return None
+    text = _normalize_question(question)
+    columns = None
+
+    for template, pattern in TEMPLATES:
+        match = pattern.match(text)
+        if not match:
+            continue
+        if columns is None:
+            columns = dataset_columns(dataset_name, dataset_folder_path)
+        slots = match.groupdict()
+
+        frame = "df"
+        if slots.get('fcol'):
+            filter_column = resolve_column(slots['fcol'], columns)
+            if filter_column is None:
+                return None
+            found, value = resolve_value(slots['value'], catalog.load(file_path, [filter_column], copy=False)[filter_column])
+            if not found:
+                return None
+            frame = f"df[df[{filter_column!r}] == {value!r}]"
+
+        if template == 'row_count':
+            answer = "len(df)"
+        elif template == 'column_count':
+            answer = "len(df.columns)"
+        elif template == 'filtered_count':
+            answer = f"len({frame})"
+        else:
+            column = resolve_column(slots['col'], columns)
+            if column is None:
+                return None
+            if template == 'unique_count':
+                answer = f"df[{column!r}].nunique()"
+            else:
+                aggregation = AGGREGATIONS[slots['agg']]
+                if not pd.api.types.is_numeric_dtype(catalog.load(file_path, [column], copy=False)[column].dtype):
+                    return None
+                answer = f"{frame}[{column!r}].{aggregation}()"
+
+        code = f"import pandas as pd\ndf = pd.{reader}({file_path!r})\nprint({answer})"
+        return TemplateMatch(template, code)
+    return None
+
+
+def _code_literals(code: str) -> List[Tuple[int, int, str, Any]]:
+    """Return (start, end, token text, value) for the string and number literals of code, in order."""
+    line_starts = [0]
+    for line in code.splitlines(keepends=True):
+        line_starts.append(line_starts[-1] + len(line))
+    literals = []
+    for token in tokenize.generate_tokens(io.StringIO(code).readline):
+        if token.type not in (tokenize.STRING, tokenize.NUMBER):
+            continue
+        try:
+            value = ast.literal_eval(token.string)
+        except (ValueError, SyntaxError):
+            continue  # f-strings and the like
+        start = line_starts[token.start[0] - 1] + token.start[1]
+        end = line_starts[token.end[0] - 1] + token.end[1]
+        literals.append((start, end, token.string, value))
+    return literals
+
+
+def _compared_columns(code: str) -> Dict[str, Optional[str]]:
+    """
+    Map string literals compared with a column (df['col'] == 'x', df.col != 'x',
+    df['col'].isin(['x'])) to that column; None when compared with several columns.
+    """
+    columns = {}
+
+    def column_of(node) -> Optional[str]:
+        if isinstance(node, ast.Subscript) and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str):
+            return node.slice.value
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+            return node.attr
+        return None
+
+    def add(value, column):
+        if isinstance(value, str) and column is not None:
+            columns[value] = column if columns.get(value, column) == column else None
+
+    for node in ast.walk(ast.parse(code)):
+        if isinstance(node, ast.Compare) and all(isinstance(op, (ast.Eq, ast.NotEq)) for op in node.ops):
+            operands = [node.left] + node.comparators
+            for left, right in zip(operands, operands[1:]):
+                for column_node, value_node in ((left, right), (right, left)):
+                    if isinstance(value_node, ast.Constant):
+                        add(value_node.value, column_of(column_node))
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'isin' \
+                and node.args and isinstance(node.args[0], (ast.List, ast.Tuple, ast.Set)):
+            for element in node.args[0].elts:
+                if isinstance(element, ast.Constant):
+                    add(element.value, column_of(node.func.value))
+    return columns
+
+
+class LearnedTemplate:
+    """
+    A question pattern learned from an answered question, with its code split around the slots.
+
+    slots holds (kind, column, original value) per slot: 'value' slots are strings
+    compared with column, 'number' slots are numbers.
+    """
+
+    def __init__(self, pattern: str, slots: List[Tuple[str, Optional[str], Any]], code_parts: List[Union[str, int]]):
+        self.pattern = re.compile(pattern)
+        self.slots = slots
+        self.code_parts = code_parts
+
+    def fill(self, values: List[Any]) -> str:
+        return "".join(part if isinstance(part, str) else repr(values[part]) for part in self.code_parts)
+
+
+class LearnedTemplates:
+    """Question templates learned from successful answers, per dataset, in an LRU cache."""
+
+    def __init__(self, max_entries: int = LEARNED_TEMPLATES_MAX_ENTRIES):
+        self._templates = LRUCache(max_entries)
+
+    def learn(self, question: str, dataset_name: str, code: str) -> bool:
+        """
+        Learn a template from a question and the cleaned code that answered it.
+
+        A literal of the code becomes a slot when it appears exactly once in the
+        question, and, for strings, is compared with a single column (numbers must
+        also appear once in the code). Returns whether a template was stored.
+        """
+        if not LEARNED_TEMPLATES:
+            return False
+        text = _normalize_question(question)
+        try:
+            literals = _code_literals(code)
+            compared = _compared_columns(code)
+        except (SyntaxError, tokenize.TokenError, IndentationError):
+            return False
+        number_counts = {}
+        for _, _, token_text, value in literals:
+            if not isinstance(value, str):
+                number_counts[token_text] = number_counts.get(token_text, 0) + 1
+
+        # slot index per literal value, and where each slot is in the question
+        slot_of, slots, spans = {}, [], []
+        for _, _, token_text, value in literals:
+            if isinstance(value, bool) or value in slot_of:
+                continue
+            if isinstance(value, str):
+                if not value.strip() or not compared.get(value):
+                    continue
+                needle, kind, column = value.lower(), 'value', compared[value]
+            elif isinstance(value, (int, float)) and number_counts.get(token_text) == 1 and value >= 0:
+                needle, kind, column = token_text.lower(), 'number', None
+            else:
+                continue
+            found = list(re.finditer(rf"(?<![\w.]){re.escape(needle)}(?![\w]|\.\d)", text))
+            if len(found) != 1:
+                continue
+            slot_of[value] = len(slots)
+            slots.append((kind, column, value))
+            spans.append((found[0].start(), found[0].end(), slot_of[value]))
+
+        spans.sort()
+        if any(previous[1] > current[0] for previous, current in zip(spans, spans[1:])):
+            return False
+        pattern, fixed, position = "", "", 0
+        for start, end, slot in spans:
+            fixed += text[position:start] + " "
+            pattern += re.escape(text[position:start])
+            pattern += r"(.+?)" if slots[slot][0] == 'value' else r"(\d+(?:\.\d+)?)"
+            position = end
+        fixed += text[position:]
+        pattern += re.escape(text[position:])
+        if len(re.findall(r"\w+", fixed)) < LEARNED_TEMPLATE_MIN_WORDS:
+            return False
+
+        code_parts, position = [], 0
+        for start, end, _, value in literals:
+            if not isinstance(value, bool) and value in slot_of:
+                code_parts += [code[position:start], slot_of[value]]
+                position = end
+        code_parts.append(code[position:])
+
+        # Slots are captured in question order
+        order = [slot for _, _, slot in spans]
+        template = LearnedTemplate(
+            pattern,
+            [slots[slot] for slot in order],
+            [part if isinstance(part, str) else order.index(part) for part in code_parts]
+        )
+        self._templates.put((dataset_name, pattern), template)
+        increment('fast_path.learned')
+        return True
+
+    def match(self, question: str, dataset_name: str, dataset_folder_path: str = "datasets/") -> Optional[TemplateMatch]:
+        """Return the code of a learned template the question matches with every slot resolved, or None."""
+        if not LEARNED_TEMPLATES:
+            return None
+        text = _normalize_question(question)
+        catalog = get_catalog(dataset_folder_path)
+        file_path, _ = catalog.resolve(dataset_name)
+        if file_path is None:
+            return None
+        columns = None
+        for (dataset, _), template in reversed(self._templates.items()):
+            if dataset != dataset_name:
+                continue
+            match = template.pattern.fullmatch(text)
+            if not match:
+                continue
+            values = []
+            for (kind, column, original), captured in zip(template.slots, match.groups()):
+                if kind == 'number':
+                    value = float(captured)
+                    if isinstance(original, int):
+                        if not value.is_integer():
+                            break
+                        value = int(value)
+                else:
+                    if columns is None:
+                        columns = dataset_columns(dataset_name, dataset_folder_path)
+                    if column not in columns:
+                        break
+                    found, value = resolve_value(captured, catalog.load(file_path, [column], copy=False)[column])
+                    if not found:
+                        break
+                values.append(value)
+            else:
+                return TemplateMatch('learned', template.fill(values))
+        return None
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+
+learned_templates = LearnedTemplates()
+
+
+def learn_template(question: str, dataset_name: str, code: str) -> bool:
+    """Learn a question template from a successfully answered question (see LearnedTemplates.learn)."""
+    if not TEMPLATE_FAST_PATH:
+        return False
+    return learned_templates.learn(question, dataset_name, code)
+
+
+def template_code(question: str, dataset_name: str, dataset_folder_path: str = "datasets/") -> Optional[str]:
+    """Return pandas code for a question that matches a built-in or learned template, or None (counted for the hit rate)."""
+    if not TEMPLATE_FAST_PATH:
+        return None
+    increment('fast_path.questions')
+    try:
+        match = match_question(question, dataset_name, dataset_folder_path) \
+            or learned_templates.match(question, dataset_name, dataset_folder_path)
+    except Exception:
+        match = None
+    if match is None:
+        return None
+    increment('fast_path.matches')
+    increment(f'fast_path.template.{match.template}')
+    return match.code
+
+
+def fast_path_stats() -> Dict[str, Any]:
+    """Return how many questions were tried, matched and answered by templates."""
+    counters = get_counters()
+    questions = counters.get('fast_path.questions', 0)
+    hits = counters.get('fast_path.hits', 0)
+    return {
+        'questions': questions,
+        'matches': counters.get('fast_path.matches', 0),
+        'hits': hits,
+        'failures': counters.get('fast_path.failures', 0),
+        'hit_rate': hits / questions if questions else 0.0,
+        'learned_templates': len(learned_templates),
+        'templates': {name[len('fast_path.template.'):]: count for name, count in counters.items()
+                      if name.startswith('fast_path.template.')}
+    }
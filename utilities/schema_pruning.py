@@ -0,0 +1,248 @@
+"""
+Schema Pruning
+Ranks the columns and tables of a schema by their relevance to a question with BM25
+over column names and example values (computed locally, no embedding service), so
+prompts for wide tables only carry the columns the question is likely to need.
+
+Pruning trades against provider prompt caching, which needs the schema part of a
+prompt to be the same for every question (see PromptBuilder). Pandas prompts keep a
+question-independent schema and put the pruned column details in the prompt's tail
+(see split_schema). Multi-table SQL prompts prune the schema itself, as their schemas
+rarely fit a prompt whole and the questions seldom repeat on one set of tables.
+"""
+
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Columns sent for tables wider than this (0 = always send every column)
+SCHEMA_TOP_K = int(os.getenv("SCHEMA_TOP_K", "40"))
+# Tables sent for multi-table questions, before adding the tables connected to them by foreign keys
+SCHEMA_TOP_TABLES = int(os.getenv("SCHEMA_TOP_TABLES", "4"))
+
+# Column names count this many times more than example values
+NAME_WEIGHT = 3
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_COLUMN_LINE = re.compile(r"^\s*Column(?: Name)?: (?P<name>.*?), (?:Data type --|Type:)")
+_EXAMPLES = re.compile(r"Example(?:s| values): (?P<examples>.*?), (?:Total unique elements|Unique):")
+_MISSING_COLUMN_ERRORS = (
+    re.compile(r"^['\"].*['\"]$"),             # KeyError: 'column'
+    re.compile(r"not in index"),               # df[['a', 'b']] with a missing column
+    re.compile(r"None of \[Index"),
+    re.compile(r"object has no attribute"),    # df.column
+    re.compile(r"^Column\(s\) .* do not exist")
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens (camelCase and snake_case are split, plurals stemmed)."""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", str(text))
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        if len(token) > 4 and token.endswith("ies"):
+            token = token[:-3] + "y"
+        elif len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25:
+    """Okapi BM25 over a small, fixed set of tokenized documents."""
+
+    def __init__(self, documents: Sequence[Sequence[str]], k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(document) for document in documents]
+        self.lengths = [len(document) for document in documents]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    def scores(self, query: Iterable[str]) -> List[float]:
+        """Return the score of every document for the query tokens."""
+        query = set(query)
+        result = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.average_length) if self.average_length else self.k1
+            for term in query:
+                frequency = counts.get(term)
+                if frequency:
+                    score += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            result.append(score)
+        return result
+
+
+def expand_query(query: Iterable[str], vocabulary: Iterable[str]) -> List[str]:
+    """
+    Add the vocabulary terms that share a stem-like prefix with a query token, so
+    "language" matches a "lang" column and "favorited" matches "favorites".
+    """
+    query = list(query)
+    expanded = list(query)
+    for term in vocabulary:
+        if term in query or len(term) < 3:
+            continue
+        for token in query:
+            shorter, longer = sorted((token, term), key=len)
+            if len(shorter) >= 3 and (longer.startswith(shorter) if len(shorter) < 5 else longer[:5] == shorter[:5]):
+                expanded.append(term)
+                break
+    return expanded
+
+
+def _column_document(name: str, examples: str = "") -> List[str]:
+    return tokenize(name) * NAME_WEIGHT + tokenize(examples)
+
+
+def rank_columns(question: str, columns: Sequence[Tuple[str, str]]) -> List[int]:
+    """
+    Rank columns by relevance to a question.
+
+    Parameters:
+    question (str): The question.
+    columns: (name, example values text) for each column.
+
+    Returns:
+    list: Column indexes, most relevant first (ties keep the schema order).
+    """
+    bm25 = BM25([_column_document(name, examples) for name, examples in columns])
+    scores = bm25.scores(expand_query(tokenize(question), bm25.idf))
+    question_text = " ".join(tokenize(question))
+    for i, (name, _) in enumerate(columns):
+        # A column named in full (e.g. "unit price") is relevant whatever its words' idf
+        name_text = " ".join(tokenize(name))
+        if name_text and re.search(rf"\b{re.escape(name_text)}\b", question_text):
+            scores[i] += 10.0
+    return sorted(range(len(columns)), key=lambda i: (-scores[i], i))
+
+
+def is_missing_column_error(message: str) -> bool:
+    """Check whether an error message from running generated code is about a column missing from the frame."""
+    message = str(message).strip()
+    return any(pattern.search(message) for pattern in _MISSING_COLUMN_ERRORS)
+
+
+def widened_top_k(error_messages: Iterable[str], top_k: int = SCHEMA_TOP_K) -> int:
+    """Double top_k for every earlier attempt that failed on a missing column."""
+    widenings = sum(1 for message in error_messages if is_missing_column_error(message))
+    return top_k * 2 ** widenings if top_k else 0
+
+
+def split_schema(schema: str, question: str, top_k: Optional[int] = None) -> Tuple[str, str]:
+    """
+    Split a schema text into a question-independent part and the details relevant to the question.
+
+    The schema is the "Column Name: ..., Data type -- ..., -- Example values: ..."
+    text built for pandas prompts. Schemas with at most top_k columns (or with no
+    recognizable column lines) are returned whole, with no details, so their prompts
+    share the schema prefix. For wider tables the first part keeps the other lines
+    and only the names of all columns, which is still the same for every question,
+    and the details are the lines of the top_k columns most relevant to the question,
+    in schema order, to go after the question-independent part of the prompt.
+
+    Returns:
+    Tuple: (schema for the prompt prefix, column details for the prompt tail or "")
+    """
+    top_k = SCHEMA_TOP_K if top_k is None else top_k
+    lines = schema.split("\n")
+    column_lines = [i for i, line in enumerate(lines) if _COLUMN_LINE.match(line)]
+    if not top_k or len(column_lines) <= top_k:
+        return schema, ""
+
+    columns = []
+    for i in column_lines:
+        examples = _EXAMPLES.search(lines[i])
+        columns.append((_COLUMN_LINE.match(lines[i]).group("name"), examples.group("examples") if examples else ""))
+    keep = sorted(column_lines[i] for i in rank_columns(question, columns)[:top_k])
+    is_column = set(column_lines)
+    names = f"Columns: {', '.join(name for name, _ in columns)}"
+    stable = []
+    for i, line in enumerate(lines):
+        if i == column_lines[0]:
+            # All column names, where the column lines were
+            stable.append(names)
+        if i not in is_column:
+            stable.append(line)
+    details = [lines[i] for i in keep]
+    details.append(f"({len(column_lines) - top_k} less relevant columns are not detailed)")
+    return "\n".join(stable), "\n".join(details)
+
+
+def prune_multi_table_schema(
+    question: str,
+    table_names: List[str],
+    multi_table_schema: Dict[str, Any],
+    top_tables: Optional[int] = None,
+    top_k: Optional[int] = None
+) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Keep the tables and columns of a multi-table schema that are relevant to a question.
+
+    The top_tables tables ranked by BM25 (over table and column names and example
+    values) are kept, together with every table connected to them by a foreign key
+    so the joins stay possible. Within each kept table, the top_k columns are kept
+    plus its primary and foreign key columns.
+
+    Returns:
+    Tuple: (kept table names in their original order, pruned schema in the same shape)
+    """
+    top_tables = SCHEMA_TOP_TABLES if top_tables is None else top_tables
+    top_k = SCHEMA_TOP_K if top_k is None else top_k
+    tables_info = multi_table_schema.get('tables', {})
+    relationships = multi_table_schema.get('relationships', [])
+    query = tokenize(question)
+
+    kept_tables = list(table_names)
+    if top_tables and len(table_names) > top_tables:
+        documents = []
+        for table_name in table_names:
+            document = tokenize(table_name) * NAME_WEIGHT
+            for col in tables_info.get(table_name, {}).get('columns', []):
+                document += _column_document(col['name'], " ".join(col.get('example_values', [])))
+            documents.append(document)
+        bm25 = BM25(documents)
+        scores = bm25.scores(expand_query(query, bm25.idf))
+        ranked = sorted(range(len(table_names)), key=lambda i: (-scores[i], i))
+        relevant = {table_names[i] for i in ranked[:top_tables]}
+        connected = set(relevant)
+        for rel in relationships:
+            if rel['from_table'] in relevant or rel['to_table'] in relevant:
+                connected.update((rel['from_table'], rel['to_table']))
+        kept_tables = [table_name for table_name in table_names if table_name in connected]
+
+    key_columns = {}
+    for rel in relationships:
+        key_columns.setdefault(rel['from_table'], set()).update(rel['from_columns'])
+        key_columns.setdefault(rel['to_table'], set()).update(rel['to_columns'])
+
+    pruned_tables = {}
+    for table_name in kept_tables:
+        if table_name not in tables_info:
+            continue
+        table_schema = dict(tables_info[table_name])
+        columns = table_schema.get('columns', [])
+        if top_k and len(columns) > top_k:
+            ranked = rank_columns(question, [(col['name'], " ".join(col.get('example_values', []))) for col in columns])
+            keep = set(ranked[:top_k])
+            keep.update(i for i, col in enumerate(columns)
+                        if col.get('primary_key') or col['name'] in key_columns.get(table_name, ()))
+            table_schema['columns'] = [col for i, col in enumerate(columns) if i in keep]
+        pruned_tables[table_name] = table_schema
+
+    pruned_schema = dict(multi_table_schema)
+    pruned_schema['tables'] = pruned_tables
+    pruned_schema['relationships'] = [rel for rel in relationships
+                                      if rel['from_table'] in pruned_tables and rel['to_table'] in pruned_tables]
+    return kept_tables, pruned_schema
@@ -7,13 +7,16 @@ import openai
 import os
 from dotenv import load_dotenv
 from utilities.utils import get_text_after_last_think_tag
+from utilities.llm import create_chat_completion
+from utilities.prompts import PromptBuilder
+from utilities.schema_pruning import prune_multi_table_schema
 from typing import Union, Tuple, List
 
 # Load environment variables
 load_dotenv()
 
 # Initialize OpenAI clients
-main_args = {"api_key": os.getenv("API_KEY")}
+main_args = {"api_key": os.getenv("API_KEY"), "max_retries": 0}  # retried in utilities.llm
 if os.getenv("API_BASE_URL"):
     main_args["base_url"] = os.getenv("API_BASE_URL")
     
@@ -25,7 +28,8 @@ def generate_sql_query(
     database_name: str,
     table_name: str,
     table_schema: dict,
-    temperature: float = 0
+    temperature: float = 0,
+    dialect: str = "MySQL"
 ) -> str:
     """
     Generate a SQL query to answer a natural language question about a MySQL table.
@@ -36,6 +40,7 @@ def generate_sql_query(
     table_name (str): Name of the table
     table_schema (dict): Schema information including columns
     temperature (float): Temperature for LLM generation
+    dialect (str): SQL dialect to generate, "MySQL" or "DuckDB" (for dataset files)
     
     Returns:
     str: Generated SQL query
@@ -74,14 +79,20 @@ def generate_sql_query(
                 f"-- Example values: {example_values_str}, Total unique elements: {total_unique}")
         schema_context += line + "\n"
     
+    # MySQL quotes identifiers with backticks, DuckDB with double quotes
+    quote = '`' if dialect == "MySQL" else '"'
+    quoting_rule = ("Use backticks around table/column names if they contain special characters or spaces"
+                    if dialect == "MySQL" else
+                    "Always wrap the table name and column names in double quotes")
+    
     # Create the prompt
-    instructions = """
-Generate a MySQL SQL query to answer the given question. Follow these rules:
+    instructions = f"""
+Generate a {dialect} SQL query to answer the given question. Follow these rules:
 
 1. Use only SELECT statements (no INSERT, UPDATE, DELETE, etc.)
-2. Use proper MySQL syntax
+2. Use proper {dialect} syntax
 3. Include LIMIT clause (max 100 rows unless specifically asked for more)
-4. Use backticks around table/column names if they contain special characters or spaces
+4. {quoting_rule}
 5. Handle NULL values appropriately
 6. Use proper aggregation functions when needed (COUNT, SUM, AVG, etc.)
 7. Use proper WHERE clauses for filtering
@@ -90,27 +101,21 @@ Generate a MySQL SQL query to answer the given question. Follow these rules:
 10. Do not include ```sql``` markdown formatting
 
 Example formats:
-- For counting: SELECT COUNT(*) FROM `table_name` WHERE condition;
-- For listing: SELECT column1, column2 FROM `table_name` WHERE condition LIMIT 10;
-- For aggregation: SELECT column, COUNT(*) FROM `table_name` GROUP BY column ORDER BY COUNT(*) DESC LIMIT 10;
+- For counting: SELECT COUNT(*) FROM {quote}table_name{quote} WHERE condition;
+- For listing: SELECT column1, column2 FROM {quote}table_name{quote} WHERE condition LIMIT 10;
+- For aggregation: SELECT column, COUNT(*) FROM {quote}table_name{quote} GROUP BY column ORDER BY COUNT(*) DESC LIMIT 10;
 """
     
-    user_prompt = f"""
-Given this MySQL table schema:
-{schema_context}
-
-Generate a SQL query to answer this question: {question}
-
-{instructions}
-
-SQL Query:"""
+    # Instructions, then schema, then question: prompts on the same table share a cacheable prefix
+    prompt = PromptBuilder(instructions, f"Given this {dialect} table schema:\n{schema_context}")
+    prompt.add(f"Generate a SQL query to answer this question: {question}\n\nSQL Query:")
     
     # Choose proper parameter name based on model name
     token_param_name = "max_completion_tokens" if MAIN_LLM.startswith("o") else "max_tokens"
     
     completion_args = {
         "model": MAIN_LLM,
-        "messages": [{"role": "user", "content": user_prompt}],
+        "messages": prompt.messages(),
         token_param_name: 2000,
     }
     
@@ -122,7 +127,7 @@ SQL Query:"""
         completion_args["reasoning_effort"] = "medium"
     
     try:
-        chat_completion = MAIN_LLM_PROVIDER.chat.completions.create(**completion_args)
+        chat_completion = create_chat_completion(MAIN_LLM_PROVIDER, **completion_args)
         sql_query = get_text_after_last_think_tag(chat_completion.choices[0].message.content)
         
         # Clean up the query
@@ -141,8 +146,8 @@ SQL Query:"""
         return sql_query
         
     except Exception as e:
-        # Fallback simple query
-        return f"SELECT * FROM `{table_name}` LIMIT 10;"
+        # No stand-in query: callers report the failure (or fall back to pandas code)
+        raise Exception(f"SQL generation failed: {str(e)}")
 
 def generate_multi_table_sql_query(
     question: str,
@@ -165,6 +170,9 @@ def generate_multi_table_sql_query(
     str: Generated SQL query
     """
     
+    # Keep the tables (plus their foreign-key neighbours) and columns relevant to the question
+    table_names, multi_table_schema = prune_multi_table_schema(question, table_names, multi_table_schema)
+    
     # Build comprehensive multi-table schema context
     schema_context = f"Here are the tables and columns for the {database_name} database:\n"
     schema_context += f"Database: {database_name}, Tables: {', '.join(table_names)}\n\n"
@@ -244,22 +252,16 @@ Multi-table query patterns:
 - For aggregation: SELECT t1.category, COUNT(t2.id) FROM `table1` t1 LEFT JOIN `table2` t2 ON t1.id = t2.table1_id GROUP BY t1.category;
 """
     
-    user_prompt = f"""
-Given this MySQL database schema with multiple tables:
-{schema_context}
-
-Generate a SQL query to answer this question: {question}
-
-{instructions}
-
-SQL Query:"""
+    # Instructions, then schema, then question: prompts on the same tables share a cacheable prefix
+    prompt = PromptBuilder(instructions, f"Given this MySQL database schema with multiple tables:\n{schema_context}")
+    prompt.add(f"Generate a SQL query to answer this question: {question}\n\nSQL Query:")
     
     # Choose proper parameter name based on model name
     token_param_name = "max_completion_tokens" if MAIN_LLM.startswith("o") else "max_tokens"
     
     completion_args = {
         "model": MAIN_LLM,
-        "messages": [{"role": "user", "content": user_prompt}],
+        "messages": prompt.messages(),
         token_param_name: 2000,
     }
     
@@ -271,7 +273,7 @@ SQL Query:"""
         completion_args["reasoning_effort"] = "medium"
     
     try:
-        chat_completion = MAIN_LLM_PROVIDER.chat.completions.create(**completion_args)
+        chat_completion = create_chat_completion(MAIN_LLM_PROVIDER, **completion_args)
         sql_query = get_text_after_last_think_tag(chat_completion.choices[0].message.content)
         
         # Clean up the query
@@ -290,6 +292,5 @@ SQL Query:"""
         return sql_query
         
     except Exception as e:
-        # Fallback simple query for first table
-        first_table = table_names[0] if table_names else "unknown"
-        return f"SELECT * FROM `{first_table}` LIMIT 10;" 
\ No newline at end of file
+        # No stand-in query: callers report the failure
+        raise Exception(f"SQL generation failed: {str(e)}") 
\ No newline at end of file